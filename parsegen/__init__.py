@@ -24,4 +24,6 @@ import parsegen.version as _version
 
 __version__ = _version.VERSION
 
-__all__ = [ 'data', 'errors', 'grammar', 'output', 'parse', 'version' ]
\ No newline at end of file
+__all__ = [ 'batch', 'cache', 'cli', 'client', 'data', 'depend', 'errors',
+            'grammar', 'optimise', 'output', 'parse', 'runtime', 'server',
+            'stats', 'table', 'version' ]
\ No newline at end of file
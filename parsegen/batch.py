@@ -0,0 +1,248 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import shlex
+import sys
+
+from parsegen.errors import ParsegenError
+from parsegen.utils import Struct
+import parsegen.cache
+import parsegen.depend
+import parsegen.options
+import parsegen.output
+import parsegen.parse
+
+def job(grammar, output=None, language=None, options=None, cache=True,
+		depfile=None, check=False, optimize=None):
+	"""Job
+	
+	Returns a `Struct` describing one parser to generate. If `output` is a
+	directory, or not given, the parser is written to a file named after the
+	grammar with the extension of the language's formatter. A `depfile`
+	names the file to write the parser's dependencies to, and `check` skips
+	the job if the parser is up to date. `optimize` is passed on to
+	`parse_buffer`.
+	"""
+	
+	return Struct(grammar=grammar, output=output, language=language,
+				  options=options or {}, cache=cache, depfile=depfile,
+				  check=check, optimize=optimize)
+
+def jobs_from_args(args):
+	"""Jobs from Args
+	
+	Returns the jobs for parsed command line arguments in batch mode: one for
+	each grammar given followed by those in each manifest. Option overrides,
+	`--check` and `-O` given on the command line apply to every job. Each
+	job needs its own depfile, so these can only be given in a manifest.
+	Conflict reports are only written for a single grammar.
+	"""
+	
+	if args.conflicts:
+		raise ParsegenError("argument error", "--conflicts can't be used " \
+							"in batch mode")
+	if args.depfile:
+		raise ParsegenError("argument error", "--depfile can't be used " \
+							"in batch mode, give one for each job in a " \
+							"manifest instead")
+	
+	jobs = [
+		job(g, args.output, args.language, dict(args.options), args.cache,
+			check=args.check, optimize=args.optimize)
+		for g in args.grammars
+	]
+	for manifest in args.manifests:
+		for j in read_manifest(manifest, args.cache):
+			j.options = dict(args.options, **j.options)
+			j.check = j.check or args.check
+			j.optimize = j.optimize or args.optimize
+			jobs.append(j)
+	return jobs
+
+def read_manifest(path, cache=True):
+	"""Read Manifest
+	
+	Reads the jobs from a manifest file. Each line holds the command line
+	arguments for one grammar, for example:
+	
+	    -l c -o parsers/expr.c grammars/expr.grammar prefix=expr_
+	
+	Blank lines and lines starting with `#` are ignored. Relative paths are
+	taken relative to the directory holding the manifest.
+	"""
+	
+	base = os.path.dirname(path)
+	jobs = []
+	
+	with open(path) as f:
+		for number, line in enumerate(f, 1):
+			line = line.strip()
+			if not line or line.startswith("#"):
+				continue
+			
+			try:
+				args = parsegen.options.parser().parse_args(shlex.split(line))
+			except (SystemExit, ValueError):
+				raise ParsegenError("manifest error", "{0}:{1}: invalid " \
+									"arguments {2}".format(path, number, line))
+			if not args.file:
+				raise ParsegenError("manifest error", "{0}:{1}: no input " \
+									"file".format(path, number))
+			if args.conflicts:
+				raise ParsegenError("manifest error", "{0}:{1}: --conflicts " \
+									"can't be used in a manifest".format(
+										path, number))
+			
+			output = args.output and os.path.join(base, args.output)
+			depfile = args.depfile and os.path.join(base, args.depfile)
+			jobs.append(job(os.path.join(base, args.file), output,
+							args.language, parsegen.options.options_dict(
+								args.options), cache and args.cache,
+							depfile, args.check, args.optimize or None))
+	
+	return jobs
+
+def output_path(job, grammar=None):
+	"""Output Path
+	
+	Returns the path that a job's parser should be written to. The grammar
+	is only needed to find the language if the job doesn't name one.
+	"""
+	
+	if job.output and not os.path.isdir(job.output):
+		return job.output
+	
+	return _named_path(job, job.language, grammar)
+
+def output_paths(job, grammar=None):
+	"""Output Paths
+	
+	Returns a list of pairs of language and the path that the job's parser in
+	that language should be written to. A job can name several languages
+	separated by commas, in which case its output, if given, must be a
+	directory and each language must write a file with its own extension.
+	"""
+	
+	languages = parsegen.output.split_languages(job.language)
+	if len(languages) == 1:
+		return [(job.language, output_path(job, grammar))]
+	
+	if job.output and not os.path.isdir(job.output):
+		raise ParsegenError("argument error", "{0} must be a directory to " \
+							"write several languages".format(job.output))
+	
+	targets = []
+	for language in languages:
+		path = _named_path(job, language, grammar)
+		for other, taken in targets:
+			if taken == path:
+				raise ParsegenError("argument error", "{0} and {1} would " \
+									"both write {2}".format(other, language,
+															path))
+		targets.append((language, path))
+	return targets
+
+def _named_path(job, language, grammar=None):
+	formatter = parsegen.output.find_formatter(grammar, language)
+	name = os.path.splitext(os.path.basename(job.grammar))[0]
+	name = "{0}.{1}".format(name, formatter.extension)
+	return os.path.join(job.output or os.path.dirname(job.grammar), name)
+
+def run_job(job):
+	"""Run Job
+	
+	Reads, analyses and writes out a single grammar, once for each language
+	the job names. An output file that already holds the same parser is left
+	alone. Returns None on success or a string describing the error. Runs in
+	a worker process.
+	
+	A job to `check` is skipped without reading the grammar if its parsers
+	are up to date. This needs the names of the parsers to be known up
+	front, so either the output file or the language must be given.
+	"""
+	
+	command = parsegen.depend.command(job.grammar, job.language, job.options,
+									  job.depfile, job.optimize)
+	output_known = job.language or \
+		(job.output and not os.path.isdir(job.output))
+	
+	try:
+		if job.check and output_known:
+			if all(parsegen.depend.check(path, command) is not None
+				   for _, path in output_paths(job)):
+				return None
+		
+		with open(job.grammar, "rb") as f:
+			text = parsegen.parse.read_file(f)
+		if job.cache:
+			grammar = parsegen.cache.GrammarCache().parse_buffer(
+				text, job.optimize)
+		else:
+			grammar = parsegen.parse.parse_buffer(text, job.optimize)
+		
+		targets = output_paths(job, grammar)
+		paths = [path for _, path in targets]
+		if job.depfile or job.check:
+			inputs = parsegen.depend.inputs(job.grammar, grammar,
+											job.language, job.options)
+		
+		parsegen.output.write_grammar_files(grammar, targets, job.options)
+		if job.depfile:
+			parsegen.depend.write_depfile(job.depfile, paths, inputs)
+		if job.check:
+			for path in paths:
+				parsegen.depend.record(path, command, inputs)
+	except ParsegenError as e:
+		return str(e)
+	except OSError as e:
+		return str(ParsegenError("io error", "{0}: {1}".format(
+			e.filename or job.grammar, e.strerror)))
+	except Exception as e:
+		return "parsegen: {0}: {1}".format(type(e).__name__, e)
+	
+	return None
+
+def run(jobs, workers=None, errors=None):
+	"""Run
+	
+	Runs the jobs across a pool of `workers` processes, one per processor by
+	default. Each failed job is reported to `errors`, standard error by
+	default, and the others carry on. Returns the number of jobs that failed.
+	"""
+	
+	errors = errors or sys.stderr
+	workers = min(workers or os.cpu_count() or 1, len(jobs))
+	if workers > 1:
+		# Only pay for starting up multiprocessing when it is needed
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			results = list(pool.map(run_job, jobs))
+	else:
+		results = [run_job(j) for j in jobs]
+	
+	failed = 0
+	for j, error in zip(jobs, results):
+		if error:
+			failed += 1
+			errors.write("{0}: {1}\n".format(j.grammar, error))
+	return failed
@@ -0,0 +1,313 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import collections
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+from parsegen.data import Header, Symbol, TerminalTable, UserCode
+from parsegen.grammar import Grammar
+from parsegen.utils import Struct
+from parsegen import stats
+from parsegen.version import VERSION
+import parsegen.parse
+
+# Default bound on the total size of the files in the cache
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+
+def default_directory():
+	"""Default Directory
+	
+	Returns the cache directory named by `PARSEGEN_CACHE_DIR`, or a
+	`parsegen` directory in the user's cache directory.
+	"""
+	
+	directory = os.environ.get("PARSEGEN_CACHE_DIR")
+	if directory:
+		return directory
+	
+	base = os.environ.get("XDG_CACHE_HOME") or \
+		os.path.join(os.path.expanduser("~"), ".cache")
+	return os.path.join(base, "parsegen")
+
+def dumps(grammar):
+	"""Dumps
+	
+	Serialises an analysed grammar to bytes. Only builtin types are used so
+	that the result can be written with `marshal`, which loads far faster
+	than the equivalent pickle.
+	
+	User code kept as a `UserCode` range of the grammar file is stored as
+	that range rather than as text. Entries are keyed by a hash of the whole
+	file, so `loads` can take the user code from the same file again.
+	"""
+	
+	header = grammar.header
+	symbols = []
+	for symbol in grammar.expansions.values():
+		symbols.append((
+			symbol.name, symbol.nullable, symbol.first_bits, symbol.follow_bits,
+			list(symbol.prefix),
+			[(list(e.tokens), e.first_bits, e.nullable_from, e.predict_bits,
+			  e.action, list(e.wrappers))
+			 for e in symbol.expansions]))
+	
+	report = grammar.optimisation
+	if report is not None:
+		report = (vars(report.before), vars(report.after), report.unreachable,
+				  report.collapsed, report.factored)
+	
+	user_code = grammar.user_code
+	if isinstance(user_code, UserCode):
+		user_code = (user_code.start, user_code.end, user_code.encoding)
+	
+	return marshal.dumps((
+		header.terminals, header.options, header.terminal_table.names,
+		user_code, grammar.iterations, symbols, report))
+
+def loads(data, text=None):
+	"""Loads
+	
+	Rebuilds a grammar from the output of `dumps` without analysing it
+	again. `text` is the grammar file the entry was made from, which holds
+	the user code if it was stored as a range.
+	"""
+	
+	terms, opts, names, user_code, iterations, symbols, report = \
+		marshal.loads(data)
+	if isinstance(user_code, tuple):
+		if text is None:
+			raise ValueError("the grammar text is needed for its user code")
+		if isinstance(text, str):
+			text = text.encode("utf-8")
+		user_code = UserCode(text, *user_code)
+	
+	header = Header(terms, opts)
+	header.terminal_table = TerminalTable(names)
+	
+	expansions = {}
+	for name, nullable, first, follow, prefix, exps in symbols:
+		symbol = expansions[name] = Symbol(name)
+		symbol.prefix = tuple(prefix)
+		for tokens, _, _, _, action, wrappers in exps:
+			symbol.add_expansion(tokens)
+			symbol.expansions[-1].action = action
+			symbol.expansions[-1].wrappers = tuple(wrappers)
+	
+	grammar = Grammar(header, expansions, user_code, analyse=False)
+	grammar.iterations = iterations
+	if report is not None:
+		before, after, unreachable, collapsed, factored = report
+		grammar.optimisation = Struct(
+			before=Struct(before), after=Struct(after),
+			unreachable=unreachable, collapsed=collapsed, factored=factored)
+	
+	for name, nullable, first, follow, _, exps in symbols:
+		symbol = expansions[name]
+		symbol.nullable = nullable
+		symbol.first_bits = first
+		symbol.follow_bits = follow
+		for expansion, (_, first, nullable_from, predict, _, _) in \
+				zip(symbol.expansions, exps):
+			expansion.first_bits = first
+			expansion.nullable_from = nullable_from
+			expansion.predict_bits = predict
+	
+	return grammar
+
+class GrammarCache(object):
+	"""Grammar Cache
+	
+	An on-disk cache of analysed grammars. Entries are keyed by a hash of the
+	grammar text, the Parsegen version and the Python version, so a grammar
+	is only analysed again when one of these changes.
+	
+	The total size of the cache is kept below `max_size` bytes by removing
+	the least recently used entries whenever a new one is stored.
+	"""
+	
+	def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+		self.directory = directory or default_directory()
+		self.max_size = max_size
+	
+	def key(self, text, optimize=None):
+		"""Key
+		
+		Returns the cache key for the text of a grammar file, parsed with
+		`optimize` as given to `parse_buffer`.
+		"""
+		
+		if isinstance(text, str):
+			text = text.encode("utf-8")
+		
+		h = hashlib.sha256()
+		h.update("parsegen {0} python {1}.{2} marshal {3}\0".format(
+			VERSION, sys.version_info[0], sys.version_info[1],
+			marshal.version).encode("utf-8"))
+		if optimize is not None:
+			h.update("optimize {0}\0".format(bool(optimize)).encode("utf-8"))
+		h.update(text)
+		return h.hexdigest()
+	
+	def _path(self, key):
+		return os.path.join(self.directory, key + ".grammar")
+	
+	def load(self, text, optimize=None):
+		"""Load
+		
+		Returns the cached grammar for `text`, or None if it is not in the
+		cache. Loading an entry marks it as recently used.
+		"""
+		
+		data = self._read(self.key(text, optimize))
+		if data is None:
+			return None
+		try:
+			return loads(data, text)
+		except (EOFError, ValueError, TypeError):
+			return None
+	
+	def _read(self, key):
+		path = self._path(key)
+		try:
+			with open(path, "rb") as f:
+				data = f.read()
+			os.utime(path)
+			return data
+		except OSError:
+			return None
+	
+	def store(self, text, grammar, optimize=None):
+		"""Store
+		
+		Adds an analysed grammar to the cache. The entry is written to a
+		temporary file and renamed into place so that readers never see a
+		partial entry. Failures to write are ignored; the cache is only an
+		optimisation. An entry bigger than the whole cache would be evicted
+		straight away, so it isn't written at all.
+		"""
+		
+		data = dumps(grammar)
+		if len(data) <= self.max_size:
+			self._write(self.key(text, optimize), data)
+	
+	def _write(self, key, data):
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+			with os.fdopen(fd, "wb") as f:
+				f.write(data)
+			os.replace(temp, self._path(key))
+			self._evict()
+		except OSError:
+			pass
+	
+	def _evict(self):
+		"""Evict
+		
+		Removes the least recently used entries until the cache fits in
+		`max_size`.
+		"""
+		
+		entries = []
+		for name in os.listdir(self.directory):
+			if not name.endswith(".grammar"):
+				continue
+			path = os.path.join(self.directory, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue
+			entries.append((stat.st_mtime, stat.st_size, path))
+		
+		total = sum(size for _, size, _ in entries)
+		for _, size, path in sorted(entries):
+			if total <= self.max_size:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+			total -= size
+	
+	def parse_buffer(self, text, optimize=None):
+		"""Parse Buffer
+		
+		Returns the cached grammar for `text`, parsing and analysing it and
+		adding it to the cache if it is not there already. Optimised grammars
+		are cached after they have been optimised.
+		"""
+		
+		with stats.phase("cache.load"):
+			grammar = self.load(text, optimize)
+		if grammar is None:
+			grammar = parsegen.parse.parse_buffer(text, optimize)
+			with stats.phase("cache.store"):
+				self.store(text, grammar, optimize)
+		return grammar
+
+class MemoryCache(GrammarCache):
+	"""Memory Cache
+	
+	A grammar cache for a long running process that keeps the entries it has
+	seen in memory as well as on disk. Lookups try memory first and then the
+	directory. Entries are held serialised, so that every request gets a
+	grammar of its own to change, and rebuilding one is still far cheaper
+	than analysing it again.
+	
+	The entries in memory are kept below `max_memory` bytes by dropping the
+	least recently used ones.
+	"""
+	
+	def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE,
+				 max_memory=DEFAULT_MAX_SIZE):
+		GrammarCache.__init__(self, directory, max_size)
+		self.max_memory = max_memory
+		self.entries = collections.OrderedDict()
+		self.memory = 0
+	
+	def _read(self, key):
+		data = self.entries.get(key)
+		if data is not None:
+			self.entries.move_to_end(key)
+			return data
+		data = GrammarCache._read(self, key)
+		if data is not None:
+			self._remember(key, data)
+		return data
+	
+	def _write(self, key, data):
+		self._remember(key, data)
+		GrammarCache._write(self, key, data)
+	
+	def _remember(self, key, data):
+		old = self.entries.pop(key, None)
+		if old is not None:
+			self.memory -= len(old)
+		self.entries[key] = data
+		self.memory += len(data)
+		while self.memory > self.max_memory and len(self.entries) > 1:
+			_, old = self.entries.popitem(last=False)
+			self.memory -= len(old)
@@ -0,0 +1,167 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+
+from parsegen import batch, cache, depend, parse, output, errors, options
+from parsegen import stats
+
+# Languages used to write out the conflict report in each format
+conflict_reports = { 'text': 'conflicts', 'json': 'conflicts-json' }
+
+def main(args, grammar_cache=None):
+	"""Main
+
+	Runs parsegen with the command line arguments `args` and returns the exit
+	status. `parsegen serve` starts the daemon instead. Grammars are looked up
+	in `grammar_cache`, by default the on-disk cache, unless caching is turned
+	off on the command line.
+	"""
+
+	if args[:1] == ["serve"]:
+		from parsegen import server
+		return server.main(args[1:])
+
+	args = options.parse(args)
+	args.grammar_cache = grammar_cache
+
+	run = batch_main if args.batch else generate
+	if args.profile:
+		run = profiled(run, args.profile)
+
+	if not args.stats:
+		return run(args)
+
+	with stats.collect() as collected:
+		status = run(args)
+	sys.stderr.write(collected.summary())
+	return status
+
+def profiled(run, path):
+	"""Wraps `run` so that it is profiled and the results written to `path`"""
+
+	import cProfile
+
+	def wrapper(args):
+		profiler = cProfile.Profile()
+		try:
+			return profiler.runcall(run, args)
+		finally:
+			profiler.dump_stats(path)
+	return wrapper
+
+def batch_main(args):
+
+	try:
+		jobs = batch.jobs_from_args(args)
+	except (errors.ParsegenError, OSError) as e:
+		print(e)
+		return 1
+	return 1 if batch.run(jobs, args.jobs) else 0
+
+def generate(args):
+
+	# Make sure we have a file to read. Make sure the error message matches the
+	# rest of the program
+	if not args.input_file:
+		print(errors.ParsegenError("argument error", "no input file specified"))
+		return 1
+
+	language = conflict_reports.get(args.conflicts, args.language)
+	try:
+		targets = output_targets(args, language)
+	except errors.ParsegenError as e:
+		print(e)
+		return 1
+	paths = [path for _, path in targets]
+
+	if (args.depfile or args.check) and None in paths:
+		print(errors.ParsegenError("argument error", "--depfile and " \
+								   "--check need an output file"))
+		return 1
+
+	command = depend.command(args.input_file.name, language, args.options,
+							 args.depfile, args.optimize)
+	if args.check:
+		with stats.phase("check"):
+			statuses = [depend.check(path, command) for path in paths]
+		if None not in statuses:
+			args.input_file.close()
+			return max(statuses)
+
+	try:
+		# These two lines do all the heavy lifting
+		text = parse.read_file(args.input_file)
+		if args.cache:
+			grammar_cache = args.grammar_cache or cache.GrammarCache()
+			grammar = grammar_cache.parse_buffer(text, args.optimize)
+		else:
+			grammar = parse.parse_buffer(text, args.optimize)
+		if grammar.optimisation:
+			from parsegen import optimise
+			sys.stderr.write(optimise.summary(grammar.optimisation))
+
+		if args.depfile or args.check:
+			inputs = depend.inputs(args.input_file.name, grammar, language,
+								   args.options)
+
+		if None in paths:
+			output.write_grammar(grammar, file=args.output_file,
+								 options=args.options, language=language)
+		else:
+			output.write_grammar_files(grammar, targets, options=args.options)
+
+		# Close the file when we are done with it
+		args.input_file.close()
+
+		if args.depfile:
+			depend.write_depfile(args.depfile, paths, inputs)
+	except errors.ParsegenError as e:
+		print(e)
+		return 1
+	except OSError as e:
+		print(errors.ParsegenError("io error", "{0}: {1}".format(
+			e.filename or args.output, e.strerror)))
+		return 1
+
+	# When checking for conflicts the exit status reports the result
+	status = 1 if args.conflicts and grammar.conflicts() else 0
+	if args.check:
+		for path in paths:
+			depend.record(path, command, inputs, status)
+	return status
+
+def output_targets(args, language):
+	"""Output Targets
+
+	Returns the pairs of language and path to write the parser to. With a
+	comma separated list of languages a parser is written for each, into the
+	directory given by `-o` or next to the grammar, named after the grammar.
+	A single parser is written to `-o`, or to standard out when the path is
+	None.
+	"""
+
+	if len(output.split_languages(language)) == 1:
+		return [(language, args.output if args.output_file is None else None)]
+
+	job = batch.job(args.input_file.name, args.output, language)
+	return batch.output_paths(job)
@@ -0,0 +1,93 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import errno
+import json
+import os
+import socket
+import sys
+import tempfile
+
+def default_socket():
+	"""Default Socket
+	
+	Returns the path of the socket named by `PARSEGEN_SOCKET`, or one for
+	the current user in the runtime or temporary directory.
+	"""
+	
+	path = os.environ.get("PARSEGEN_SOCKET")
+	if path:
+		return path
+	
+	base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+	return os.path.join(base, "parsegen-{0}.sock".format(os.getuid()))
+
+def request(message, path=None):
+	"""Request
+	
+	Sends `message` to the server listening on the socket at `path` and
+	returns its response. Both are `dict`s sent as JSON. Raises an OSError
+	if no server is listening and a ValueError if the reply is cut short.
+	
+	The socket may be in a directory shared with other users, so it is only
+	used if it belongs to the current user. Otherwise anyone could listen
+	there first and be sent our command lines, or answer them.
+	"""
+	
+	family = getattr(socket, "AF_UNIX", None)
+	if family is None:
+		raise OSError("unix domain sockets are not supported")
+	
+	path = path or default_socket()
+	if os.stat(path).st_uid != os.getuid():
+		raise OSError(errno.EPERM, "socket belongs to another user", path)
+	
+	with socket.socket(family, socket.SOCK_STREAM) as sock:
+		sock.connect(path)
+		sock.sendall(json.dumps(message).encode("utf-8"))
+		sock.shutdown(socket.SHUT_WR)
+		data = b"".join(iter(lambda: sock.recv(65536), b""))
+	
+	return json.loads(data.decode("utf-8"))
+
+def main(args, path=None):
+	"""Main
+	
+	Runs parsegen with the command line arguments `args` in the server
+	listening at `path`, copying its output here, and returns the exit
+	status. If no server is running parsegen is run in this process instead.
+	Reading the grammar from standard input is always done here.
+	"""
+	
+	if "-" not in args:
+		try:
+			response = request({"args": args, "cwd": os.getcwd()}, path)
+		except (OSError, ValueError):
+			response = None
+		
+		if response is not None:
+			sys.stdout.write(response["stdout"])
+			sys.stderr.write(response["stderr"])
+			return response["status"]
+	
+	from parsegen import cli
+	return cli.main(args)
@@ -20,8 +20,219 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import codecs
+import collections.abc
+from array import array
+
 from parsegen.errors import SymbolNameError
-from parsegen.utils import lazyprop, Struct
+from parsegen.utils import Struct
+
+# Name of the pseudo-terminal that marks the end of the input. It is always
+# present in the follow set of the start symbol.
+END_OF_INPUT = "$"
+
+class TerminalTable(object):
+	"""Terminal Table
+	
+	Gives each terminal name a small, dense index so that sets of terminals
+	can be stored as the bits of a Python `int`. Indices are handed out in the
+	order that names are first seen.
+	"""
+	
+	__slots__ = ('names', 'indices')
+	
+	def __init__(self, names=()):
+		self.names = []
+		self.indices = {}
+		for name in names:
+			self.index(name)
+	
+	def __len__(self):
+		return len(self.names)
+	
+	def index(self, name):
+		"""Index
+		
+		Returns the index of a terminal name, adding it to the table if it has
+		not been seen before.
+		"""
+		
+		try:
+			return self.indices[name]
+		except KeyError:
+			index = self.indices[name] = len(self.names)
+			self.names.append(name)
+			return index
+	
+	def bits(self, values):
+		"""Bits
+		
+		Converts an iterable of terminal names into a bitset. A `TerminalSet`
+		that already belongs to this table is converted without iterating it.
+		"""
+		
+		if isinstance(values, TerminalSet) and values.table is self:
+			return values.bits
+		
+		bits = 0
+		for value in values:
+			bits |= 1 << self.index(value)
+		return bits
+	
+	def names_of(self, bits):
+		"""Names Of
+		
+		Yields the terminal names for each bit set in `bits`, lowest index
+		first.
+		"""
+		
+		names = self.names
+		while bits:
+			low = bits & -bits
+			yield names[low.bit_length() - 1]
+			bits ^= low
+
+class TerminalSet(collections.abc.Set):
+	"""Terminal Set
+	
+	Read-only, set-like view of a terminal bitset. Compares equal to a plain
+	`set` holding the same names.
+	"""
+	
+	__slots__ = ('table', 'bits')
+	
+	def __init__(self, table, bits=0):
+		self.table = table
+		self.bits = bits
+	
+	@classmethod
+	def _from_iterable(cls, it):
+		return set(it)
+	
+	def __contains__(self, name):
+		index = self.table.indices.get(name)
+		return index is not None and (self.bits >> index) & 1 == 1
+	
+	def __iter__(self):
+		return self.table.names_of(self.bits)
+	
+	def __len__(self):
+		return bin(self.bits).count("1")
+	
+	def __eq__(self, other):
+		if isinstance(other, TerminalSet) and other.table is self.table:
+			return self.bits == other.bits
+		return collections.abc.Set.__eq__(self, other)
+	
+	def __le__(self, other):
+		if isinstance(other, TerminalSet) and other.table is self.table:
+			return self.bits & ~other.bits == 0
+		return collections.abc.Set.__le__(self, other)
+	
+	def __repr__(self):
+		return repr(set(self))
+
+class SymbolTable(object):
+	"""Symbol Table
+	
+	Gives each terminal and nonterminal of a grammar an integer code so that
+	expansions can be stored and analysed as arrays of `int`s. A terminal's
+	code is its index in the header's terminal table, which is also its bit
+	in a terminal set. Nonterminals are numbered from zero in the order they
+	are defined and their codes are stored complemented, so the code of the
+	nonterminal at `index` is `~index`. Negative codes are nonterminals.
+	"""
+	
+	__slots__ = ('terminals', 'symbols', 'codes')
+	
+	def __init__(self, header, symbols):
+		self.terminals = header.terminal_table
+		self.symbols = list(symbols)
+		self.codes = dict(
+			(name, self.terminals.index(name)) for name in header.terminals)
+		for index, symbol in enumerate(self.symbols):
+			self.codes.setdefault(symbol.name, ~index)
+	
+	def code(self, name):
+		return self.codes[name]
+	
+	def name(self, code):
+		if code >= 0:
+			return self.terminals.names[code]
+		return self.symbols[~code].name
+	
+	def symbol(self, code):
+		return self.symbols[~code]
+	
+	def encode(self, names):
+		"""Encode
+		
+		Returns an `array` of the codes of `names`. Raises a KeyError for a
+		name that is neither a terminal nor a nonterminal.
+		"""
+		
+		codes = self.codes
+		return array('i', [codes[name] for name in names])
+	
+	def decode(self, codes):
+		"""Decode
+		
+		Returns a list of the names of `codes`.
+		"""
+		
+		return [self.name(code) for code in codes]
+
+class UserCode(object):
+	"""User Code
+	
+	The user code section of a grammar file held as a range of bytes in the
+	buffer that the file was read from, usually a memory mapped file. The
+	text is only decoded when it is asked for, and `write_to` copies it to an
+	output file a piece at a time so that the whole section is never held in
+	memory as a string.
+	"""
+	
+	# Number of bytes decoded and written at once by `write_to`
+	chunk_size = 64 * 1024
+	
+	def __init__(self, buffer, start=0, end=None, encoding="utf-8"):
+		self.buffer = buffer
+		self.start = start
+		self.end = len(buffer) if end is None else end
+		self.encoding = encoding
+	
+	def __len__(self):
+		return self.end - self.start
+	
+	def __str__(self):
+		return bytes(self.buffer[self.start:self.end]).decode(self.encoding)
+	
+	def __repr__(self):
+		return "UserCode({0}, {1})".format(self.start, self.end)
+	
+	def __eq__(self, other):
+		if isinstance(other, (str, UserCode)):
+			return str(self) == str(other)
+		return NotImplemented
+	
+	def __ne__(self, other):
+		equal = self.__eq__(other)
+		return equal if equal is NotImplemented else not equal
+	
+	def __hash__(self):
+		return hash(str(self))
+	
+	def write_to(self, file):
+		"""Write To
+		
+		Writes the decoded text to `file` in pieces of `chunk_size` bytes.
+		"""
+		
+		decoder = codecs.getincrementaldecoder(self.encoding)()
+		for start in range(self.start, self.end, self.chunk_size):
+			end = min(start + self.chunk_size, self.end)
+			file.write(decoder.decode(self.buffer[start:end]))
+		file.write(decoder.decode(b"", final=True))
 
 class Header(object):
 	"""Grammar File Header
@@ -30,6 +241,8 @@ class Header(object):
 	that represent the options and the terminal definitions.
 	"""
 	
+	__slots__ = ('options', 'terminals', 'terminal_table', '_values')
+	
 	def __init__(self, terms, opts):
 		"""Header Constructor
 		
@@ -40,23 +253,84 @@ class Header(object):
 		
 		self.options = opts
 		self.terminals = terms
+		self.terminal_table = TerminalTable(terms)
+		self._values = {}
 		
 	def get_option(self, option, default=""):
 		return self.options.get(option, default)
+	
+	def add_terminal(self, name, value=None):
+		"""Add Terminal
+		
+		Defines the terminal `name`, or changes its value if it is already
+		defined, and returns its index in the terminal table. Without a
+		`value` the name is used, as it is for terminals in a grammar file.
+		"""
+		
+		self.terminals[name] = value or name
+		self._values.clear()
+		return self.terminal_table.index(name)
+	
+	def terminal_value(self, name, end_token=None):
+		"""Terminal Value
+		
+		Returns the value used in the output for the terminal `name`. The end
+		of input marker takes the value `end_token`. Formatters pass in their
+		own, which includes options given on the command line; by default it
+		comes from the grammar's `end_token` option.
+		"""
+		
+		if name == END_OF_INPUT:
+			if end_token is None:
+				end_token = self.get_option("end_token", "0")
+			return end_token
+		return self.terminals[name]
+	
+	def terminal_values(self, bits, end_token=None):
+		"""Terminal Values
+		
+		Returns a list of the output values of the terminals in a bitset from
+		the terminal table, with the end of input marker given the value
+		`end_token` as in `terminal_value`. Expansions with the same predict
+		set share the same list, so it must not be modified.
+		"""
+		
+		key = (bits, end_token)
+		values = self._values.get(key)
+		if values is None:
+			values = self._values[key] = [
+				self.terminal_value(name, end_token)
+				for name in self.terminal_table.names_of(bits)
+			]
+		return values
 
 class Symbol(object):
 	"""Grammar Symbol
 	
 	Represents the expansions of a given symbol.
+	
+	Symbols are created in large numbers for generated grammars so they use
+	`__slots__`. The terminal table is only created for a symbol that is not
+	part of a grammar when terminals are added to its sets.
+	
+	Left factoring a grammar makes continuations: symbols that parse the rest
+	of expansions once the symbol that uses them has parsed a shared
+	`prefix` of their tokens. Other symbols have an empty prefix.
 	"""
 	
+	__slots__ = ('name', 'expansions', 'nullable', 'table', 'first_bits',
+				 'follow_bits', 'grammar', 'prefix', '_counts')
+	
 	def __init__(self, name):
 		self.name = self._process_name(name)
 		self.expansions = []
 		self.nullable = False
-		self.first = set()
-		self.follow = set()
+		self.table = None
+		self.first_bits = 0
+		self.follow_bits = 0
 		self.grammar = None
+		self.prefix = ()
+		self._counts = None
 	
 	def _process_name(self, name):
 		name = name.strip()
@@ -64,22 +338,24 @@ class Symbol(object):
 			raise SymbolNameError(name)
 		return name
 
-	@lazyprop
+	@property
 	def counts(self):
 		"""Counts
 
 		Returns the maximum number of terminals and nonterminals that this
-		symbol has in any of its expansions
+		symbol has in any of its expansions. Computed the first time it is
+		asked for.
 		"""
+		if self._counts is None:
+			self._counts = self._compute_counts()
+		return self._counts
+
+	def _compute_counts(self):
 		node_count, term_count = 0, 0
 
 		for expansion in self.expansions:
-			n,t = 0,0
-			for e in expansion:
-				if e in self.grammar.header.terminals:
-					t += 1
-				else:
-					n += 1
+			t = sum(1 for code in expansion.codes if code >= 0)
+			n = len(expansion.codes) - t
 			if n > node_count: node_count = n
 			if t > term_count: term_count = t
 		return node_count, term_count
@@ -99,10 +375,23 @@ class Symbol(object):
 		"""
 
 		self.expansions.append(Expansion(self, expansion))
+		self._counts = None
 		if not expansion:
 			# We _know_ this symbol is nullable now, so set it
 			self.set_nullable()
 
+	def remove_expansion(self, index):
+		"""Remove Expansion
+		
+		Removes the expansion at `index` from this symbol and returns it. The
+		nullable flag is left alone, it is up to the grammar to work out
+		whether the symbol is still nullable.
+		"""
+		
+		expansion = self.expansions.pop(index)
+		self._counts = None
+		return expansion
+
 	def set_nullable(self):
 		"""Set Nullable
 		
@@ -124,60 +413,171 @@ class Symbol(object):
 		else:
 			return self.nullable
 			
-	def _union_set_with_values(self, set_ref, values):
-		"""Union Set With Values
+	@property
+	def first(self):
+		"""First
 		
-		Set union helper method
+		The first set of the symbol as a set-like view of `first_bits`.
 		"""
 		
-		values = set(values)
-		set_ref = set_ref.union(values)
-		return set_ref
+		return TerminalSet(self._terminal_table(), self.first_bits)
+	
+	@property
+	def follow(self):
+		"""Follow
+		
+		The follow set of the symbol as a set-like view of `follow_bits`.
+		"""
 		
+		return TerminalSet(self._terminal_table(), self.follow_bits)
+	
 	def add_first(self, values):
 		"""Add First
 		
-		Adds values to the first set. If any of the values are in the first set.
-		This is a *set union* operation. `values` can be a set or a list.
+		Adds values to the first set. This is a *set union* operation.
+		`values` can be any iterable of terminal names.
 		"""
 		
-		self.first = self._union_set_with_values(self.first, values)
+		self.first_bits |= self._terminal_table().bits(values)
 		
 	def add_follow(self, values):
 		"""Add Follow
 		
-		Adds values to the follow set. If any of the values are in the first
-		set. This is a *set union* operation. `values` can be a set or a list.
+		Adds values to the follow set. This is a *set union* operation.
+		`values` can be any iterable of terminal names.
 		"""
 		
-		self.follow = self._union_set_with_values(self.follow, values)
+		self.follow_bits |= self._terminal_table().bits(values)
+
+	def _terminal_table(self):
+		if self.table is None:
+			self.table = TerminalTable()
+		return self.table
 
 	def set_grammar(self, grammar):
 		"""Set Grammar
 
-		Attach the symbol to a grammar
+		Attach the symbol to a grammar. Any terminals already in the first or
+		follow sets are moved over to the grammar's terminal table.
 		"""
 
+		table = grammar.header.terminal_table
+		if self.table is not table:
+			if self.table is not None:
+				self.first_bits = table.bits(self.first)
+				self.follow_bits = table.bits(self.follow)
+			self.table = table
 		self.grammar = grammar
 
 class Expansion(object):
 	"""Expansion
 	
 	Represents a series of tokens in a grammar expansion.
+	
+	Until the symbol is added to a grammar the tokens are kept as a list of
+	names. The grammar then replaces them with `codes`, an `array` of the
+	codes from its `SymbolTable`, and `tokens` decodes the names again when
+	they are asked for.
+	
+	Once parsed an expansion calls the semantic action of its symbol. An
+	optimised grammar keeps the actions of the grammar as written: `action`
+	names the symbol whose action is called, if not the expansion's own, and
+	its value is passed on through the actions of the unit rules named in
+	`wrappers`, innermost first.
 	"""
 
+	__slots__ = ('symbol', 'names', 'codes', 'symbol_table', 'first_bits',
+				 'nullable_from', 'predict_bits', 'action', 'wrappers')
+
 	def __init__(self, symbol, tokens):
 		self.symbol = symbol
-		self.tokens = tokens
+		self.names = list(tokens)
+		self.codes = None
+		self.symbol_table = None
+		self.first_bits = 0
+		self.nullable_from = len(self.names)
+		self.predict_bits = 0
+		self.action = None
+		self.wrappers = ()
+	
+	@property
+	def tokens(self):
+		"""Tokens
+		
+		The names of the tokens in the expansion.
+		"""
+		
+		if self.codes is None:
+			return self.names
+		return self.symbol_table.decode(self.codes)
+	
+	def encode(self, symbol_table):
+		"""Encode
+		
+		Stores the tokens as codes from `symbol_table`.
+		"""
+		
+		self.codes = symbol_table.encode(self.tokens)
+		self.symbol_table = symbol_table
+		self.names = None
+	
+	@property
+	def arguments(self):
+		"""Arguments
+		
+		The names of the tokens whose values are passed to the semantic
+		action: the prefix parsed for a continuation by the symbols that use
+		it followed by the expansion's own tokens.
+		"""
+		
+		return list(self.symbol.prefix) + self.tokens
+	
+	@property
+	def continues(self):
+		"""Continues
+		
+		True if the expansion ends with a continuation, which parses the rest
+		of the expansions that share its prefix. The expansion then has no
+		action of its own and its value is the value of the continuation.
+		"""
+		
+		codes = self.codes
+		return bool(codes) and codes[-1] < 0 and \
+			bool(self.symbol_table.symbol(codes[-1]).prefix)
 
-	@lazyprop
-	def predictions(self):
-		predictions = []
-		if not self.tokens:
-			pass
-		elif self.tokens[0] in self.symbol.grammar.header.terminals:
-			predictions = [self.tokens[0]]
-		else:
-			predictions = self.symbol.grammar.expansions[self.tokens[0]].first
+	@property
+	def tail_recursive(self):
+		"""Tail Recursive
 
-		return [self.symbol.grammar.header.terminals[t] for t in predictions]
+		True if the expansion ends with its own symbol, as right recursive
+		list rules do. Backends can parse these with a loop that keeps the
+		values of each element and calls the semantic actions once the list
+		ends, innermost first, rather than recursing once per element. Only
+		plain symbols qualify: continuations are handed the arrays of their
+		caller and expansions with `wrappers` pass their value on.
+		"""
+
+		codes = self.codes
+		return bool(codes) and not self.symbol.prefix and \
+			not self.wrappers and \
+			codes[-1] == self.symbol_table.codes[self.symbol.name]
+
+	@property
+	def predict(self):
+		"""Predict
+		
+		The predict set of the expansion as a set-like view of `predict_bits`.
+		This is filled in when the symbol is added to a grammar.
+		"""
+		
+		return TerminalSet(self.symbol._terminal_table(), self.predict_bits)
+
+	@property
+	def predictions(self):
+		"""Predictions
+		
+		The output values of the terminals in the predict set.
+		"""
+		
+		header = self.symbol.grammar.header
+		return header.terminal_values(self.predict_bits)
@@ -0,0 +1,145 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import hashlib
+import json
+import os
+
+from parsegen.version import VERSION
+import parsegen.cache
+import parsegen.output
+import parsegen.version
+
+def inputs(grammar_path, grammar, language=None, options=None):
+	"""Inputs
+	
+	Returns the paths of the files that the parsers generated from a grammar
+	depend on: the grammar itself, the files the formatter for each of the
+	comma separated languages in `language` reads or is implemented in, such
+	as its template, and the module holding the Parsegen version.
+	"""
+	
+	paths = [grammar_path]
+	for name in parsegen.output.split_languages(language):
+		formatter = parsegen.output.find_formatter(grammar, name)
+		for path in formatter(grammar, options).dependencies():
+			if path not in paths:
+				paths.append(path)
+	if parsegen.version.__file__ not in paths:
+		paths.append(parsegen.version.__file__)
+	return paths
+
+def write_depfile(path, targets, paths):
+	"""Write Depfile
+	
+	Writes a makefile rule in the style of `gcc -M` to `path`, stating that
+	`targets`, a path or a list of them, depend on each of `paths`. Make and
+	ninja can both read it. The file is only replaced if it has changed.
+	"""
+	
+	if isinstance(targets, str):
+		targets = [targets]
+	head = " ".join(_escape(target) for target in targets) + ":"
+	rule = " \\\n  ".join([head] + [_escape(p) for p in paths])
+	parsegen.output.replace_if_changed(path, (rule + "\n").encode("utf-8"))
+
+def _escape(path):
+	path = path.replace("$", "$$").replace("#", "\\#")
+	return path.replace(" ", "\\ ")
+
+def command(grammar, language=None, options=None, depfile=None,
+			optimize=None):
+	"""Command
+	
+	Returns a description of the parts of a command line that affect what
+	is generated, for recording along with the inputs. This includes the
+	path of the `grammar`, so generating a different grammar into the same
+	output is never taken to be up to date.
+	"""
+	
+	return {"grammar": os.path.abspath(grammar), "language": language,
+			"options": options or {},
+			"depfile": depfile and os.path.abspath(depfile),
+			"optimize": optimize}
+
+def check(output, command, directory=None):
+	"""Check
+	
+	Returns the exit status recorded for `output` if it was last generated
+	by the same version of Parsegen with the same `command`, none of its
+	inputs have changed since and neither it nor its depfile has been
+	changed or removed. Otherwise returns None, and the parser has to be
+	generated again. Only the recorded files are read; the grammar is not
+	parsed.
+	"""
+	
+	try:
+		with open(_record_path(output, directory)) as f:
+			record = json.load(f)
+		if record["version"] != VERSION or record["command"] != command:
+			return None
+		for path, digest in record["inputs"].items():
+			if _digest(path) != digest:
+				return None
+		if _digest(output) != record["output"]:
+			return None
+		if command["depfile"] and not os.path.exists(command["depfile"]):
+			return None
+		return record["status"]
+	except (OSError, ValueError, KeyError, TypeError):
+		return None
+
+def record(output, command, paths, status=0, directory=None):
+	"""Record
+	
+	Records the hashes of the inputs `paths` and of `output`, along with the
+	`command` and exit `status`, so that `check` can tell whether the parser
+	is up to date. Records are kept in the cache directory. Failing to write
+	one is ignored, the parser is simply generated again next time.
+	"""
+	
+	try:
+		data = {
+			"version": VERSION,
+			"command": command,
+			"inputs": dict((os.path.abspath(p), _digest(p)) for p in paths),
+			"output": _digest(output),
+			"status": status
+		}
+		path = _record_path(output, directory)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		parsegen.output.replace_if_changed(
+			path, json.dumps(data, sort_keys=True).encode("utf-8"))
+	except OSError:
+		pass
+
+def _record_path(output, directory=None):
+	directory = directory or parsegen.cache.default_directory()
+	key = hashlib.sha256(os.path.abspath(output).encode("utf-8"))
+	return os.path.join(directory, "outputs", key.hexdigest() + ".json")
+
+def _digest(path):
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(64 * 1024), b""):
+			digest.update(chunk)
+	return digest.hexdigest()
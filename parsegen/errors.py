@@ -34,17 +34,22 @@ class ParseError(ParsegenError):
 	"""Parse Error
 	
 	Represents a failure to parse a grammar file. The reason for the failure is
-	provided as a string.
+	provided as a string. The location of the failure, if known, is available
+	as `line` and `column`.
 	"""
 	
-	def __init__(self, string):
+	def __init__(self, string, line=None, column=None):
 		"""ParseError Constructor
 		
 		Create a new parse error from a string. The string is automatically
 		formatted for pretty printing in context with other errors.
 		"""
 		
+		if line is not None:
+			string = "line {0}, column {1}: {2}".format(line, column, string)
 		ParsegenError.__init__(self, 'parse error', string)
+		self.line = line
+		self.column = column
 
 class GrammarError(ParsegenError):
 	"""Grammar Error
@@ -77,3 +82,22 @@ class SymbolNameError(ParsegenError):
 		
 		err = "invalid token or symbol name %s" % name
 		ParsegenError.__init__(self, "name error", err)
+
+class InputError(ParsegenError):
+	"""Input Error
+	
+	Represents a failure to parse a stream of tokens with a grammar at
+	runtime. The position of the offending token in the stream is available
+	as `position`.
+	"""
+	
+	def __init__(self, string, position):
+		"""InputError Constructor
+		
+		Create a new input error from a string and the index of the token in
+		the input that caused it.
+		"""
+		
+		string = "token {0}: {1}".format(position, string)
+		ParsegenError.__init__(self, "input error", string)
+		self.position = position
@@ -20,7 +20,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import collections
+
 from parsegen.errors import GrammarError
+from parsegen.data import END_OF_INPUT, Symbol, SymbolTable, TerminalSet
+from parsegen.utils import Struct
+from parsegen import stats
 
 class Grammar(object):
     """Grammar
@@ -31,24 +36,480 @@ class Grammar(object):
     parsed grammars to be passed around more easily. It is also responsible
     for calculating the sets for each expansion in the grammar from the raw
     grammar that it is given.
+
+    The start symbol is the one named by the `start` option, or the first
+    symbol defined if there is no such option. Its follow set contains the
+    `END_OF_INPUT` marker.
+
+    The `user_code` is either a string or, for grammars read from bytes, a
+    `UserCode` range of the file that is only decoded when it is written.
+
+    Every terminal and nonterminal is given an integer code in the
+    grammar's `symbol_table`, and the analysis works on expansions stored
+    as arrays of these codes.
+
+    Passing `analyse=False` only checks the grammar and attaches the symbols
+    to it, leaving the caller to fill in sets computed earlier.
+
+    Once built a grammar can be changed a rule at a time with
+    `add_terminal`, `add_expansion` and `remove_expansion`. These keep the
+    sets up to date by recomputing them only for the symbols that the
+    change can reach, rather than analysing the whole grammar again. Each
+    change adds one to `version`, so views built from the grammar can tell
+    when they are out of date.
+
+    A grammar made by `parsegen.optimise` reports how much smaller it is in
+    `optimisation`, which is None for other grammars.
     """
     
-    def __init__(self, header, expansions, user_code):
+    def __init__(self, header, expansions, user_code, analyse=True):
         self.header = header
         self.expansions = expansions
         self.user_code = user_code
-        self._compute_sets_for_expansions()
-    
+        self.iterations = 0
+        self.version = 0
+        self.optimisation = None
+        self.start = None
+        self.symbol_table = None
+        self._users = None
+        self.header.terminal_table.index(END_OF_INPUT)
+        with stats.phase("analysis"):
+            if analyse:
+                self._compute_sets_for_expansions()
+            else:
+                self._initialise_expansions_state()
+
+    def predict(self, expansion):
+        """Predict
+
+        Returns the predict set of an expansion: the terminals that select the
+        expansion when they are the next token. This is the first set of the
+        expansion plus, if the expansion is nullable, the follow set of its
+        symbol.
+        """
+
+        return TerminalSet(self.header.terminal_table, expansion.predict_bits)
+
+    def conflicts(self):
+        """Conflicts
+
+        Returns a list of the LL(1) conflicts in the grammar. Each conflict is
+        a `Struct` with the `symbol` name, the indices of the two
+        `expansions` involved and the `terminals` that predict both of them.
+
+        The predict sets of each symbol are checked against the union of the
+        sets before them, so a symbol without conflicts costs one bitwise
+        operation per expansion. Only symbols that do conflict are compared
+        pairwise to find the expansions involved.
+        """
+
+        table = self.header.terminal_table
+        found = []
+
+        for symbol in self.expansions.values():
+            seen = 0
+            for i, expansion in enumerate(symbol.expansions):
+                bits = expansion.predict_bits
+                if seen & bits:
+                    for j in range(i):
+                        overlap = symbol.expansions[j].predict_bits & bits
+                        if overlap:
+                            found.append(Struct(
+                                symbol=symbol.name,
+                                expansions=(j, i),
+                                terminals=list(table.names_of(overlap))))
+                seen |= bits
+
+        return found
+
+    def add_terminal(self, name, value=None):
+        """Add Terminal
+
+        Defines a new terminal, or changes the value of an existing one, and
+        returns its code. No expansion uses a new terminal yet so none of the
+        sets need to change.
+        """
+
+        if name in self.expansions:
+            error = "{0} is already defined as a nonterminal"
+            raise GrammarError(error.format(name))
+
+        code = self.header.add_terminal(name, value)
+        self.symbol_table.codes[name] = code
+        self.version += 1
+        return code
+
+    def add_expansion(self, name, tokens):
+        """Add Expansion
+
+        Adds an expansion of the token names `tokens` to the symbol `name`,
+        defining the symbol if it is new, and returns the new `Expansion`.
+        Every token must already be defined, apart from `name` itself. The
+        sets of the symbols affected by the change are brought up to date.
+        """
+
+        error_undefined = "{0} is not defined as a terminal or nonterminal"
+        error_nterm_expand = "expansion for nonterminal {0}"
+
+        codes = self.symbol_table.codes
+        for token in tokens:
+            if token not in codes and token != name:
+                raise GrammarError(error_undefined.format(token))
+
+        users = self._symbol_users()
+        symbols = self.symbol_table.symbols
+        new = name not in self.expansions
+        if new:
+            if name in self.header.terminals:
+                raise GrammarError(error_nterm_expand.format(name))
+            symbol = Symbol(name)
+            symbol.set_grammar(self)
+            self.expansions[symbol.name] = symbol
+            codes[symbol.name] = ~len(symbols)
+            symbols.append(symbol)
+            users.append([])
+            start = self.header.get_option("start")
+            if self.start is None and start in ("", symbol.name):
+                self.start = symbol
+
+        symbol = self.expansions[name]
+        index = ~codes[symbol.name]
+        nullable = symbol.nullable
+        symbol.add_expansion(tokens)
+        expansion = symbol.expansions[-1]
+        expansion.encode(self.symbol_table)
+        for code in set(expansion.codes):
+            if code < 0:
+                users[~code].append((index, expansion))
+
+        if len(symbol.expansions) > 1:
+            self._extend(index, expansion, nullable)
+        else:
+            self._reanalyse(index, expansion.codes, expansion, new)
+        self.version += 1
+        return expansion
+
+    def remove_expansion(self, name, index):
+        """Remove Expansion
+
+        Removes the expansion at `index` from the symbol `name` and returns
+        it. The symbol itself stays defined, and with no expansions left it
+        is nullable. The sets of the symbols affected are brought up to date.
+        """
+
+        if name not in self.expansions:
+            error = "{0} is not defined as a nonterminal"
+            raise GrammarError(error.format(name))
+
+        users = self._symbol_users()
+        symbol = self.expansions[name]
+        owner = ~self.symbol_table.codes[name]
+        expansion = symbol.remove_expansion(index)
+        for code in set(expansion.codes):
+            if code < 0:
+                users[~code].remove((owner, expansion))
+
+        self._reanalyse(owner, expansion.codes)
+        self.version += 1
+        return expansion
+
+    def _symbol_users(self):
+        """Symbol Users
+
+        Returns a list holding, for the symbol at each index, a pair of the
+        index of the symbol using it and the expansion for each expansion
+        that it appears in. Built the first time the grammar is changed and
+        kept up to date from then on.
+        """
+
+        if self._users is None:
+            users = [[] for _ in self.symbol_table.symbols]
+            for index, symbol in enumerate(self.symbol_table.symbols):
+                for expansion in symbol.expansions:
+                    for code in set(expansion.codes):
+                        if code < 0:
+                            users[~code].append((index, expansion))
+            self._users = users
+        return self._users
+
+    def _dependents(self, nodes, test=None):
+        """Dependents
+
+        Returns a list of the indices in `nodes` and of every symbol that uses
+        one of them, directly or through others. Given a `test` only the uses
+        in expansions for which `test(node, expansion)` is true are followed.
+        """
+
+        users = self._symbol_users()
+        cone = list(nodes)
+        seen = set(cone)
+
+        for node in cone:
+            for owner, expansion in users[node]:
+                if owner in seen:
+                    continue
+                if test is None or test(node, expansion):
+                    seen.add(owner)
+                    cone.append(owner)
+
+        return cone
+
+    def _in_nullable_prefix(self, node, expansion):
+        symbols = self.symbol_table.symbols
+        for code in expansion.codes:
+            if code == ~node:
+                return True
+            if code >= 0 or not symbols[~code].is_nullable():
+                return False
+        return False
+
+    def _extend(self, root, expansion, nullable):
+        """Extend
+
+        Brings the sets up to date after `expansion` has been added to the
+        symbol at index `root`, which already had other expansions and was
+        `nullable` or not before. Adding an expansion can only add to the
+        sets, so the new members are pushed along from the symbols that gain
+        them until nothing else changes. No set is cleared and symbols that
+        gain nothing are never visited.
+        """
+
+        symbols = self.symbol_table.symbols
+        users = self._symbol_users()
+
+        def all_nullable(other):
+            return all(code < 0 and symbols[~code].is_nullable()
+                       for code in other.codes)
+
+        def first_of(other):
+            bits = 0
+            for code in other.codes:
+                if code >= 0:
+                    return bits | 1 << code
+                bits |= symbols[~code].first_bits
+                if not symbols[~code].is_nullable():
+                    break
+            return bits
+
+        if not nullable and all_nullable(expansion):
+            symbols[root].set_nullable()
+            nullable = [root]
+        else:
+            nullable = []
+        for node in nullable:
+            for owner, other in users[node]:
+                symbol = symbols[owner]
+                if not symbol.nullable and all_nullable(other):
+                    symbol.set_nullable()
+                    nullable.append(owner)
+
+        touched = {id(expansion): (root, expansion)}
+        for node in nullable:
+            for owner, other in users[node]:
+                touched[id(other)] = (owner, other)
+
+        first = list(touched.values())
+        while first:
+            owner, other = first.pop()
+            symbol = symbols[owner]
+            bits = first_of(other)
+            if bits & ~symbol.first_bits:
+                symbol.first_bits |= bits
+                for user in users[owner]:
+                    touched[id(user[1])] = user
+                    first.append(user)
+
+        before = {}
+        for owner, other in touched.values():
+            for code in other.codes:
+                if code < 0:
+                    before.setdefault(~code, symbols[~code].follow_bits)
+
+        edges = collections.defaultdict(list)
+        for owner, other in touched.values():
+            self._update_follow_from_expansion(owner, other, edges)
+        for node, owners in edges.items():
+            for owner in owners:
+                symbols[node].follow_bits |= symbols[owner].follow_bits
+
+        follow = [node for node, bits in before.items()
+                  if symbols[node].follow_bits != bits]
+        grown = set(follow)
+        while follow:
+            symbol = symbols[follow.pop()]
+            for other in symbol.expansions:
+                for code in reversed(other.codes):
+                    if code >= 0:
+                        break
+                    tail = symbols[~code]
+                    if symbol.follow_bits & ~tail.follow_bits:
+                        tail.follow_bits |= symbol.follow_bits
+                        grown.add(~code)
+                        follow.append(~code)
+                    if not tail.is_nullable():
+                        break
+
+        for node in grown:
+            for other in symbols[node].expansions:
+                touched[id(other)] = (node, other)
+        self._update_predict(touched.values())
+
+    def _reanalyse(self, root, changed, expansion=None, new=False):
+        """Reanalyse
+
+        Brings the sets up to date after the expansions of the symbol at index
+        `root` have changed. `changed` holds the codes of the expansion that
+        was added or removed and `expansion` is the one added, if any. A `new`
+        symbol may have become the start symbol.
+
+        The symbols whose nullability or first sets can change are cleared
+        and computed again with the sets of every other symbol taken as
+        final. When an expansion is removed from a symbol that still has
+        others, sets can only shrink, so these are just the symbols that use
+        `root` in an expansion without terminals or in a nullable prefix.
+        Otherwise every symbol using `root` is included. The follow sets that
+        can change are those of the symbols in an expansion using a changed
+        symbol, or in the changed expansion itself, and of the symbols whose
+        follow sets include theirs. They are cleared and computed again in
+        the same way, and finally the predict sets of the expansions touched
+        by either step.
+        """
+
+        symbols = self.symbol_table.symbols
+        users = self._symbol_users()
+        symbol = symbols[root]
+
+        if expansion is None and symbol.expansions:
+            nullable_cone = []
+            if symbol.nullable:
+                nullable_cone = self._dependents(
+                    [root], lambda node, other: max(other.codes) < 0)
+            cone = self._dependents(
+                nullable_cone or [root], self._in_nullable_prefix)
+        else:
+            nullable_cone = cone = self._dependents([root])
+
+        for node in nullable_cone:
+            symbol = symbols[node]
+            symbol.nullable = not all(e.codes for e in symbol.expansions)
+        self._compute_nullable(nullable_cone)
+
+        for node in cone:
+            symbols[node].first_bits = 0
+        self._propagate_within(
+            cone, self._first_dependencies(cone), "first_bits")
+
+        touched = {}
+        if expansion is not None:
+            touched[id(expansion)] = (root, expansion)
+        seeds = [~code for code in changed if code < 0]
+        if new:
+            seeds.append(root)
+        for node in cone:
+            for owner, other in users[node]:
+                touched[id(other)] = (owner, other)
+                seeds.extend(~code for code in other.codes if code < 0)
+
+        follow_cone = []
+        seen = set()
+        while seeds:
+            node = seeds.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            follow_cone.append(node)
+            for other in symbols[node].expansions:
+                for code in reversed(other.codes):
+                    if code >= 0:
+                        break
+                    seeds.append(~code)
+                    if not symbols[~code].is_nullable():
+                        break
+
+        end = 1 << self.header.terminal_table.index(END_OF_INPUT)
+        for node in follow_cone:
+            symbol = symbols[node]
+            symbol.follow_bits = end if symbol is self.start else 0
+            for owner, other in users[node]:
+                touched[id(other)] = (owner, other)
+
+        edges = collections.defaultdict(list)
+        for owner, other in touched.values():
+            self._update_follow_from_expansion(owner, other, edges)
+        self._propagate_within(
+            follow_cone, [edges[node] for node in follow_cone],
+            "follow_bits")
+
+        for node in follow_cone:
+            for other in symbols[node].expansions:
+                touched[id(other)] = (node, other)
+        self._update_predict(touched.values())
+
+    def _update_predict(self, expansions):
+        """Update Predict
+
+        Sets the predict set of each expansion in the pairs of symbol index
+        and expansion `expansions` from its first set and, if it is nullable,
+        the follow set of its symbol.
+        """
+
+        symbols = self.symbol_table.symbols
+        for owner, expansion in expansions:
+            expansion.predict_bits = expansion.first_bits
+            if expansion.nullable_from == 0:
+                expansion.predict_bits |= symbols[owner].follow_bits
+
+    def _propagate_within(self, nodes, dependencies, attribute):
+        """Propagate Within
+
+        Recomputes the sets in `attribute` of the symbols at the indices in
+        `nodes`, given for each the indices of the symbols whose sets it
+        includes. Sets of symbols outside `nodes` are final and are added in
+        directly, the rest are solved with `_propagate`.
+        """
+
+        symbols = self.symbol_table.symbols
+        local = dict((node, i) for i, node in enumerate(nodes))
+        sets = []
+        edges = []
+
+        for node, deps in zip(nodes, dependencies):
+            bits = getattr(symbols[node], attribute)
+            succs = []
+            for dep in deps:
+                if dep in local:
+                    succs.append(local[dep])
+                else:
+                    bits |= getattr(symbols[dep], attribute)
+            sets.append(bits)
+            edges.append(succs)
+
+        self._propagate(sets, edges)
+        for node, bits in zip(nodes, sets):
+            setattr(symbols[node], attribute, bits)
 
     def _initialise_expansions_state(self):
         """Initialise Expansions State
     
         Sets up the expansions ready to have the first and follow sets computed.
+        The symbol table is built and the tokens of every expansion are
+        encoded with it.
         """
         
         # These strings are long. Define them here to clean things up
         error_nterm_expand = "expansion for nonterminal {0}"
         error_undefined = "{0} is not defined as a terminal or nonterminal"
+        error_start = "start symbol {0} is not defined"
+
+        start = self.header.get_option("start")
+        if start:
+            if start not in self.expansions:
+                raise GrammarError(error_start.format(start))
+            self.start = self.expansions[start]
+        elif self.expansions:
+            self.start = next(iter(self.expansions.values()))
+
+        self.symbol_table = SymbolTable(self.header, self.expansions.values())
     
         for symbol in self.expansions.values():
             symbol.set_grammar(self)
@@ -57,14 +518,10 @@ class Grammar(object):
                 raise GrammarError(error_nterm_expand.format(symbol.name))
         
             for exp in symbol.expansions:
-                # This creates the initial first sets for each symbol
-                if exp.tokens and exp.tokens[0] in self.header.terminals:
-                    symbol.add_first(exp.tokens[:1])
-            
-                for e in exp.tokens:
-                    valid = e in self.header.terminals or e in self.expansions
-                    if not valid:
-                        raise GrammarError(error_undefined.format(e))
+                try:
+                    exp.encode(self.symbol_table)
+                except KeyError as e:
+                    raise GrammarError(error_undefined.format(e.args[0]))
 
     def _each_expansion(self):
         """Each Expansion
@@ -77,64 +534,273 @@ class Grammar(object):
             for expansion in symbol.expansions:
                 yield symbol, expansion
 
-    def _update_first_from_expansion(self, symbol, expansion):
-        """Update First from Expansion
+    def _update_follow_from_expansion(self, index, expansion, edges):
+        """Update Follow from Expansion
     
-        Updates the first set from a given symbol based on one of it's
-        expansions. Returns true if an update is made to the symbol and false
-        otherwise.
+        Walks an expansion once from right to left, keeping the first set and
+        nullability of the suffix already seen. Each nonterminal in the
+        expansion has the first set of the suffix after it added to its
+        follow set. If that suffix is nullable an edge is recorded in `edges`
+        as the nonterminal's follow set also includes the follow set of the
+        symbol at `index`.
+
+        The first set of the whole expansion is stored in its `first_bits`
+        and the suffix-nullability index in `nullable_from`: the position
+        from which every remaining token is nullable.
         """
-    
-        changed = False
-    
-        for e in expansion.tokens:
-            if e in self.header.terminals:
-                break
-            other_sym = self.expansions[e]
-            if not other_sym.first.issubset(symbol.first):
-                symbol.add_first(other_sym.first)
-                changed = True
-            if not other_sym.is_nullable():
-                break
+
+        symbols = self.symbol_table.symbols
+        codes = expansion.codes
+        first = 0
+        nullable_from = len(codes)
+
+        for i in range(len(codes) - 1, -1, -1):
+            code = codes[i]
+            if code >= 0:
+                first = 1 << code
+                continue
+
+            other = symbols[~code]
+            other.follow_bits |= first
+            if nullable_from == i + 1:
+                edges[~code].append(index)
+                if other.is_nullable():
+                    nullable_from = i
+
+            if other.is_nullable():
+                first |= other.first_bits
+            else:
+                first = other.first_bits
+
+        expansion.first_bits = first
+        expansion.nullable_from = nullable_from
+
+    def _compute_nullable(self, indices=None):
+        """Compute Nullable
+
+        Marks every nullable symbol in the grammar. Each expansion that
+        contains no terminals keeps a count of the tokens in it that are not
+        yet known to be nullable. When a symbol becomes nullable the counts of
+        the expansions using it are decremented, and an expansion reaching
+        zero makes its own symbol nullable in turn. Every token in the grammar
+        is visited a constant number of times.
+
+        Given a list of `indices` only those symbols are considered and the
+        nullability of every other symbol is taken as final.
+        """
+
+        symbols = self.symbol_table.symbols
+        remaining = []
+        users = collections.defaultdict(list)
+        inside = None
+        if indices is None:
+            indices = range(len(symbols))
         else:
-            # if all of the expansions are nullable and there are no terminals
-            # then the symbol is nullable too
-            if not symbol.is_nullable():
-                symbol.set_nullable()
-                changed = True
-    
-        return changed
+            inside = set(indices)
+        worklist = [i for i in indices if symbols[i].is_nullable()]
 
-    def _update_follow_from_expansion(self, symbol, expansion):
-        """Update Follow from Expansion
-    
-        Updates the follow set for a given symbol based on one of it's
-        expansions. Returns true if an update is made to the symbol and false
-        otherwise.
+        for index in indices:
+            symbol = symbols[index]
+            for expansion in symbol.expansions:
+                codes = expansion.codes
+                if codes and max(codes) >= 0:
+                    continue
+                if inside is not None:
+                    if any(~code not in inside
+                           and not symbols[~code].is_nullable()
+                           for code in codes):
+                        continue
+                    codes = [code for code in codes if ~code in inside]
+                    if not codes and not symbol.is_nullable():
+                        symbol.set_nullable()
+                        worklist.append(index)
+                for code in codes:
+                    users[~code].append((index, len(remaining)))
+                remaining.append(len(codes))
+
+        while worklist:
+            for index, counter in users[worklist.pop()]:
+                remaining[counter] -= 1
+                symbol = symbols[index]
+                if remaining[counter] == 0 and not symbol.is_nullable():
+                    symbol.set_nullable()
+                    worklist.append(index)
+
+    def _first_dependencies(self, indices=None):
+        """First Dependencies
+
+        Returns a list holding, for the symbol at each index, the indices of
+        the symbols whose first sets are included in its own. These are the
+        nonterminals in the nullable prefix of each expansion. A terminal
+        ending the prefix is added to the symbol's first set directly.
+        Nullability must already have been computed.
+
+        Given a list of `indices` only the dependencies of those symbols are
+        returned, in the same order.
         """
-        
-        changed = False
 
-        return changed
+        symbols = self.symbol_table.symbols
+        edges = []
+
+        if indices is None:
+            indices = range(len(symbols))
+
+        for index in indices:
+            symbol = symbols[index]
+            deps = []
+            for expansion in symbol.expansions:
+                for code in expansion.codes:
+                    if code >= 0:
+                        symbol.first_bits |= 1 << code
+                        break
+                    deps.append(~code)
+                    if not symbols[~code].is_nullable():
+                        break
+            edges.append(deps)
+
+        return edges
+
+    def _propagate(self, sets, edges):
+        """Propagate
+
+        Solves the inclusions `sets[a] >= sets[b]` for every edge from `a` to
+        `b` in place, where `sets` is a list of terminal bitsets indexed by
+        symbol and `edges` a list of the successors of each symbol. The
+        dependency graph is split into strongly connected components which
+        are settled one at a time in reverse topological order, so each
+        component only ever reads final values from the components below it.
+        Within a component a worklist re-evaluates only the nodes with a
+        successor that has changed.
+
+        The number of evaluations and set unions are reported to `stats`.
+        """
+
+        iterations = self.iterations
+        unions = 0
+
+        nodes = range(len(sets))
+        for component in _strongly_connected_components(nodes, edges):
+            members = set(component)
+            preds = dict((node, []) for node in component)
+            for node in component:
+                for succ in edges[node]:
+                    if succ in members:
+                        preds[succ].append(node)
+
+            worklist = list(component)
+            queued = set(component)
+            while worklist:
+                node = worklist.pop()
+                queued.discard(node)
+                self.iterations += 1
+
+                value = sets[node]
+                unions += len(edges[node])
+                for succ in edges[node]:
+                    value = value | sets[succ]
+                if value == sets[node]:
+                    continue
+
+                sets[node] = value
+                for pred in preds[node]:
+                    if pred not in queued:
+                        queued.add(pred)
+                        worklist.append(pred)
+
+        stats.count("iterations", self.iterations - iterations)
+        stats.count("unions", unions)
 
     def _compute_sets_for_expansions(self):
         """Compute Sets for Expansions
     
-        Iteratively computes the first and follow sets for the grammar. Will
-        raise a GrammarError if one of the expansions attempts to use an
-        undefined terminal or nonterminal or if an expansion is defined for a
-        terminal.
+        Computes the nullability, the first and follow sets and the predict
+        set of each expansion for the grammar. Will raise a GrammarError if
+        one of the expansions attempts to use an undefined terminal or
+        nonterminal or if an expansion is defined for a terminal.
+
+        The number of symbol evaluations needed to reach a fixed point is
+        recorded in `iterations`.
         """
     
         self._initialise_expansions_state()
-        
-        # If we don't have any expansions then we don't need to loop
-        changed = len(self.expansions)
-        
-        while changed:
-            changed = False
+        with stats.phase("analysis.nullable"):
+            self._compute_nullable()
+
+        symbols = self.symbol_table.symbols
+
+        with stats.phase("analysis.first"):
+            edges = self._first_dependencies()
+            first = [symbol.first_bits for symbol in symbols]
+            self._propagate(first, edges)
+            for symbol, bits in zip(symbols, first):
+                symbol.first_bits = bits
+
+        with stats.phase("analysis.follow"):
+            edges = [[] for _ in symbols]
+            if self.start is not None:
+                end = self.header.terminal_table.index(END_OF_INPUT)
+                self.start.follow_bits |= 1 << end
+            for index, symbol in enumerate(symbols):
+                for expansion in symbol.expansions:
+                    self._update_follow_from_expansion(index, expansion, edges)
+
+            follow = [symbol.follow_bits for symbol in symbols]
+            self._propagate(follow, edges)
+            for symbol, bits in zip(symbols, follow):
+                symbol.follow_bits = bits
+
+        with stats.phase("analysis.predict"):
             for symbol, expansion in self._each_expansion():
-                r = self._update_first_from_expansion(symbol, expansion)
-                s = self._update_follow_from_expansion(symbol, expansion)
-                # Changed accumulates 'trueness' with changes
-                changed |= r or s
+                expansion.predict_bits = expansion.first_bits
+                if expansion.nullable_from == 0:
+                    expansion.predict_bits |= symbol.follow_bits
+
+def _strongly_connected_components(nodes, edges):
+    """Strongly Connected Components
+
+    Iterative form of Tarjan's algorithm. Yields each strongly connected
+    component of the graph described by the `edges` mapping as a list of
+    nodes. Components are yielded in reverse topological order: a component
+    comes after every component that it has an edge to.
+    """
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    yield component
@@ -0,0 +1,248 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import collections
+
+from parsegen.data import Symbol
+from parsegen.grammar import Grammar
+from parsegen.utils import Struct, switched_on
+from parsegen import stats
+
+def optimise(grammar):
+	"""Optimise
+	
+	Returns a grammar that parses the same language as `grammar`, analysed
+	and ready to write, with less for the generated parser to do:
+	
+	 * Symbols that can't be reached from the start symbol are removed.
+	 * Unit rules of the form `a := b` are collapsed by giving `a` the
+	   expansions of `b`, so parsing `a` no longer calls the function for
+	   `b`. This is only done where it copies no more than one expansion:
+	   if `b` has a single expansion or this is the only place it is used.
+	 * Expansions of a symbol that start with the same tokens are left
+	   factored. The shared prefix is parsed once, then a continuation
+	   symbol picks the expansion from the tokens that follow it.
+	
+	The semantic actions called stay those of the grammar as written, with
+	the same arguments. Each expansion records the action it calls and the
+	unit rules its value passes through, and continuations are given the
+	values of the prefix parsed before them.
+	
+	The new grammar has `optimisation` set to a `Struct` reporting its size
+	against the original one.
+	"""
+	
+	if grammar.start is None:
+		return grammar
+	
+	with stats.phase("optimise"):
+		start = grammar.start.name
+		rules = collections.OrderedDict()
+		for symbol in grammar.expansions.values():
+			rules[symbol.name] = [
+				Struct(tokens=e.tokens, action=e.action, wrappers=e.wrappers)
+				for e in symbol.expansions
+			]
+		prefixes = dict(
+			(symbol.name, symbol.prefix)
+			for symbol in grammar.expansions.values() if symbol.prefix)
+		
+		before = _size(rules)
+		unreachable = _prune(rules, start)
+		collapsed = _collapse_units(rules, start)
+		# Symbols only used by the unit rules collapsed are unreachable now
+		unreachable += _prune(rules, start)
+		factored = 0
+		for name in list(rules):
+			factored += _left_factor(rules, prefixes, name,
+									 grammar.header.terminals)
+		after = _size(rules)
+		
+		expansions = collections.OrderedDict()
+		for name, symbol_rules in rules.items():
+			symbol = expansions[name] = Symbol(name)
+			symbol.prefix = prefixes.get(name, ())
+			for rule in symbol_rules:
+				symbol.add_expansion(rule.tokens)
+				expansion = symbol.expansions[-1]
+				if rule.action != name:
+					expansion.action = rule.action
+				expansion.wrappers = tuple(rule.wrappers)
+	
+	optimised = Grammar(grammar.header, expansions, grammar.user_code)
+	optimised.optimisation = Struct(
+		before=before, after=after, unreachable=unreachable,
+		collapsed=collapsed, factored=factored)
+	return optimised
+
+def enabled(header):
+	"""Enabled
+	
+	Returns True if the header of a grammar turns optimisation on with the
+	`optimize` option. The option can be given without a value.
+	"""
+	
+	return switched_on(header.options.get("optimize"))
+
+def summary(report):
+	"""Summary
+	
+	Describes the `optimisation` report of a grammar in one line.
+	"""
+	
+	sizes = ", ".join(
+		"{0} {1} -> {2}".format(name, getattr(report.before, name),
+								getattr(report.after, name))
+		for name in ("symbols", "expansions", "tokens"))
+	return "parsegen: optimise: {0} ({1} unreachable removed, {2} unit " \
+		"rules collapsed, {3} prefixes factored)\n".format(
+			sizes, report.unreachable, report.collapsed, report.factored)
+
+def _size(rules):
+	return Struct(
+		symbols=len(rules),
+		expansions=sum(len(r) for r in rules.values()),
+		tokens=sum(len(e.tokens) for r in rules.values() for e in r))
+
+def _prune(rules, start):
+	"""Prune
+	
+	Removes the symbols that can't be reached from `start` and returns how
+	many there were.
+	"""
+	
+	reached = set([start])
+	pending = [start]
+	while pending:
+		for rule in rules[pending.pop()]:
+			for token in rule.tokens:
+				if token in rules and token not in reached:
+					reached.add(token)
+					pending.append(token)
+	
+	unreachable = [name for name in rules if name not in reached]
+	for name in unreachable:
+		del rules[name]
+	return len(unreachable)
+
+def _collapse_units(rules, start):
+	"""Collapse Units
+	
+	Replaces each unit rule `a := b` with the expansions of `b`, where that
+	copies at most one expansion, and returns how many were replaced. Each
+	copied expansion still calls the action of `b` and passes the value to
+	the action of the unit rule. Expansions copied from a unit rule are
+	collapsed in turn, stopping at any symbol already on the chain so that
+	cycles of unit rules are left alone.
+	
+	A unit rule `a := b` is kept when another expansion of `a` starts with
+	`b`, as in `e := t PLUS e` and `e := t`. Left factoring then gives the
+	two a continuation after `t`, where collapsing would replace `t` with
+	its expansions and leave nothing to factor.
+	"""
+	
+	uses = collections.Counter(
+		token for symbol_rules in rules.values()
+		for rule in symbol_rules for token in rule.tokens)
+	collapsed = 0
+	
+	for name in rules:
+		shared = set(
+			rule.tokens[0] for rule in rules[name] if len(rule.tokens) > 1)
+		done = []
+		pending = [(rule, (name,)) for rule in reversed(rules[name])]
+		while pending:
+			rule, chain = pending.pop()
+			inner = rule.tokens[0] if len(rule.tokens) == 1 else None
+			if inner not in rules or inner in chain or inner == start or \
+					inner in shared or \
+					(uses[inner] > 1 and len(rules[inner]) > 1):
+				done.append(rule)
+				continue
+			
+			collapsed += 1
+			wrappers = (rule.action or name,) + tuple(rule.wrappers)
+			for copied in reversed(rules[inner]):
+				pending.append((Struct(
+					tokens=copied.tokens, action=copied.action or inner,
+					wrappers=tuple(copied.wrappers) + wrappers),
+					chain + (inner,)))
+		rules[name] = done
+	
+	return collapsed
+
+def _left_factor(rules, prefixes, name, terminals):
+	"""Left Factor
+	
+	Gives each group of expansions of `name` that start with the same token
+	a continuation that parses the rest of them after their longest common
+	prefix, and factors the continuations in turn. Returns the number of
+	prefixes factored.
+	"""
+	
+	symbol_rules = rules[name]
+	firsts = collections.Counter(r.tokens[0] for r in symbol_rules if r.tokens)
+	if all(count == 1 for count in firsts.values()):
+		return 0
+	
+	factored = 0
+	result = []
+	done = set()
+	for rule in symbol_rules:
+		first = rule.tokens[0] if rule.tokens else None
+		if firsts[first] < 2:
+			result.append(rule)
+			continue
+		if first in done:
+			continue
+		done.add(first)
+		
+		group = [r for r in symbol_rules if r.tokens[:1] == [first]]
+		common = group[0].tokens
+		for other in group[1:]:
+			length = 0
+			while length < min(len(common), len(other.tokens)) and \
+					common[length] == other.tokens[length]:
+				length += 1
+			common = common[:length]
+		
+		tail = _continuation_name(name, rules, terminals)
+		prefixes[tail] = tuple(prefixes.get(name, ())) + tuple(common)
+		rules[tail] = [
+			Struct(tokens=r.tokens[len(common):], action=r.action or name,
+				   wrappers=r.wrappers)
+			for r in group
+		]
+		result.append(Struct(tokens=common + [tail], action=None,
+							 wrappers=()))
+		factored += 1 + _left_factor(rules, prefixes, tail, terminals)
+	
+	rules[name] = result
+	return factored
+
+def _continuation_name(name, rules, terminals):
+	tail = name + "_tail"
+	count = 1
+	while tail in rules or tail in terminals:
+		count += 1
+		tail = "{0}_tail{1}".format(name, count)
+	return tail
@@ -27,20 +27,68 @@ from parsegen.utils import Struct
 from parsegen.version import VERSION
 import parsegen.parse
 
-def parse(args):
+def parser():
+    """Parser
+
+    Returns the argument parser for the command line. The input and output
+    files are left as paths so that batch jobs can share the same arguments.
+    """
 
     # Using argparse to get all the options, not that there are many
     parser = argparse.ArgumentParser(description="LL(1) parser generator")
     parser.add_argument('-o', '--output',
-                        help="File to write the generated grammar to.",
-                        type=argparse.FileType('w'),
-                        metavar='FILE',
-                        default=sys.stdout)
+                        help="File to write the generated grammar to. In " \
+                        "batch mode, the directory to write the parsers to.",
+                        metavar='FILE')
     parser.add_argument('-l', '--language',
-                        help="The language to use to generate the parser.")
+                        help="The language to use to generate the parser. " \
+                        "A comma separated list writes a parser for each " \
+                        "language into the directory given by -o.")
+    parser.add_argument('--conflicts',
+                        help="Report LL(1) conflicts in the grammar instead " \
+                        "of generating a parser. Exits with a non-zero " \
+                        "status if any are found.",
+                        choices=['text', 'json'])
+    parser.add_argument('-O', '--optimize',
+                        help="Prune, collapse and left factor the grammar " \
+                        "before generating the parser, as the optimize " \
+                        "option in the grammar does.",
+                        action='store_true')
+    parser.add_argument('--no-cache',
+                        help="Always analyse the grammar, instead of " \
+                        "reusing an earlier analysis from the cache.",
+                        dest='cache', action='store_false')
+    parser.add_argument('-M', '--depfile',
+                        help="Write the files that the parser depends on " \
+                        "to FILE as a makefile rule, for make or ninja.",
+                        metavar='FILE')
+    parser.add_argument('--check',
+                        help="Do nothing if the output was generated by " \
+                        "the same command from the same inputs and hasn't " \
+                        "changed since.",
+                        action='store_true')
+    parser.add_argument('--stats',
+                        help="Print the time spent in each phase and the " \
+                        "peak memory used to standard error.",
+                        action='store_true')
+    parser.add_argument('--profile',
+                        help="Profile the run and write the cProfile " \
+                        "statistics to FILE.",
+                        metavar='FILE')
+    parser.add_argument('--batch',
+                        help="Generate a parser for each of the input files.",
+                        action='store_true')
+    parser.add_argument('--manifest',
+                        help="Run the jobs listed in a manifest file, one " \
+                        "set of command line arguments per line.",
+                        metavar='FILE', action='append', default=[])
+    parser.add_argument('-j', '--jobs',
+                        help="Number of processes to use in batch mode. " \
+                        "Defaults to the number of processors.",
+                        type=int)
     parser.add_argument('file',
                         help="Input grammar file",
-                        type=argparse.FileType('r'))
+                        nargs='?')
     parser.add_argument('options',
                         help="option=value pairs to override values " \
                         "specified in the grammar",
@@ -49,12 +97,62 @@ def parse(args):
                         help="Print out the version information",
                         version="Parsegen version {0}".format(VERSION))
     
-    options = parser.parse_args(args)
+    return parser
+
+def options_dict(pairs):
+    """Options Dict
 
-    options_dict = {}
-    for opt in options.options:
+    Converts a list of option=value pairs into a `dict`.
+    """
+
+    options = {}
+    for opt in pairs:
         opt, val = parsegen.parse.parse_option(opt)
-        options_dict[opt] = val
+        options[opt] = val
+    return options
+
+def parse(args):
+    """Parse
+
+    Parses the command line. Unless running in batch mode the input file
+    is opened. `output_file` is standard out unless an output file is
+    given, in which case it is None and `output` holds the path.
+    """
+
+    args_parser = parser()
+    options = args_parser.parse_args(args)
+    batch = options.batch or bool(options.manifest)
+
+    grammars = []
+    pairs = options.options
+    if options.file is not None:
+        pairs = [options.file] + pairs
+    if batch:
+        # Any argument that isn't an option=value pair is another grammar
+        grammars = [p for p in pairs if "=" not in p]
+        pairs = [p for p in pairs if "=" in p]
+    elif pairs:
+        grammars, pairs = pairs[:1], pairs[1:]
+
+    if not batch and not grammars:
+        args_parser.error("the following arguments are required: file")
+
+    # The output file is only replaced once the parser has been generated,
+    # and left alone if it hasn't changed, so it isn't opened here
+    input_file, output_file = None, None
+    if not batch:
+        try:
+            input_file = argparse.FileType('r')(grammars[0])
+        except argparse.ArgumentTypeError as e:
+            args_parser.error(str(e))
+        if not options.output or options.output == '-':
+            output_file = sys.stdout
 
-    return Struct(output_file=options.output, input_file=options.file,
-                  options=options_dict, language=options.language)
+    return Struct(output_file=output_file, input_file=input_file,
+                  options=options_dict(pairs), language=options.language,
+                  conflicts=options.conflicts, cache=options.cache,
+                  batch=batch, grammars=grammars, output=options.output,
+                  manifests=options.manifest, jobs=options.jobs,
+                  stats=options.stats, profile=options.profile,
+                  depfile=options.depfile, check=options.check,
+                  optimize=options.optimize or None)
@@ -20,13 +20,27 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import hashlib
+import importlib
+import os
+import stat
 import sys
 import re
+import tempfile
+from parsegen.errors import ParsegenError
 from parsegen.utils import lazyprop, Struct
+from parsegen import stats
 
-# Dict indexed by uppercase comon name for language
+# Dict indexed by uppercase comon name for language. Values are either the
+# formatter class or, until the language is first used, a string naming the
+# module and class that implement it.
 language_hash = {}
 
+# Entry point group that other packages can use to provide languages
+ENTRY_POINT_GROUP = "parsegen.formatters"
+
+_entry_points_loaded = False
+
 def write_grammar(grammar, file=sys.stdout, options=None, language=None):
 	"""Write Grammar
 	
@@ -34,23 +48,238 @@ def write_grammar(grammar, file=sys.stdout, options=None, language=None):
 	the given grammar.
 	"""
 
+	fmt = find_formatter(grammar, language)
+	with stats.phase("output"):
+		fmt(grammar, options).write(file)
+
+def write_grammar_file(grammar, path, options=None, language=None):
+	"""Write Grammar File
+	
+	Writes the program for the grammar to the file at `path` as UTF-8, but
+	only if it differs from what the file already holds. The output is
+	streamed into a temporary file next to the target, as it is rendered,
+	and `replace_with` only puts it in place if its contents changed. The
+	file is never seen half written and its modification time only changes
+	along with its contents. Returns True if the file was written.
+	"""
+	
+	return replace_with(path, lambda file: write_grammar(
+		grammar, file, options, language))
+
+def write_grammar_files(grammar, targets, options=None, workers=None):
+	"""Write Grammar Files
+	
+	Writes the grammar out in several languages at once. `targets` is a list
+	of pairs of language and path, each written with `write_grammar_file`.
+	The grammar is analysed once and formatters only read it, so the outputs
+	are rendered concurrently by a pool of up to `workers` threads, one per
+	target by default. Returns a list saying whether each file was written.
+	
+	Statistics are only collected from the calling thread, so the pool is
+	timed as a single `output` phase.
+	"""
+	
+	if len(targets) < 2 or workers == 1:
+		return [write_grammar_file(grammar, path, options, language)
+				for language, path in targets]
+	
+	from concurrent.futures import ThreadPoolExecutor
+	
+	with stats.phase("output"), \
+			ThreadPoolExecutor(workers or len(targets)) as pool:
+		futures = [
+			pool.submit(write_grammar_file, grammar, path, options, language)
+			for language, path in targets
+		]
+		return [future.result() for future in futures]
+
+class _DigestFile(object):
+	"""Digest File
+	
+	Wraps a binary file, writing text to it as UTF-8 and keeping the size and
+	SHA-256 digest of everything written.
+	"""
+	
+	def __init__(self, file):
+		self.file = file
+		self.digest = hashlib.sha256()
+		self.size = 0
+	
+	def write(self, data):
+		if isinstance(data, str):
+			data = data.encode("utf-8")
+		self.file.write(data)
+		self.digest.update(data)
+		self.size += len(data)
+		return len(data)
+
+def _file_digest(path):
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(64 * 1024), b""):
+			digest.update(chunk)
+	return digest.digest()
+
+def replace_with(path, write):
+	"""Replace With
+	
+	Calls `write` with a file to write the new contents of the file at
+	`path` to, and replaces the file with them unless its size and hash show
+	it already holds them. The contents go straight to a temporary file in
+	the same directory, given the permissions of the file it replaces, which
+	is then renamed over it or removed. A symlink at `path` is followed, so
+	the file it points to is replaced and the link kept. Returns True if the
+	file was written.
+	"""
+	
+	target = os.path.realpath(path)
+	try:
+		info = os.stat(target)
+	except OSError:
+		info = None
+	
+	if info is not None:
+		mode = stat.S_IMODE(info.st_mode)
+	else:
+		mask = os.umask(0)
+		os.umask(mask)
+		mode = 0o666 & ~mask
+	
+	directory, name = os.path.split(target)
+	try:
+		fd, temp = tempfile.mkstemp(dir=directory or ".", prefix="." + name,
+									suffix=".tmp")
+	except OSError as e:
+		# Report the file being written rather than the temporary one
+		e.filename = path
+		raise
+	try:
+		with os.fdopen(fd, "wb") as f:
+			out = _DigestFile(f)
+			write(out)
+		
+		with stats.phase("output.replace"):
+			if info is not None and info.st_size == out.size and \
+					_file_digest(target) == out.digest.digest():
+				os.remove(temp)
+				return False
+			os.chmod(temp, mode)
+			os.replace(temp, target)
+	except BaseException:
+		try:
+			os.remove(temp)
+		except OSError:
+			pass
+		raise
+	return True
+
+def replace_if_changed(path, data):
+	"""Replace if Changed
+	
+	Replaces the file at `path` with the bytes `data` unless it already
+	holds them, as `replace_with` does. Returns True if the file was written.
+	"""
+	
+	return replace_with(path, lambda file: file.write(data))
+
+def split_languages(language):
+	"""Split Languages
+	
+	Returns the list of languages named by `language`, which may be a comma
+	separated list such as `c,ruby`. A language that isn't given is left as
+	None so the grammar can choose it.
+	"""
+	
+	if not language:
+		return [language]
+	return [name.strip() for name in language.split(",")]
+
+def find_formatter(grammar, language=None):
+	"""Find Formatter
+	
+	Returns the formatter class for `language`, or for the language named in
+	the grammar if none is given. The module implementing the language is
+	imported the first time it is asked for. Languages that aren't built in
+	are looked for in the `parsegen.formatters` entry points.
+	"""
+	
 	if not language:
 		language = grammar.header.options.get("language", "pretty_print")
-	fmt = language_hash[_normalise_language_name(language)]
-	fmt(grammar, options).write(file)
+	name = _normalise_language_name(language)
+	if name not in language_hash:
+		_load_entry_points()
+	
+	try:
+		formatter = language_hash[name]
+	except KeyError:
+		raise ParsegenError("argument error",
+							"unknown language {0}".format(language))
+	
+	if isinstance(formatter, str):
+		formatter = language_hash[name] = _import_formatter(formatter)
+	return formatter
 	
 def _normalise_language_name(name):
 	return re.sub("[\-_\ ]", "-", name.strip()).upper()
 	
 def register_formatter(language, formatter):
+	"""Register Formatter
+	
+	Makes a formatter available as `language`. The formatter is either a
+	class or a string of the form `module:Class`, in which case the module is
+	only imported when the language is used.
+	"""
+	
 	language_hash[_normalise_language_name(language)] = formatter
 
+def _import_formatter(path):
+	"""Import Formatter
+	
+	Imports the formatter class named by a `module:Class` string.
+	"""
+	
+	module, _, name = path.partition(":")
+	try:
+		return getattr(importlib.import_module(module), name)
+	except (ImportError, AttributeError) as e:
+		raise ParsegenError("argument error",
+							"can't load formatter {0}: {1}".format(path, e))
+
+def _load_entry_points():
+	"""Load Entry Points
+	
+	Registers the languages provided by installed packages. Built in
+	languages take precedence. The entry points are only read once.
+	"""
+	
+	global _entry_points_loaded
+	if _entry_points_loaded:
+		return
+	_entry_points_loaded = True
+	
+	try:
+		from importlib.metadata import entry_points
+	except ImportError:
+		return
+	
+	try:
+		found = entry_points(group=ENTRY_POINT_GROUP)
+	except TypeError:
+		found = entry_points().get(ENTRY_POINT_GROUP, [])
+	
+	for entry in found:
+		if _normalise_language_name(entry.name) not in language_hash:
+			register_formatter(entry.name, entry.value)
+
 class OutputFormatter(object):
 	"""Output Formatter
 	
 	Represents the formatter required to write a grammar out to a file.
 	"""
 	
+	# File extension used for the output when it is named automatically
+	extension = "txt"
+	
 	def __init__(self, grammar, option_overrides=None):
 		self.grammar = grammar
 		self.option_definitions = []
@@ -69,10 +298,27 @@ class OutputFormatter(object):
 		# The code require to access the type of a token, useful if tokens
 		# are pointer types.
 		self.register_option("token_type_access", "")
+		# The value the lexer returns at the end of the input
+		self.register_option("end_token", "0")
 	
 	def register_option(self, option_name, default="", prefix=False):
 		self.option_definitions.append((option_name, default, prefix))
 	
+	def dependencies(self):
+		"""Dependencies
+		
+		Returns the paths of the files, other than the grammar, that the
+		output depends on. These are the modules implementing the formatter
+		and its base classes. Formatters that read other files add them.
+		"""
+		
+		paths = []
+		for cls in type(self).__mro__:
+			path = getattr(sys.modules.get(cls.__module__), "__file__", None)
+			if path and path not in paths:
+				paths.append(path)
+		return paths
+	
 	@lazyprop
 	def options(self):
 		"""Options
@@ -103,6 +349,15 @@ class OutputFormatter(object):
 			opts.update(options_merge)
 		return opts
 
-# Import all the languages here. This is done at the bottom to ensure that all
-# the definitions needed are in scope
-from . import c, pretty_print, ruby
+# The built in languages. Each module is imported the first time its language
+# is used.
+register_formatter("c", "parsegen.output.c:COutputFormatter")
+register_formatter("c-table",
+				   "parsegen.output.c_table:CTableOutputFormatter")
+register_formatter("conflicts",
+				   "parsegen.output.conflicts:ConflictsFormatter")
+register_formatter("conflicts-json",
+				   "parsegen.output.conflicts:JSONConflictsFormatter")
+register_formatter("pretty_print",
+				   "parsegen.output.pretty_print:PrettyPrintFormatter")
+register_formatter("ruby", "parsegen.output.ruby:RubyFormatter")
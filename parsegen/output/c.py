@@ -20,8 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from parsegen.output import register_formatter
 from parsegen.output.mustache import MustacheFormatter
+from parsegen.utils import lazyprop, switched_on
 	
 class COutputFormatter(MustacheFormatter):
 	"""C Output Formatter
@@ -29,7 +29,43 @@ class COutputFormatter(MustacheFormatter):
 	Represents the formatter required to write out to a C file.
 	"""
 	
+	extension = "c"
+	
 	def __init__(self, *args):
 		MustacheFormatter.__init__(self, "c.mustache", *args)
-
-register_formatter("c", COutputFormatter)
+		# The smallest block of memory an arena takes from malloc
+		self.register_option("arena_chunk_size", default="65536")
+	
+	@lazyprop
+	def reentrant(self):
+		"""Reentrant
+		
+		True if the `reentrant` option is set. The parser then keeps all of
+		its state in a `parser_t` struct that is passed to every function,
+		including the semantic actions, so parses can run on many threads
+		at once.
+		"""
+		
+		return switched_on(self._raw_options.get("reentrant"))
+	
+	@lazyprop
+	def arena(self):
+		"""Arena
+		
+		True if the `arena` option is set. The parser then includes a bump
+		allocator, and each semantic action is passed the `arena_t` to build
+		its node in. The arena hands out memory from large chunks, and all
+		of it is given back at once after the parse.
+		"""
+		
+		return switched_on(self._raw_options.get("arena"))
+	
+	@property
+	def extra_arguments(self):
+		"""Extra Arguments
+		
+		True if the semantic actions are passed anything after the values of
+		their tokens.
+		"""
+		
+		return self.reentrant or self.arena
@@ -0,0 +1,156 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import sys
+
+from parsegen.output.mustache import MustacheFormatter
+from parsegen.table import ParseTable, int_type
+from parsegen.utils import lazyprop, switched_on
+
+class CTableOutputFormatter(MustacheFormatter):
+	"""C Table Output Formatter
+	
+	Writes out a table-driven C parser. Rather than one function per symbol
+	the parser is a single loop over an explicit stack that looks productions
+	up in a compressed LL(1) parse table. The size of the table is reported on
+	standard error when the parser is written.
+	"""
+	
+	extension = "c"
+	
+	def __init__(self, *args):
+		MustacheFormatter.__init__(self, "c_table.mustache", *args)
+		self.table = None
+		self.stats_file = sys.stderr
+	
+	@lazyprop
+	def push(self):
+		"""Push
+		
+		True if the `push` option is set. The parser is then driven by the
+		caller pushing tokens into it one at a time, rather than pulling them
+		from the lexer, and keeps its stacks in a `push_parser_t` between
+		tokens.
+		"""
+		
+		return switched_on(self._raw_options.get("push"))
+	
+	def dependencies(self):
+		table = sys.modules[ParseTable.__module__].__file__
+		return MustacheFormatter.dependencies(self) + [table]
+	
+	def _update_state(self):
+		self.table = table = ParseTable(self.grammar)
+		compressed = table.compressed
+		n_terms = len(table.terminals)
+		n_nonterms = len(table.nonterminals)
+		
+		self.terminal_count = n_terms
+		self.symbol_count = n_nonterms
+		self.columns = [
+			{'value' : self._prediction(name), 'index' : index}
+			for index, name in enumerate(table.terminals)
+		]
+		# Continuations have no lambda transition, their caller's values
+		# are already on the stack
+		self.nonterminals = [
+			{'name' : symbol.name, 'index' : index,
+			 'nullable' : symbol.is_nullable() and not symbol.prefix}
+			for index, symbol in enumerate(table.nonterminals)
+		]
+		
+		# Stack codes: terminals, then nonterminals, then production markers.
+		# A production takes the values of its own tokens off the stack,
+		# after those of the prefix if it belongs to a continuation. One
+		# that ends with a continuation passes on the continuation's value.
+		rhs, rhs_start, rhs_len, args_len = [], [], [], []
+		self.productions = []
+		for index, expansion in enumerate(table.productions):
+			rhs_start.append(len(rhs))
+			rhs_len.append(len(expansion.codes))
+			args_len.append(
+				1 if expansion.continues else len(expansion.arguments))
+			for code in expansion.codes:
+				rhs.append(code if code >= 0 else n_terms + ~code)
+			production = self._transform_expansion(expansion)
+			production['index'] = index
+			if production['action']:
+				for position, arg in enumerate(production['action']['args']):
+					arg['position'] = position
+			self.productions.append(production)
+		
+		self.arrays = [
+			self._array("table_entry", compressed.entry),
+			self._array("table_check", compressed.check),
+			self._array("table_base", compressed.base),
+			self._array("table_row", compressed.row_map),
+			self._array("production_base", table.production_base),
+			self._array("nullable",
+						[int(s['nullable']) for s in self.nonterminals]),
+			self._array("rhs", rhs),
+			self._array("rhs_start", rhs_start),
+			self._array("rhs_len", rhs_len),
+		]
+		
+		# Only optimised grammars take a different number of values off the
+		# stack to the number of tokens pushed
+		self.args_array = "rhs_len"
+		if args_len != rhs_len:
+			self.args_array = "args_len"
+			self.arrays.append(self._array("args_len", args_len))
+		self.table_size = len(compressed.entry)
+		self.marker_base = n_terms + n_nonterms
+		
+		self._write_stats()
+	
+	def _array(self, name, values):
+		"""Array
+		
+		Returns the template context for a constant C array, using the
+		smallest integer type that can hold the values.
+		"""
+		
+		lines = []
+		for i in range(0, len(values), 16):
+			lines.append(", ".join(str(v) for v in values[i:i + 16]))
+		
+		return {
+			'name' : name,
+			'type' : int_type(values),
+			'size' : max(len(values), 1),
+			'values' : ",\n\t".join(lines) or "0"
+		}
+	
+	def _write_stats(self):
+		"""Write Stats
+		
+		Reports the size of the parse table, before and after compression.
+		"""
+		
+		stats = self.table.stats
+		self.stats_file.write(
+			"parsegen: c-table: {0} rows ({1} unique) x {2} terminals, "
+			"{3} of {4} entries packed into {5} "
+			"({6} bytes, dense {7} bytes)\n".format(
+				stats.nonterminals, stats.unique_rows, stats.terminals,
+				stats.entries, stats.dense_entries, stats.packed_entries,
+				stats.packed_bytes, stats.dense_bytes))
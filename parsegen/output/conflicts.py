@@ -0,0 +1,81 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import json
+
+from parsegen.output import OutputFormatter
+
+class ConflictsFormatter(OutputFormatter):
+	"""Conflicts Formatter
+	
+	Prints out a human readable report of the LL(1) conflicts in the grammar.
+	"""
+	
+	def write(self, file):
+		"""Write
+		
+		Writes one entry for each pair of expansions with overlapping predict
+		sets, followed by a count of the conflicts found.
+		"""
+		
+		conflicts = self.grammar.conflicts()
+		for conflict in conflicts:
+			symbol = self.grammar.expansions[conflict.symbol]
+			file.write("CONFLICT IN SYMBOL %s {\n" % conflict.symbol)
+			for index in conflict.expansions:
+				tokens = symbol.expansions[index].tokens
+				file.write("  %d ~> %s\n" % (index, ", ".join(tokens)))
+			file.write("  on {%s}\n" % ", ".join(conflict.terminals))
+			file.write("}\n\n")
+		file.write("%d conflicts\n" % len(conflicts))
+
+class JSONConflictsFormatter(OutputFormatter):
+	"""JSON Conflicts Formatter
+	
+	Writes the LL(1) conflicts in the grammar as a JSON document so that they
+	can be checked by other tools.
+	"""
+	
+	extension = "json"
+	
+	def write(self, file):
+		"""Write
+		
+		Writes an object with a `conflicts` list, each entry giving the symbol,
+		the two expansions and the overlapping terminals, and their `count`.
+		"""
+		
+		conflicts = []
+		for conflict in self.grammar.conflicts():
+			symbol = self.grammar.expansions[conflict.symbol]
+			conflicts.append({
+				'symbol' : conflict.symbol,
+				'expansions' : [
+					{'index' : i, 'tokens' : list(symbol.expansions[i].tokens)}
+					for i in conflict.expansions
+				],
+				'terminals' : conflict.terminals
+			})
+		
+		json.dump({'conflicts' : conflicts, 'count' : len(conflicts)}, file,
+				  indent=2, sort_keys=True)
+		file.write("\n")
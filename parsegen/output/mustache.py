@@ -21,9 +21,114 @@
 # THE SOFTWARE.
 
 from parsegen.output import OutputFormatter
+from parsegen.data import UserCode
 from parsegen.utils import lazyprop, Struct
+from parsegen import stats
 import pystache
+try:
+	# Streaming walks the parse tree of pystache's templates, which isn't
+	# part of its public interface. It was written against pystache 0.6.
+	from pystache.parsed import ParsedTemplate
+	from pystache.parser import _LiteralNode, _SectionNode
+except ImportError:
+	ParsedTemplate = object
+	_LiteralNode = _SectionNode = None
 import os
+import threading
+import weakref
+
+# Parsed templates shared by every formatter in the process. Maps the path of
+# each template to the modification time of the file and the parsed template.
+_template_cache = {}
+
+def _load_template(path):
+	"""Load Template
+	
+	Returns the parsed template at `path`. Templates are only read and parsed
+	again if the file has been modified since it was last loaded.
+	"""
+	
+	mtime = os.stat(path).st_mtime_ns
+	cached = _template_cache.get(path)
+	if cached and cached[0] == mtime:
+		return cached[1]
+	
+	with open(path) as f:
+		parsed = pystache.parse(f.read())
+	_template_cache[path] = (mtime, parsed)
+	return parsed
+
+# Template views of the symbols of each grammar, shared by every formatter that
+# writes it. Maps each grammar to a dict of the views built from it, keyed by
+# the grammar's version and whatever else the view depends on.
+_view_cache = weakref.WeakKeyDictionary()
+_view_lock = threading.Lock()
+
+class _StreamingTemplate(ParsedTemplate):
+	"""Streaming Template
+	
+	Wraps a parsed template so that rendering it writes each piece of output
+	to a file as soon as it is ready, rather than joining the whole output
+	into one string. Sections are expanded here one item at a time, so only
+	the output for a single symbol is ever held in memory, and user code is
+	copied straight from the grammar file.
+	
+	This relies on the private `_parse_tree` of pystache's `ParsedTemplate`
+	and on its node classes, as laid out in pystache 0.6. `streaming`
+	checks that a template has them.
+	"""
+	
+	def __init__(self, parsed, file):
+		ParsedTemplate.__init__(self)
+		self.parsed = parsed
+		self.file = file
+	
+	@staticmethod
+	def streaming(parsed):
+		"""Streaming
+		
+		Returns True if the installed pystache lets `parsed` be streamed.
+		"""
+		
+		return _SectionNode is not None and \
+			isinstance(getattr(parsed, "_parse_tree", None), list)
+	
+	def render(self, engine, stack):
+		self._write_nodes(self.parsed._parse_tree, engine, stack)
+		return ""
+	
+	def _write_nodes(self, nodes, engine, stack):
+		for node in nodes:
+			if isinstance(node, str):
+				self.file.write(node)
+			elif isinstance(node, _SectionNode):
+				self._write_section(node, engine, stack)
+			elif isinstance(node, _LiteralNode):
+				self._write_literal(node, engine, stack)
+			else:
+				self.file.write(node.render(engine, stack))
+	
+	def _write_literal(self, node, engine, stack):
+		value = engine.resolve_context(stack, node.key)
+		
+		# User code is copied from the grammar file without decoding it all
+		if isinstance(value, UserCode):
+			value.write_to(self.file)
+		else:
+			self.file.write(node.render(engine, stack))
+	
+	def _write_section(self, node, engine, stack):
+		values = list(engine.fetch_section_data(stack, node.key))
+		
+		# Lambdas are given the raw section text, leave them to pystache
+		if any(callable(value) for value in values):
+			self.file.write(node.render(engine, stack))
+			return
+		
+		for value in values:
+			stack.push(value)
+			self._write_nodes(node.parsed._parse_tree, engine, stack)
+			stack.pop()
 	
 class MustacheFormatter(OutputFormatter):
 	"""Mustache Formatter
@@ -38,26 +143,116 @@ class MustacheFormatter(OutputFormatter):
 		self.symbols = None
 
 	def _update_state(self):
-		self.symbols = [
-			self._transform_symbol(symbol)
-			for symbol in self.grammar.expansions.values()
-		]
+		self.symbols = self._symbol_views()
+	
+	def _symbol_views(self):
+		"""Symbol Views
+		
+		Returns the list of symbols as the templates see them. Nothing in the
+		grammar is changed, so formatters can write the same grammar at once
+		from different threads. The views only depend on the end token and
+		the methods that build them, so formatters that agree on those share
+		one read-only list rather than each building their own.
+		"""
+		
+		cls = type(self)
+		key = (self.grammar.version, self.options.end_token,
+			   cls._transform_symbol, cls._transform_expansion,
+			   cls._transform_tokens, cls._transform_token, cls._prediction)
+		
+		with _view_lock:
+			views = _view_cache.setdefault(self.grammar, {})
+			if key not in views:
+				# Views of older versions of the grammar are no use now
+				for old in [k for k in views if k[0] != key[0]]:
+					del views[old]
+				views[key] = tuple(
+					self._transform_symbol(symbol)
+					for symbol in self.grammar.expansions.values())
+			return views[key]
 		
 	def _transform_symbol(self, symbol):
-
-		symbol.expansions = [
-			self._transform_expansion(e) for e in symbol.expansions if e]
-
-		return symbol
+		nonterminals, terminals = self._counts(symbol)
+		return {
+			'name' : symbol.name,
+			'is_nullable' : symbol.is_nullable(),
+			'continuation' : bool(symbol.prefix),
+			'loops' : any(e.tail_recursive for e in symbol.expansions),
+			'nonterminal_count' : nonterminals,
+			'terminal_count' : terminals,
+			'expansions' : [
+				dict(self._transform_expansion(e), number=number)
+				for number, e in enumerate(symbol.expansions)]
+		}
+	
+	def _counts(self, symbol):
+		"""Counts
+		
+		Returns the number of nonterminals and terminals that parsing the
+		symbol stores, as `Symbol.counts` does. Continuations store their
+		values alongside those of the prefix parsed before them, so a symbol
+		that uses one needs room for all of the continuation's arguments.
+		"""
+		
+		if not symbol.prefix and not any(
+				e.continues for e in symbol.expansions):
+			return symbol.counts
+		
+		codes = self.grammar.symbol_table.codes
+		node_count, term_count = 0, 0
+		for expansion in symbol.expansions:
+			if expansion.continues:
+				n, t = self._counts(
+					self.grammar.symbol_table.symbol(expansion.codes[-1]))
+			else:
+				t = sum(1 for name in expansion.arguments if codes[name] >= 0)
+				n = len(expansion.arguments) - t
+			node_count, term_count = max(node_count, n), max(term_count, t)
+		return node_count, term_count
 	
 	def _transform_expansion(self, exp):
-		return {
-			'predictions' : exp.predictions,
-			'tokens' : self._transform_tokens(exp.tokens)
+		symbol = exp.symbol
+		prefix = self.grammar.symbol_table.encode(symbol.prefix)
+		tokens = self._transform_tokens(
+			exp.codes, sum(1 for c in prefix if c >= 0),
+			sum(1 for c in prefix if c < 0))
+		view = {
+			'predictions' : [self._prediction(t) for t in exp.predict],
+			'tokens' : tokens,
+			'tail' : exp.tail_recursive
+		}
+		
+		# The loop parsing a tail recursive expansion stands in for its last
+		# token, so that token is not parsed on its own
+		if exp.tail_recursive:
+			tokens[-1]['recursion'] = True
+		
+		# An expansion ending with a continuation returns its value instead
+		# of calling an action
+		if exp.continues:
+			tokens[-1]['continuation'] = True
+			view['action'] = None
+			view['declarations'] = []
+			return view
+		
+		args = self._transform_tokens(prefix + exp.codes) if prefix else tokens
+		action = {
+			'name' : exp.action or symbol.name,
+			'args' : args,
+			'wrappers' : [{'name' : w} for w in reversed(exp.wrappers)]
 		}
+		view['action'] = action
+		view['declarations'] = [action] + [
+			{'name' : w, 'args' : [{'terminal' : False, 'last' : True}]}
+			for w in exp.wrappers
+		]
+		return view
 	
-	def _transform_tokens(self, tokens):
-		n, t = 0, 0
+	def _prediction(self, terminal):
+		return self.grammar.header.terminal_value(
+			terminal, self.options.end_token)
+	
+	def _transform_tokens(self, tokens, t=0, n=0):
 		token_list = []
 		for tok in tokens:
 			temp = self._transform_token(tok)
@@ -72,39 +267,54 @@ class MustacheFormatter(OutputFormatter):
 			token_list[-1]['last'] = True
 		return token_list
 	
-	def _transform_token(self, token):
-		terminal = token in self.grammar.header.terminals
+	def _transform_token(self, code):
+		terminal = code >= 0
 		if terminal:
+			token = self.grammar.symbol_table.name(code)
 			name =  self.grammar.header.terminals[token]
 			nullable = False
 		else:
-			name = token
-			nullable = self.grammar.expansions[token].is_nullable()
+			symbol = self.grammar.symbol_table.symbol(code)
+			name = symbol.name
+			nullable = symbol.is_nullable()
 		
 		return {
 			'name' : name,
 			'nullable' : nullable,
-			'terminal' : terminal
+			'terminal' : terminal,
+			'continuation' : False,
+			'recursion' : False
 		}
 	
-	def _read_template(self):
-		"""Read Template
+	def _template_path(self):
+		"""Template Path
 		
-		Reads the mustache template from the filesystem and returns it to be
-		processed.
+		Returns the path of the mustache template on the filesystem.
 		"""
 
 		path = os.path.join(os.path.dirname(__file__), self.template_file)
-		path = os.path.normpath(path)
-		with open(path) as f:
-			return f.read()
+		return os.path.normpath(path)
+	
+	def dependencies(self):
+		return OutputFormatter.dependencies(self) + [self._template_path()]
 	
 	def write(self, file):
 		"""Write
 		
-		Output the grammar to the file using a Mustache template.
+		Output the grammar to the file using a Mustache template. The parsed
+		template is shared between formatters and the output is written to
+		the file piece by piece as it is rendered. With a version of pystache
+		whose internals `_StreamingTemplate` doesn't know, the output is
+		rendered in one piece instead.
 		"""
 
-		self._update_state()
+		with stats.phase("output.state"):
+			self._update_state()
 		
-		file.write(pystache.render(self._read_template(), self))
+		with stats.phase("output.render"):
+			template = _load_template(self._template_path())
+			renderer = pystache.Renderer()
+			if _StreamingTemplate.streaming(template):
+				renderer.render(_StreamingTemplate(template, file), self)
+			else:
+				file.write(renderer.render(template, self))
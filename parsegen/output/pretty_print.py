@@ -20,7 +20,6 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from parsegen.output import register_formatter
 from parsegen.output.callback import CallbackOutputFormatter
 
 class PrettyPrintFormatter(CallbackOutputFormatter):
@@ -35,10 +34,11 @@ class PrettyPrintFormatter(CallbackOutputFormatter):
 	
 	def _output_symbol(self, symbol, file):
 		kind = "NULLABLE" if symbol.is_nullable() else "COMPULSORY"
+		header = self.grammar.header
 		file.write("%s SYMBOL %s {\n" % (kind, symbol.name))
 		for exp in symbol.expansions:
-			file.write("  {%s}\n" % ", ".join(exp.predictions))
+			predictions = header.terminal_values(
+				exp.predict_bits, self.options.end_token)
+			file.write("  {%s}\n" % ", ".join(predictions))
 			file.write("  ~> %s\n" % ", ".join(exp.tokens))
 		file.write("}\n\n")
-
-register_formatter("pretty_print", PrettyPrintFormatter)
@@ -20,17 +20,30 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from parsegen.output import register_formatter
 from parsegen.output.mustache import MustacheFormatter
+from parsegen.utils import lazyprop
 	
 class RubyFormatter(MustacheFormatter):
 	"""Ruby Formatter
 	
 	Outputs a grammar as an executable ruby program.
 	"""
+	
+	extension = "rb"
 
 	def __init__(self, *args):
 		MustacheFormatter.__init__(self, "ruby.mustache",  *args)
 		self.register_option("ruby_module", default="", prefix=False)
-
-register_formatter("ruby", RubyFormatter)
+	
+	@lazyprop
+	def buffer_class(self):
+		"""Buffer Class
+		
+		The name of the token buffer class. Ruby class names are constants,
+		so must start with a capital, which the default `yy_` prefix
+		doesn't. The prefix is turned into one by capitalising each of its
+		underscore separated words, giving `YyTokenBuffer`.
+		"""
+		
+		words = self.options.prefix.split("_")
+		return "".join(w[:1].upper() + w[1:] for w in words) + "TokenBuffer"
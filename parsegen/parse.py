@@ -20,61 +20,116 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import io
+import mmap
+import re
+
 from parsegen.errors import ParseError
-from parsegen.data import Header, Symbol
+from parsegen.data import Header, Symbol, UserCode
 from parsegen.grammar import Grammar
+from parsegen import stats
+
+# Matches one line of the header section, or the part of a line up to a
+# section separator. Comments are matched but not captured. A line ending in a
+# newline has the `eol` group set.
+_header_re = re.compile(r"""
+	[^\S\n]*
+	(?:
+		(?P<sep>%%)
+	|
+		(?P<text>[^\n\#%]*(?:%(?!%)[^\n\#%]*)*)
+		(?:\#[^\n]*)?
+		(?P<eol>\n)?
+	)""", re.X)
+
+# As above for the expansions section. Expansions are split into the `name`
+# and `tokens` of the expansion, anything else on a line is matched as `text`.
+_expansion_re = re.compile(r"""
+	[^\S\n]*
+	(?:
+		(?P<sep>%%)
+	|
+		(?:
+			(?P<name>(?:[^\s\#%:]|:(?!=))+)[^\S\n]*:=
+			(?P<tokens>[^\n\#%]*(?:%(?!%)[^\n\#%]*)*)
+		|
+			(?P<text>[^\n\#%]*(?:%(?!%)[^\n\#%]*)*)
+		)
+		(?:\#[^\n]*)?
+		(?P<eol>\n)?
+	)""", re.X)
+
+# The same expressions for scanning bytes
+_header_bytes_re = re.compile(_header_re.pattern.encode("ascii"), re.X)
+_expansion_bytes_re = re.compile(_expansion_re.pattern.encode("ascii"), re.X)
 
-def parse_buffer(buffer):
+# Types of buffer holding the bytes of a grammar file
+_byte_buffers = (bytes, bytearray, memoryview, mmap.mmap)
+
+def parse_buffer(buffer, optimize=None):
 	"""Parse Buffer
 	
-	Parse the given buffer and return a 3-tuple of the contents. The first
-	element of the tuple is a Header object representing the definitions
-	and options used, the second is a list of expansions and the third is a
-	string containing the contents of the user code section.
-	"""
+	Parse the given buffer and return a Grammar object. The buffer contains
+	three sections separated by `%%`: the header of definitions and options,
+	the grammar expansions and the user code. The user code is everything
+	after the second separator, so it may contain `%%` itself.
 	
-	try:
-		sects = buffer.split("%%")
-		header, expansions, user_code = sects
-	except ValueError:
-		raise ParseError("expected 3 sections but found {0}".format(len(sects)))
-		
-	# process the header section, to extract the options and stuff
-	header = _process_header(header)
+	The buffer is scanned once from start to finish. Errors raised while
+	scanning give the line and column they were found at.
 	
-	# now we can process the expansions
-	expansions = _process_expansions(expansions)
+	The buffer can be a string or any of `bytes`, `bytearray`, `memoryview`
+	or `mmap` holding UTF-8 text. Bytes are scanned in place and the user code
+	is kept as a `UserCode` range of the buffer rather than copied out.
+	
+	The grammar is passed through `parsegen.optimise` if `optimize` is true,
+	or if it is None and the grammar sets the `optimize` option.
+	"""
+	
+	with stats.phase("parse.scan"):
+		header, expansions, user_code = _scan(buffer)
 	
 	# Return the processed parts
-	return Grammar(header, expansions, user_code)
+	grammar = Grammar(header, expansions, user_code)
+	if optimize is None:
+		optimize = "optimize" in header.options and _optimise().enabled(header)
+	if optimize:
+		grammar = _optimise().optimise(grammar)
+	return grammar
+
+def _optimise():
+	# Only import the optimiser for the grammars that use it
+	import parsegen.optimise
+	return parsegen.optimise
 
-def parse_file(file):
+def parse_file(file, optimize=None):
 	"""Parse File
 	
-	Reads the contents of the file and parses the contents. Returns the same
-	as `parse_buffer`.
+	Parses a grammar file. The file can be an open file object, a path or a
+	buffer holding the contents of the file. Returns the same as
+	`parse_buffer`.
 	"""
 	
-	try:
-		return parse_buffer(file.read())
-	except AttributeError:
-		pass
+	if isinstance(file, _byte_buffers):
+		return parse_buffer(file, optimize)
+	
+	if hasattr(file, "read"):
+		return parse_buffer(read_file(file), optimize)
 	
-	with open(file, "r") as file:
-		return parse_buffer(file.read())
+	with open(file, "rb") as f:
+		return parse_buffer(read_file(f), optimize)
 
-def _processed_lines(text):
-	"""Processed Lines
+def read_file(file):
+	"""Read File
 	
-	Returns an iterable containing all non-empty lines within the text with
-	comments removed.
+	Returns the contents of an open file. Regular files are memory mapped, so
+	only the parts of the file that are looked at are read from disk. Other
+	files, such as pipes, are read in full.
 	"""
 	
-	for l in text.split("\n"):
-		l, _, _ = l.partition("#")
-		l = l.strip()
-		if len(l):
-			yield l
+	try:
+		return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+	except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+		return file.read()
 
 def parse_option(opt_line):
 	"""Parse Option
@@ -96,52 +151,105 @@ def _kv_with_sep(opt_line, sep="="):
 	
 	return key.strip(), val.strip()
 
-def _add_opt_to_dict(opt_line, dict, sep="=", mirror_empty=False):
-	"""Add Option to Dictionary
-	
-	Extracts a `key = value` pair from the `opt_line` and adds the pair to the
-	`dict`, uaing the optional separator `sep` to separate them.
+def _scan(buffer):
+	"""Scan
+	
+	Walks the buffer line by line and returns the header, the `dict` of
+	symbols and the user code. Each line of the header is either an option of
+	the form `%key = value` or a terminal definition, and each line of the
+	expansions section has the form `symbol := token token ...`. The line
+	number and the offset of the start of the line are kept up to date for
+	error messages.
 	"""
 	
-	key, val = _kv_with_sep(opt_line, sep)
+	if isinstance(buffer, str):
+		header_re, expansion_re, decode = _header_re, _expansion_re, None
+	else:
+		header_re, expansion_re = _header_bytes_re, _expansion_bytes_re
+		decode = _decode
 	
-	if mirror_empty and not val:
-		val = key
+	terms = {}
+	opts = {}
+	exps = {}
+	line, line_start = 1, 0
+	pos = None
 	
-	dict[key] = val
+	for match in header_re.finditer(buffer):
+		if match.group("sep"):
+			pos = match.end()
+			break
+		
+		text = match.group("text").rstrip()
+		if text:
+			if decode:
+				text = decode(text, line, match.start("text") - line_start)
+			if text[0] == "%":
+				key, val = _kv_with_sep(text[1:], "=")
+				opts[key] = val
+			else:
+				key, val = _kv_with_sep(text, "=")
+				terms[key] = val or key
+		
+		if match.group("eol"):
+			line += 1
+			line_start = match.end()
+	
+	if pos is not None:
+		for match in expansion_re.finditer(buffer, pos):
+			name, tokens, text, sep, eol = match.group(
+				"name", "tokens", "text", "sep", "eol")
+			
+			if name:
+				if decode:
+					name = decode(name, line, match.start("name") - line_start)
+					tokens = decode(tokens, line,
+									match.start("tokens") - line_start)
+				symbol = exps.get(name)
+				if symbol is None:
+					symbol = exps[name] = Symbol(name)
+				symbol.add_expansion(tokens.split())
+			elif sep:
+				if decode:
+					user_code = UserCode(buffer, match.end())
+				else:
+					user_code = buffer[match.end():]
+				return Header(terms, opts), exps, user_code
+			elif text and not text.isspace():
+				column = match.start("text") - line_start + 1
+				if decode:
+					text = decode(text, line, column - 1)
+				_expansion_error(text.rstrip(), line, column)
+			
+			if eol:
+				line += 1
+				line_start = match.end()
+	
+	sections = 1 if pos is None else 2
+	raise ParseError("expected 3 sections but found {0}".format(sections),
+					 line, len(buffer) - line_start + 1)
 
-def _process_header(header):
-	"""Process Header
+def _decode(text, line, column):
+	"""Decode
 	
-	Process the header section, splits the header definitions into two `dict`s
-	so that they can be looked up later.
+	Decodes part of a line of a grammar file from UTF-8. The line and column
+	of the text are used to report errors.
 	"""
 	
-	terms = {}
-	opts = {}
-	
-	for l in _processed_lines(header):
-		if l[:1] == "%":
-			_add_opt_to_dict(l[1:], opts)
-		else:
-			_add_opt_to_dict(l, terms, mirror_empty=True)
-	
-	return Header(terms, opts)
+	try:
+		return text.decode("utf-8")
+	except UnicodeDecodeError as e:
+		raise ParseError("invalid UTF-8 text", line, column + e.start + 1)
 
-def _process_expansions(expansions):
-	"""Process Expansions
+def _expansion_error(text, line, column):
+	"""Expansion Error
 	
-	Processes a block of text containing grammar expansions into a `dict`
-	containing mappings from symbol names to Symbol objects.
+	Raises a ParseError describing why a line of the expansions section
+	could not be read.
 	"""
 	
-	exps = {}
-	
-	for l in _processed_lines(expansions):
-		sym, exp = _kv_with_sep(l, ":=")
-		
-		s = exps.get(sym, Symbol(sym))
-		s.add_expansion(exp.split())
-		exps[sym] = s
-		
-	return exps
+	name, sep, _ = text.partition(":=")
+	if sep:
+		raise ParseError("invalid symbol name '{0}'".format(name.strip()),
+						 line, column)
+	raise ParseError("expected ':=' in expansion '{0}'".format(text),
+					 line, column)
@@ -0,0 +1,234 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import gc
+
+from parsegen.data import END_OF_INPUT, Expansion, Symbol
+from parsegen.errors import GrammarError, InputError
+from parsegen.table import ParseTable
+
+# Stands in for the token after the last one in the input
+_end_of_input = object()
+
+def tree(expansion, values):
+	"""Tree
+	
+	The default reduction used by `Parser.parse`. Builds a tree node as a
+	2-tuple of the symbol name and the list of values for each of its tokens.
+	Terminals are represented by the tokens themselves.
+	"""
+	
+	return expansion.symbol.name, values
+
+class Parser(object):
+	"""Parser
+	
+	Parses streams of tokens in-process, straight from a `Grammar`, without
+	generating any code.
+	
+	The predict sets of the grammar are flattened into a dense table indexed
+	by nonterminal and integer terminal id. Parsing then runs an explicit
+	stack of terminals, nonterminals and production markers, so the depth of
+	the input does not touch the Python stack.
+	
+	`kind` maps a token to the name of its terminal. By default tokens are
+	taken to be the terminal names themselves.
+	"""
+	
+	def __init__(self, grammar, kind=None):
+		if grammar.start is None:
+			raise GrammarError("no start symbol to parse")
+		
+		table = ParseTable(grammar)
+		n_terms = len(table.terminals)
+		
+		self.grammar = grammar
+		self.kind = kind or (lambda token: token)
+		# The end of the input is only ever the sentinel after the last
+		# token, never a token whose kind happens to share its name.
+		self.terminal_ids = dict(grammar.header.terminal_table.indices)
+		self.terminals = table.terminals
+		self.end = self.terminal_ids.pop(END_OF_INPUT)
+		self.symbol_ids = dict(
+			(symbol.name, index)
+			for index, symbol in enumerate(table.nonterminals))
+		
+		self.table = []
+		for row in table.dense():
+			self.table.extend(row)
+		
+		# Stack codes are terminal ids, then nonterminals offset by the number
+		# of terminals, then production markers after those. A production
+		# that ends with a continuation has no marker, the continuation's
+		# value is its value.
+		self.marker_base = n_terms + len(table.nonterminals)
+		self.productions = []
+		self.wrappers = []
+		self.lengths = []
+		self.pushes = []
+		for index, production in enumerate(table.productions):
+			expansion, wrappers = self._reductions(production)
+			self.productions.append(expansion)
+			self.wrappers.append(wrappers)
+			self.lengths.append(len(production.arguments))
+			codes = [
+				code if code >= 0 else n_terms + ~code
+				for code in production.codes
+			]
+			if not production.continues:
+				codes.append(self.marker_base + index)
+			codes.reverse()
+			self.pushes.append(tuple(codes))
+	
+	def _reductions(self, production):
+		"""Reductions
+		
+		Returns the expansion of the grammar as written that a production
+		reduces, and the unit rules its value then passes through. These only
+		differ from the production itself in an optimised grammar.
+		"""
+		
+		if production.action is None and not production.wrappers and \
+				not production.symbol.prefix:
+			return production, ()
+		
+		name = production.action or production.symbol.name
+		expansion = Expansion(Symbol(name), production.arguments)
+		wrappers = []
+		for wrapper in production.wrappers:
+			wrappers.append(Expansion(Symbol(wrapper), [name]))
+			name = wrapper
+		return expansion, tuple(wrappers)
+	
+	def _expected(self, top, position):
+		"""Expected
+		
+		Builds the error for an unexpected token when `top` is on the stack.
+		"""
+		
+		n_terms = len(self.terminals)
+		if top < n_terms:
+			names = [self.terminals[top]]
+		else:
+			row = (top - n_terms) * n_terms
+			names = [
+				name for i, name in enumerate(self.terminals)
+				if self.table[row + i] >= 0
+			]
+		return InputError("expected one of " + ", ".join(names), position)
+	
+	def parse(self, tokens, reduce=tree, disable_gc=False):
+		"""Parse
+		
+		Parses an iterable of tokens, which must be consumed entirely, as the
+		grammar's start symbol.
+		
+		Each time all the tokens of an expansion have been parsed `reduce` is
+		called with the `Expansion` and a list of the values for its tokens;
+		its result becomes the value of the symbol. For an optimised grammar
+		these are the expansions of the grammar as written, so the reductions
+		are the same as for the original grammar. Returns the value of the
+		start symbol. Raises an `InputError` if the tokens do not match the
+		grammar.
+		
+		If `disable_gc` is set the cyclic garbage collector is paused while
+		parsing. Building a tree allocates a container for each symbol, none
+		of them cyclic, which would otherwise trigger frequent, fruitless
+		collections. The pause applies to the whole process, so it is left to
+		callers that know no other thread depends on the collector.
+		"""
+		
+		if not disable_gc:
+			return self._parse(iter(tokens), reduce)
+		
+		enabled = gc.isenabled()
+		gc.disable()
+		try:
+			return self._parse(iter(tokens), reduce)
+		finally:
+			if enabled:
+				gc.enable()
+	
+	def _parse(self, tokens, reduce):
+		"""Parse
+		
+		The parse loop for `parse`.
+		"""
+		
+		kind = self.kind
+		terminal_ids = self.terminal_ids
+		table = self.table
+		pushes = self.pushes
+		lengths = self.lengths
+		productions = self.productions
+		wrappers = self.wrappers
+		n_terms = len(self.terminals)
+		marker_base = self.marker_base
+		end = self.end
+		
+		stack = [n_terms + self.symbol_ids[self.grammar.start.name]]
+		values = []
+		position = 0
+		
+		token = next(tokens, _end_of_input)
+		lookahead = end
+		if token is not _end_of_input:
+			lookahead = terminal_ids.get(kind(token), -1)
+		
+		while stack:
+			top = stack.pop()
+			
+			if top < n_terms:
+				if top != lookahead:
+					raise self._expected(top, position)
+				values.append(token)
+				position += 1
+				token = next(tokens, _end_of_input)
+				lookahead = end
+				if token is not _end_of_input:
+					lookahead = terminal_ids.get(kind(token), -1)
+			
+			elif top < marker_base:
+				if lookahead < 0:
+					raise self._expected(top, position)
+				production = table[(top - n_terms) * n_terms + lookahead]
+				if production < 0:
+					raise self._expected(top, position)
+				stack.extend(pushes[production])
+			
+			else:
+				production = top - marker_base
+				length = lengths[production]
+				if length:
+					args = values[-length:]
+					del values[-length:]
+				else:
+					args = []
+				value = reduce(productions[production], args)
+				for wrapper in wrappers[production]:
+					value = reduce(wrapper, [value])
+				values.append(value)
+		
+		if lookahead != end:
+			raise InputError("expected end of input", position)
+		
+		return values[0]
@@ -0,0 +1,227 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import sys
+
+from parsegen.errors import ParsegenError
+import parsegen.cache
+import parsegen.cli
+import parsegen.client
+
+# Seconds to wait on a client that has connected but stopped sending
+REQUEST_TIMEOUT = 10.0
+
+class Server(object):
+	"""Server
+	
+	A long running parsegen process. It listens on a Unix domain socket and
+	runs the command line sent in each request as if parsegen had been
+	started in the client's working directory, replying with the exit
+	status and everything written to standard out and standard error.
+	
+	Analysed grammars are kept in a `MemoryCache` so that a grammar is only
+	analysed again when its text changes, and the output backends and their
+	parsed templates stay loaded between requests. Requests are handled one
+	at a time, so a client that goes quiet for `timeout` seconds is dropped
+	rather than holding up the rest.
+	"""
+	
+	def __init__(self, path=None, grammar_cache=None,
+				 timeout=REQUEST_TIMEOUT):
+		self.path = path or parsegen.client.default_socket()
+		self.grammar_cache = grammar_cache or parsegen.cache.MemoryCache()
+		self.timeout = timeout
+		self.socket = None
+	
+	def bind(self):
+		"""Bind
+		
+		Starts listening on the socket. A socket left behind by a server that
+		is no longer running is replaced. Raises a ParsegenError if another
+		server is listening on it.
+		"""
+		
+		if os.path.exists(self.path):
+			try:
+				parsegen.client.request({"ping": True}, self.path)
+			except (OSError, ValueError):
+				os.remove(self.path)
+			else:
+				raise ParsegenError("server error", "already running on " \
+									"{0}".format(self.path))
+		
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		# Only the user running the server may connect to it
+		mask = os.umask(0o177)
+		try:
+			sock.bind(self.path)
+		finally:
+			os.umask(mask)
+		sock.listen()
+		self.socket = sock
+	
+	def serve_forever(self):
+		"""Serve Forever
+		
+		Answers requests until one asks the server to stop.
+		"""
+		
+		while True:
+			conn, _ = self.socket.accept()
+			with conn:
+				message = self._answer(conn)
+			if message.get("stop"):
+				return
+	
+	def _answer(self, conn):
+		"""Answer
+		
+		Reads a request from a connection and sends the response. Returns
+		the request, or an empty one if it could not be read.
+		"""
+		
+		message = {}
+		conn.settimeout(self.timeout)
+		try:
+			data = b"".join(iter(lambda: conn.recv(65536), b""))
+			try:
+				message = json.loads(data.decode("utf-8"))
+				if not isinstance(message, dict):
+					raise ValueError(message)
+			except ValueError:
+				message = {}
+				error = ParsegenError("server error", "invalid request")
+				response = _response(1, "", str(error) + "\n")
+			else:
+				response = self.handle(message)
+			conn.sendall(json.dumps(response).encode("utf-8"))
+		except OSError:
+			# The client went away or timed out, carry on with the next one
+			pass
+		return message
+	
+	def handle(self, message):
+		"""Handle
+		
+		Returns the response to a request. A request holds the command line
+		`args` and the `cwd` to run them in, or asks the server to `stop`.
+		"""
+		
+		if "args" not in message:
+			return _response(0, "", "")
+		
+		args = list(message["args"])
+		if args[:1] == ["serve"]:
+			error = ParsegenError("server error", "already serving")
+			return _response(1, "", str(error) + "\n")
+		
+		out, err = io.StringIO(), io.StringIO()
+		cwd = os.getcwd()
+		try:
+			with contextlib.redirect_stdout(out), \
+					contextlib.redirect_stderr(err):
+				os.chdir(message.get("cwd", cwd))
+				status = parsegen.cli.main(args, self.grammar_cache)
+		except SystemExit as e:
+			# Argument errors and --version exit from the argument parser
+			status = e.code
+		except Exception as e:
+			err.write("parsegen: {0}: {1}\n".format(type(e).__name__, e))
+			status = 1
+		finally:
+			os.chdir(cwd)
+		
+		if not isinstance(status, int):
+			status = 0 if status is None else 1
+		return _response(status, out.getvalue(), err.getvalue())
+	
+	def close(self):
+		"""Close
+		
+		Stops listening and removes the socket.
+		"""
+		
+		if self.socket is not None:
+			self.socket.close()
+			self.socket = None
+			try:
+				os.remove(self.path)
+			except OSError:
+				pass
+
+def _response(status, out, err):
+	return {"status": status, "stdout": out, "stderr": err}
+
+def main(args):
+	"""Main
+	
+	Runs `parsegen serve` with the arguments that follow it and returns the
+	exit status.
+	"""
+	
+	parser = argparse.ArgumentParser(prog="parsegen serve",
+		description="Keep parsegen running and answer requests from " \
+		"parsegen-client on a Unix domain socket.")
+	parser.add_argument('--socket',
+						help="Path of the socket to listen on. Defaults to " \
+						"$PARSEGEN_SOCKET or a socket in the runtime " \
+						"directory.",
+						metavar='PATH')
+	parser.add_argument('--stop',
+						help="Stop the server listening on the socket.",
+						action='store_true')
+	options = parser.parse_args(args)
+	
+	if options.stop:
+		try:
+			parsegen.client.request({"stop": True}, options.socket)
+		except (OSError, ValueError):
+			print(ParsegenError("server error", "no server is running"))
+			return 1
+		return 0
+	
+	server = Server(options.socket)
+	try:
+		server.bind()
+	except ParsegenError as e:
+		print(e)
+		return 1
+	except OSError as e:
+		print(ParsegenError("server error", e.strerror))
+		return 1
+	
+	# Clean up the socket when asked to terminate as well as on ^C
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.close()
+	return 0
@@ -0,0 +1,148 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import contextlib
+import threading
+import time
+
+class Stats(object):
+	"""Stats
+	
+	Collects the time spent in each phase of generating a parser along with
+	counters from the analysis. Phases are named with dots to show nesting,
+	for example `analysis.first` runs inside `analysis`. Times for a phase
+	that runs more than once are added together.
+	"""
+	
+	def __init__(self):
+		self.phases = {}
+		self.counters = {}
+		self.total = 0.0
+		self.peak_memory = None
+	
+	@contextlib.contextmanager
+	def phase(self, name):
+		self.phases.setdefault(name, 0.0)
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.phases[name] += time.perf_counter() - start
+	
+	def count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+	
+	def as_dict(self):
+		"""As Dict
+		
+		Returns the collected numbers as plain `dict`s so they can be saved as
+		JSON. Times are in seconds and memory is in bytes.
+		"""
+		
+		return {
+			'phases' : dict(self.phases),
+			'counters' : dict(self.counters),
+			'total' : self.total,
+			'peak_memory' : self.peak_memory
+		}
+	
+	def summary(self):
+		"""Summary
+		
+		Returns a human readable table of the collected numbers.
+		"""
+		
+		lines = ["parsegen: stats:"]
+		for name, seconds in self.phases.items():
+			lines.append("  {0:<20} {1:>10.2f} ms".format(name, seconds * 1e3))
+		lines.append("  {0:<20} {1:>10.2f} ms".format("total", self.total * 1e3))
+		for name, value in self.counters.items():
+			lines.append("  {0:<20} {1:>10}".format(name, value))
+		if self.peak_memory is not None:
+			lines.append("  {0:<20} {1:>10.1f} KiB".format(
+				"peak memory", self.peak_memory / 1024.0))
+		return "\n".join(lines) + "\n"
+
+class _Local(threading.local):
+	
+	# The statistics being collected by this thread, if any. Instrumented code
+	# reports to this through `phase` and `count`, which do nothing when it is
+	# None. Other threads report nothing, so work they do is only counted in
+	# a phase timed by the thread collecting.
+	current = None
+
+_local = _Local()
+
+_no_phase = contextlib.nullcontext()
+
+def phase(name):
+	"""Phase
+	
+	Returns a context manager that times the code inside it as the phase
+	`name`.
+	"""
+	
+	current = _local.current
+	if current is None:
+		return _no_phase
+	return current.phase(name)
+
+def count(name, n=1):
+	"""Count
+	
+	Adds `n` to the counter `name`.
+	"""
+	
+	current = _local.current
+	if current is not None:
+		current.count(name, n)
+
+@contextlib.contextmanager
+def collect(memory=True):
+	"""Collect
+	
+	Context manager that collects statistics for the code run inside it and
+	yields the `Stats` object to read them from afterwards. With `memory` the
+	peak memory allocated is recorded with `tracemalloc`, which slows Python
+	down while it is active. Only the current thread is collected from.
+	"""
+	
+	import tracemalloc
+	
+	previous = _local.current
+	stats = _local.current = Stats()
+	tracing = memory and not tracemalloc.is_tracing()
+	if tracing:
+		tracemalloc.start()
+	elif memory:
+		tracemalloc.reset_peak()
+	start = time.perf_counter()
+	
+	try:
+		yield stats
+	finally:
+		stats.total = time.perf_counter() - start
+		if memory:
+			stats.peak_memory = tracemalloc.get_traced_memory()[1]
+		if tracing:
+			tracemalloc.stop()
+		_local.current = previous
@@ -0,0 +1,180 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from parsegen.utils import lazyprop, Struct
+
+class ParseTable(object):
+	"""Parse Table
+	
+	The LL(1) parse table for a grammar. Rows are the nonterminals, in the
+	order they are defined, and columns are the terminals in the order of the
+	grammar's terminal table, including the end of input marker. Productions
+	are numbered through the expansions of each symbol in turn, and the first
+	production of each nonterminal is recorded in `production_base`.
+	
+	Rows are held sparsely as tuples of `(column, expansion)` pairs, where
+	`expansion` indexes the symbol's own expansions. Symbols with the same
+	shape of expansions therefore share identical rows. Where two expansions
+	of a symbol are predicted by the same terminal the first one wins; use
+	`Grammar.conflicts` to find these.
+	"""
+	
+	def __init__(self, grammar):
+		self.grammar = grammar
+		self.terminals = list(grammar.header.terminal_table.names)
+		self.nonterminals = list(grammar.expansions.values())
+		self.productions = []
+		self.production_base = []
+		self.rows = []
+		
+		table = grammar.header.terminal_table
+		for symbol in self.nonterminals:
+			row = {}
+			self.production_base.append(len(self.productions))
+			for index, expansion in enumerate(symbol.expansions):
+				self.productions.append(expansion)
+				for name in table.names_of(expansion.predict_bits):
+					row.setdefault(table.indices[name], index)
+			self.rows.append(tuple(sorted(row.items())))
+	
+	def dense(self, missing=-1):
+		"""Dense
+		
+		Returns the table as a list of rows, each a list with the production
+		for every column. Columns with no production hold `missing`.
+		"""
+		
+		dense = []
+		for base, row in zip(self.production_base, self.rows):
+			values = [missing] * len(self.terminals)
+			for column, expansion in row:
+				values[column] = base + expansion
+			dense.append(values)
+		return dense
+	
+	@lazyprop
+	def compressed(self):
+		"""Compressed
+		
+		Compresses the table with row displacement. Identical rows are merged
+		first, then each distinct row is given a `base` offset so that its
+		entries fit into the gaps left by the rows before it in a single
+		`entry` vector. The `check` vector records the row owning each slot.
+		The lookup for a nonterminal and column is:
+		
+		    row = row_map[nonterminal]
+		    i = base[row] + column
+		    expansion = entry[i] if i < len(check) and check[i] == row
+		
+		Returns a `Struct` holding these vectors.
+		"""
+		
+		unique = {}
+		row_map = [unique.setdefault(row, len(unique)) for row in self.rows]
+		
+		base = [0] * len(unique)
+		entry = []
+		check = []
+		occupied = 0
+		
+		# Placing the densest rows first leaves small gaps for the sparse ones
+		for row, index in sorted(unique.items(), key=lambda r: -len(r[0])):
+			if not row:
+				continue
+			mask = 0
+			for column, _ in row:
+				mask |= 1 << column
+			
+			offset = 0
+			while (mask << offset) & occupied:
+				offset += 1
+			occupied |= mask << offset
+			base[index] = offset
+			
+			end = offset + row[-1][0] + 1
+			if end > len(entry):
+				entry.extend([-1] * (end - len(entry)))
+				check.extend([-1] * (end - len(check)))
+			for column, expansion in row:
+				entry[offset + column] = expansion
+				check[offset + column] = index
+		
+		return Struct(row_map=row_map, base=base, entry=entry, check=check)
+	
+	def lookup(self, nonterminal, column):
+		"""Lookup
+		
+		Returns the production for a nonterminal index and column using the
+		compressed table, or -1 if there is none.
+		"""
+		
+		table = self.compressed
+		row = table.row_map[nonterminal]
+		i = table.base[row] + column
+		if i < len(table.check) and table.check[i] == row:
+			return self.production_base[nonterminal] + table.entry[i]
+		return -1
+	
+	@lazyprop
+	def stats(self):
+		"""Stats
+		
+		Returns a `Struct` describing the size of the table before and after
+		compression. Sizes in bytes assume each vector uses the smallest
+		standard integer type that can hold its values.
+		"""
+		
+		table = self.compressed
+		vectors = [table.row_map, table.base, table.entry, table.check,
+				   self.production_base]
+		dense = len(self.rows) * len(self.terminals)
+		
+		return Struct(
+			nonterminals=len(self.rows),
+			unique_rows=len(table.base),
+			terminals=len(self.terminals),
+			entries=sum(len(row) for row in self.rows),
+			dense_entries=dense,
+			packed_entries=len(table.entry),
+			dense_bytes=dense * int_size(range(-1, len(self.productions))),
+			packed_bytes=sum(len(v) * int_size(v) for v in vectors))
+
+def int_type(values):
+	"""Int Type
+	
+	Returns the name of the smallest C integer type that can hold all of the
+	given values.
+	"""
+	
+	low, high = min(values, default=0), max(values, default=0)
+	for name, bits in (("int8_t", 8), ("int16_t", 16), ("int32_t", 32)):
+		if -(1 << (bits - 1)) <= low and high < (1 << (bits - 1)):
+			return name
+	return "int64_t"
+
+def int_size(values):
+	"""Int Size
+	
+	Returns the size in bytes of the type given by `int_type`.
+	"""
+	
+	return int(int_type(values)[3:-2]) // 8
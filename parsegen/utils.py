@@ -54,15 +54,33 @@ class Struct(object):
 	def __neq__(self, other):
 		return not self.__eq__(other)
 
-# The following Lazy property decorator is licensed as 'cc-wiki'
-# by Mike Boers (http://stackoverflow.com/users/66502/mike-boers)
-# from http://stackoverflow.com/a/3013910/1353098 and is reproduced here
-# under the terms of the origional license.
-def lazyprop(fn):
-    attr_name = '_lazy_' + fn.__name__
-    @property
-    def _lazyprop(self):
-        if not hasattr(self, attr_name):
-            setattr(self, attr_name, fn(self))
-        return getattr(self, attr_name)
-    return _lazyprop
+class lazyprop(object):
+	"""Lazy Property
+	
+	Decorator for a property that is computed the first time it is read. The
+	value is stored in the instance's `__dict__` under the property's own
+	name, where it hides the property, so later reads are plain attribute
+	lookups. Classes using `__slots__` should keep an explicit field instead.
+	"""
+	
+	def __init__(self, fn):
+		self.fn = fn
+		self.name = fn.__name__
+		self.__doc__ = fn.__doc__
+	
+	def __get__(self, instance, owner):
+		if instance is None:
+			return self
+		value = instance.__dict__[self.name] = self.fn(instance)
+		return value
+
+def switched_on(value):
+	"""Switched On
+	
+	Returns True if the value of a flag option turns it on. Flags can be
+	given without a value and are only off when missing or set to one of 0,
+	no, false or off.
+	"""
+	
+	return value is not None and \
+		value.lower() not in ("0", "no", "false", "off")
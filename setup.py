@@ -25,5 +25,5 @@ setup(
 	# Things to Distribute
 	packages = ['test', 'parsegen', 'parsegen.output'],
 	package_data = {'parsegen.output': ['*.mustache']},
-	scripts = ['bin/parsegen']
+	scripts = ['bin/parsegen', 'bin/parsegen-client']
 )
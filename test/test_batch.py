@@ -0,0 +1,170 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+import io
+import os
+import shutil
+import tempfile
+
+# Module to test
+from parsegen.batch import *
+from parsegen.errors import ParsegenError
+import parsegen.options
+
+GRAMMAR = """
+NUMBER = Tok_NUMBER
+%prefix = {0}
+%%
+main := NUMBER main
+main :=
+%%
+"""
+
+class TestBatch(object):
+	"""Test Batch
+	
+	Tests the `batch` submodule which generates many parsers at once.
+	"""
+	
+	def setup(self):
+		self.directory = tempfile.mkdtemp()
+		self.environ = os.environ.get("PARSEGEN_CACHE_DIR")
+		os.environ["PARSEGEN_CACHE_DIR"] = os.path.join(self.directory, "cache")
+	
+	def teardown(self):
+		shutil.rmtree(self.directory)
+		if self.environ is None:
+			del os.environ["PARSEGEN_CACHE_DIR"]
+		else:
+			os.environ["PARSEGEN_CACHE_DIR"] = self.environ
+	
+	def _grammar(self, name, prefix="yy_"):
+		path = os.path.join(self.directory, name)
+		with open(path, "w") as f:
+			f.write(GRAMMAR.format(prefix))
+		return path
+	
+	def _read(self, name):
+		with open(os.path.join(self.directory, name)) as f:
+			return f.read()
+	
+	def test_output_path(self):
+		
+		g = self._grammar("expr.grammar")
+		jobs = [job(g, language="c"), job(g, self.directory, "ruby")]
+		assert run(jobs, workers=1) == 0
+		
+		assert "yy_node_t" in self._read("expr.c")
+		assert "def main" in self._read("expr.rb")
+	
+	def test_several_languages(self):
+		
+		g = self._grammar("expr.grammar")
+		j = job(g, language="c, ruby")
+		assert output_paths(j) == [
+			("c", os.path.join(self.directory, "expr.c")),
+			("ruby", os.path.join(self.directory, "expr.rb"))]
+		assert run([j], workers=1) == 0
+		assert "yy_node_t" in self._read("expr.c")
+		assert "def main" in self._read("expr.rb")
+		
+		# The output has to be a directory, with a file for each language
+		assert_raises(ParsegenError, output_paths, job(g, g, "c,ruby"))
+		assert_raises(ParsegenError, output_paths, job(g, None, "c,c-table"))
+	
+	def test_pool(self):
+		
+		jobs = [
+			job(self._grammar("g{0}.grammar".format(i), "p{0}_".format(i)),
+				language="c", cache=False)
+			for i in range(4)
+		]
+		assert run(jobs, workers=2) == 0
+		
+		for i in range(4):
+			assert "p{0}_node_t".format(i) in \
+				self._read("g{0}.c".format(i))
+	
+	def test_errors(self):
+		
+		good = self._grammar("good.grammar")
+		jobs = [
+			job(os.path.join(self.directory, "missing.grammar")),
+			job(good, language="cobol"),
+			job(good, language="c"),
+		]
+		errors = io.StringIO()
+		assert run(jobs, workers=1, errors=errors) == 2
+		
+		lines = errors.getvalue().splitlines()
+		assert len(lines) == 2
+		assert "missing.grammar: No such file" in lines[0]
+		assert "unknown language cobol" in lines[1]
+		
+		# Errors writing the output name the file that couldn't be written
+		output = os.path.join(self.directory, "missing", "good.c")
+		error = run_job(job(good, output, "c"))
+		assert "io error: {0}".format(output) in error
+		assert os.path.exists(os.path.join(self.directory, "good.c"))
+	
+	def test_manifest(self):
+		
+		self._grammar("expr.grammar")
+		manifest = os.path.join(self.directory, "jobs.txt")
+		with open(manifest, "w") as f:
+			f.write("# Parsers to build\n\n")
+			f.write("-l c -o expr_parser.c expr.grammar prefix=e_\n")
+			f.write("--no-cache -l ruby -M expr.d --check expr.grammar\n")
+		
+		jobs = read_manifest(manifest)
+		assert len(jobs) == 2
+		assert jobs[0].output == os.path.join(self.directory, "expr_parser.c")
+		assert jobs[0].options == {'prefix': 'e_'}
+		assert not jobs[0].check
+		assert jobs[1].output is None
+		assert not jobs[1].cache
+		assert jobs[1].depfile == os.path.join(self.directory, "expr.d")
+		assert jobs[1].check
+		
+		assert run(jobs, workers=1) == 0
+		assert "e_node_t" in self._read("expr_parser.c")
+		assert os.path.exists(os.path.join(self.directory, "expr.rb"))
+		assert self._read("expr.d").startswith(
+			os.path.join(self.directory, "expr.rb:"))
+	
+	def test_bad_manifest(self):
+		
+		manifest = os.path.join(self.directory, "jobs.txt")
+		with open(manifest, "w") as f:
+			f.write("-l c\n")
+		assert_raises(ParsegenError, read_manifest, manifest)
+		
+		# Conflicts are only reported for a single grammar
+		with open(manifest, "w") as f:
+			f.write("--conflicts text expr.grammar\n")
+		assert_raises(ParsegenError, read_manifest, manifest)
+		
+		args = parsegen.options.parse(["--batch", "--conflicts", "text",
+									   self._grammar("expr.grammar")])
+		assert_raises(ParsegenError, jobs_from_args, args)
@@ -0,0 +1,206 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+import os
+import shutil
+import tempfile
+
+# Module to test
+from parsegen.cache import *
+from parsegen.parse import parse_buffer
+import parsegen.cache
+
+GRAMMAR = """
+NUMBER = Tok_NUMBER
+PLUS = Tok_PLUS
+%prefix = yy_
+%%
+main := NUMBER main_prime
+main_prime := PLUS NUMBER main_prime
+main_prime :=
+%%
+user code
+"""
+
+class TestGrammarCache(object):
+	"""Test Grammar Cache
+	
+	Tests the `cache` submodule. This stores analysed grammars on disk so
+	that they don't need to be analysed again.
+	"""
+	
+	def setup(self):
+		self.directory = tempfile.mkdtemp()
+	
+	def teardown(self):
+		shutil.rmtree(self.directory)
+	
+	def test_round_trip(self):
+		
+		g = parse_buffer(GRAMMAR)
+		r = loads(dumps(g))
+		
+		assert r.user_code == g.user_code
+		assert r.header.terminals == g.header.terminals
+		assert r.header.options == g.header.options
+		assert r.header.terminal_table.names == g.header.terminal_table.names
+		assert r.start.name == 'main'
+		assert r.iterations == g.iterations
+		assert list(r.expansions) == list(g.expansions)
+		
+		for name, symbol in g.expansions.items():
+			restored = r.expansions[name]
+			assert restored.grammar is r
+			assert restored.is_nullable() == symbol.is_nullable()
+			assert restored.first == symbol.first
+			assert restored.follow == symbol.follow
+			for a, b in zip(symbol.expansions, restored.expansions):
+				assert a.tokens == b.tokens
+				assert a.predict == b.predict
+				assert a.predictions == b.predictions
+	
+	def test_optimised(self):
+		
+		g = parse_buffer(GRAMMAR, optimize=True)
+		r = loads(dumps(g))
+		assert r.optimisation == g.optimisation
+		for name, symbol in g.expansions.items():
+			restored = r.expansions[name]
+			assert restored.prefix == symbol.prefix
+			for a, b in zip(symbol.expansions, restored.expansions):
+				assert (a.action, a.wrappers) == (b.action, b.wrappers)
+		
+		c = GrammarCache(self.directory)
+		assert c.key(GRAMMAR, True) != c.key(GRAMMAR)
+		c.parse_buffer(GRAMMAR, optimize=True)
+		assert c.load(GRAMMAR) is None
+		assert c.load(GRAMMAR, True).optimisation is not None
+	
+	def test_cache(self):
+		
+		c = GrammarCache(self.directory)
+		assert c.load(GRAMMAR) is None
+		
+		g = c.parse_buffer(GRAMMAR)
+		assert len(os.listdir(self.directory)) == 1
+		
+		r = c.load(GRAMMAR)
+		assert r is not None
+		assert r.expansions['main'].first == {'NUMBER'}
+		assert c.load(GRAMMAR + "\n") is None
+	
+	def test_user_code_range(self):
+		
+		text = GRAMMAR.encode("utf-8") + b"x" * 4096
+		g = parse_buffer(text)
+		data = dumps(g)
+		assert len(data) < 4096
+		
+		r = loads(data, text)
+		assert str(r.user_code) == str(g.user_code)
+		assert_raises(ValueError, loads, data)
+		
+		c = GrammarCache(self.directory)
+		c.parse_buffer(text)
+		assert str(c.load(text).user_code) == str(g.user_code)
+	
+	def test_oversize(self):
+		
+		g = parse_buffer(GRAMMAR)
+		c = GrammarCache(self.directory, max_size=len(dumps(g)) - 1)
+		c.store(GRAMMAR, g)
+		assert os.listdir(self.directory) == []
+		assert c.load(GRAMMAR) is None
+	
+	def test_key(self):
+		
+		c = GrammarCache(self.directory)
+		assert c.key(GRAMMAR) == c.key(GRAMMAR.encode("utf-8"))
+		assert c.key(GRAMMAR) != c.key(GRAMMAR + " ")
+		
+		key = c.key(GRAMMAR)
+		version = parsegen.cache.VERSION
+		try:
+			parsegen.cache.VERSION = "0.0.0"
+			assert c.key(GRAMMAR) != key
+		finally:
+			parsegen.cache.VERSION = version
+		assert c.key(GRAMMAR) == key
+	
+	def test_eviction(self):
+		
+		g = parse_buffer(GRAMMAR)
+		size = len(dumps(g))
+		c = GrammarCache(self.directory, max_size=size * 2)
+		
+		c.store("first", g)
+		os.utime(c._path(c.key("first")), (0, 0))
+		c.store("second", g)
+		os.utime(c._path(c.key("second")), (1, 1))
+		
+		# Using the first entry makes the second the least recently used
+		assert c.load("first") is not None
+		c.store("third", g)
+		
+		assert c.load("first") is not None
+		assert c.load("second") is None
+		assert c.load("third") is not None
+	
+	def test_corrupt(self):
+		
+		c = GrammarCache(self.directory)
+		c.parse_buffer(GRAMMAR)
+		with open(c._path(c.key(GRAMMAR)), "wb") as f:
+			f.write(b"\x00 not a grammar")
+		
+		assert c.load(GRAMMAR) is None
+		assert c.parse_buffer(GRAMMAR).start.name == 'main'
+	
+	def test_memory(self):
+		
+		g = parse_buffer(GRAMMAR)
+		size = len(dumps(g))
+		c = MemoryCache(self.directory, max_memory=size * 2)
+		
+		c.store("first", g)
+		c.store("second", g)
+		assert len(c.entries) == 2
+		
+		# Entries are found in memory once the files are gone
+		for name in os.listdir(self.directory):
+			os.remove(os.path.join(self.directory, name))
+		r = c.load("first")
+		assert r is not None and r is not g
+		assert r.expansions['main'].first == {'NUMBER'}
+		
+		c.store("third", g)
+		assert c.load("second") is None
+		assert c.load("first") is not None
+		assert c.memory == size * 2
+		
+		# Entries read from disk are kept in memory too
+		GrammarCache(self.directory).store("fourth", g)
+		c = MemoryCache(self.directory)
+		assert c.load("fourth") is not None
+		assert list(c.entries) == [c.key("fourth")]
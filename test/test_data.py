@@ -140,3 +140,211 @@ class TestSymbol(object):
 		self.sym.add_follow(['bar', 'baz'])
 		
 		assert self.sym.follow == {'foo', 'bar', 'baz'}
+
+class TestTerminalTable(object):
+	"""Test Terminal Table
+	
+	Test the TerminalTable object. This gives each terminal a dense index so
+	that sets of terminals can be stored as integer bitsets.
+	"""
+	
+	def test_index(self):
+		
+		t = TerminalTable(['FOO', 'BAR'])
+		assert len(t) == 2
+		assert t.index('FOO') == 0
+		assert t.index('BAR') == 1
+		assert t.index('BAZ') == 2
+		assert t.index('FOO') == 0
+		assert len(t) == 3
+	
+	def test_bits(self):
+		
+		t = TerminalTable(['FOO', 'BAR', 'BAZ'])
+		assert t.bits([]) == 0
+		assert t.bits(['FOO', 'BAZ']) == 0b101
+		assert list(t.names_of(0b110)) == ['BAR', 'BAZ']
+		
+		s = TerminalSet(t, 0b11)
+		assert t.bits(s) == 0b11
+
+class TestTerminalSet(object):
+	"""Test Terminal Set
+	
+	Test the set-like view over a terminal bitset.
+	"""
+	
+	def test_set_operations(self):
+		
+		t = TerminalTable(['FOO', 'BAR', 'BAZ'])
+		s = TerminalSet(t, t.bits(['FOO', 'BAZ']))
+		
+		assert len(s) == 2
+		assert 'FOO' in s
+		assert not 'BAR' in s
+		assert not 'UNKNOWN' in s
+		assert s == {'FOO', 'BAZ'}
+		assert {'FOO', 'BAZ'} == s
+		assert s != {'FOO'}
+		assert s <= {'FOO', 'BAR', 'BAZ'}
+		assert s | {'BAR'} == {'FOO', 'BAR', 'BAZ'}
+		assert s & {'BAR', 'BAZ'} == {'BAZ'}
+		
+		assert s == TerminalSet(t, 0b101)
+		assert TerminalSet(t, 0b001) <= s
+		assert not TerminalSet(t, 0b010) <= s
+	
+	def test_symbol_rebind(self):
+		
+		h = Header({'FOO': 'Tok_FOO', 'BAR': 'Tok_BAR'}, {})
+		s = Symbol('foo')
+		s.add_first(['BAR'])
+		
+		s.set_grammar(Struct(header=h))
+		assert s.table is h.terminal_table
+		assert s.first_bits == 0b10
+		assert s.first == {'BAR'}
+
+class TestUserCode(object):
+	"""Test User Code
+	
+	Tests the lazily decoded user code section.
+	"""
+	
+	def test_range(self):
+		
+		buf = "ignored %% café ☃ code".encode("utf-8")
+		start = buf.index(b"caf")
+		u = UserCode(buf, start)
+		
+		assert len(u) == len(buf) - start
+		assert str(u) == "café ☃ code"
+		assert u == "café ☃ code"
+		assert u != "cafe"
+		assert u == UserCode(memoryview(buf), start)
+		assert hash(u) == hash("café ☃ code")
+		assert str(UserCode(buf, start, start + 3)) == "caf"
+	
+	def test_write_to(self):
+		from io import StringIO
+		
+		text = "☃ snowman é\n" * 100
+		u = UserCode(bytearray(text.encode("utf-8")))
+		
+		# Pieces that split the multi-byte characters
+		for size in [1, 2, 5, 64 * 1024]:
+			u.chunk_size = size
+			out = StringIO()
+			u.write_to(out)
+			assert out.getvalue() == text
+
+class TestSymbolTable(object):
+	"""Test Symbol Table
+	
+	Tests the integer codes given to terminals and nonterminals.
+	"""
+	
+	def test_codes(self):
+		
+		h = Header({'FOO': 'Tok_FOO', 'BAR': 'Tok_BAR'}, {})
+		a, b = Symbol('a'), Symbol('b')
+		t = SymbolTable(h, [a, b])
+		
+		assert t.code('FOO') == h.terminal_table.index('FOO')
+		assert t.code('BAR') == h.terminal_table.index('BAR')
+		assert t.code('a') == -1
+		assert t.code('b') == -2
+		assert t.symbol(t.code('b')) is b
+		
+		codes = t.encode(['BAR', 'a', 'FOO', 'b'])
+		assert codes.typecode == 'i'
+		assert t.decode(codes) == ['BAR', 'a', 'FOO', 'b']
+		assert_raises(KeyError, t.encode, ['FOO', 'baz'])
+	
+	def test_expansion(self):
+		
+		h = Header({'FOO': 'Tok_FOO'}, {})
+		s = Symbol('s')
+		s.add_expansion(['FOO', 's'])
+		e = s.expansions[0]
+		assert e.tokens == ['FOO', 's']
+		assert e.codes is None
+		
+		e.encode(SymbolTable(h, [s]))
+		assert list(e.codes) == [0, -1]
+		assert e.tokens == ['FOO', 's']
+	
+	def test_tail_recursive(self):
+		
+		h = Header({'FOO': 'Tok_FOO'}, {})
+		s = Symbol('s')
+		t = Symbol('t')
+		s.add_expansion(['FOO', 's'])
+		s.add_expansion(['s', 'FOO'])
+		s.add_expansion(['FOO', 't'])
+		s.add_expansion([])
+		table = SymbolTable(h, [s, t])
+		for e in s.expansions:
+			e.encode(table)
+		
+		assert [e.tail_recursive for e in s.expansions] == [
+			True, False, False, False]
+		
+		s.expansions[0].wrappers = ('u',)
+		assert not s.expansions[0].tail_recursive
+
+class TestMemory(object):
+	"""Test Memory
+	
+	Measures the memory used by the data model for a large generated grammar.
+	With `__slots__`, shared prediction lists and encoded tokens it used 278
+	bytes per expansion when this was written, down from 424.
+	"""
+	
+	# Bound on the bytes used per expansion, including the symbols
+	MAX_BYTES_PER_EXPANSION = 320
+	
+	def test_slots(self):
+		
+		h = Header({'FOO': 'Tok_FOO'}, {})
+		s = Symbol('s')
+		s.add_expansion(['FOO'])
+		for obj in [h, s, s.expansions[0], TerminalTable(), SymbolTable(h, [])]:
+			assert not hasattr(obj, '__dict__')
+	
+	def test_bytes_per_expansion(self):
+		import gc
+		import tracemalloc
+		from parsegen.parse import parse_buffer
+		
+		count = 20000
+		lines = ["A = a", "B = b", "%%"]
+		for i in range(count // 4):
+			nxt = (i + 1) % (count // 4)
+			lines.append("s%d := A s%d B" % (i, nxt))
+			lines.append("s%d := B" % i)
+			lines.append("s%d := A B A" % i)
+			lines.append("s%d :=" % i)
+		lines.append("%%")
+		text = "\n".join(lines)
+		
+		gc.collect()
+		tracing = tracemalloc.is_tracing()
+		if not tracing:
+			tracemalloc.start()
+		try:
+			before = tracemalloc.get_traced_memory()[0]
+			g = parse_buffer(text)
+			for symbol in g.expansions.values():
+				symbol.counts
+				for expansion in symbol.expansions:
+					expansion.predictions
+			gc.collect()
+			used = tracemalloc.get_traced_memory()[0] - before
+		finally:
+			if not tracing:
+				tracemalloc.stop()
+		
+		per_expansion = used / float(count)
+		assert per_expansion < self.MAX_BYTES_PER_EXPANSION, per_expansion
+
@@ -0,0 +1,180 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+import os
+import shutil
+import tempfile
+
+# Module to test
+from parsegen.depend import *
+from parsegen.parse import parse_buffer
+import parsegen.batch
+import parsegen.cli
+import parsegen.depend
+import parsegen.parse
+
+GRAMMAR = """
+NUMBER = Tok_NUMBER
+%%
+main := NUMBER main
+main :=
+%%
+"""
+
+class TestDepend(object):
+	"""Test Depend
+	
+	Tests the `depend` submodule, which tells build tools what a parser
+	depends on and whether it needs generating again.
+	"""
+	
+	def setup(self):
+		self.directory = tempfile.mkdtemp()
+		self.records = os.path.join(self.directory, "records")
+		self.grammar = self._write("expr.grammar", GRAMMAR)
+		self.output = self._write("expr.c", "parser")
+	
+	def teardown(self):
+		shutil.rmtree(self.directory)
+	
+	def _write(self, name, text):
+		path = os.path.join(self.directory, name)
+		with open(path, "w") as f:
+			f.write(text)
+		return path
+	
+	def test_inputs(self):
+		
+		paths = inputs("expr.grammar", parse_buffer(GRAMMAR), "c")
+		names = [os.path.basename(p) for p in paths]
+		assert names[0] == "expr.grammar"
+		for name in ["c.mustache", "c.py", "mustache.py", "version.py"]:
+			assert name in names, name
+		assert len(set(paths)) == len(paths)
+		
+		paths = inputs("expr.grammar", parse_buffer(GRAMMAR), "c-table")
+		names = [os.path.basename(p) for p in paths]
+		assert "c_table.mustache" in names and "table.py" in names
+	
+	def test_depfile(self):
+		
+		path = os.path.join(self.directory, "expr.d")
+		write_depfile(path, "out/expr.c", ["my grammar", "$x.mustache"])
+		with open(path) as f:
+			assert f.read() == \
+				"out/expr.c: \\\n  my\\ grammar \\\n  $$x.mustache\n"
+	
+	def test_check(self):
+		
+		cmd = command(self.grammar, "c", {"prefix": "p_"})
+		assert check(self.output, cmd, self.records) is None
+		
+		record(self.output, cmd, [self.grammar], 0, self.records)
+		assert check(self.output, cmd, self.records) == 0
+		assert check(self.output, command(self.grammar, "ruby"),
+					 self.records) is None
+		
+		version = parsegen.depend.VERSION
+		try:
+			parsegen.depend.VERSION = "0.0.0"
+			assert check(self.output, cmd, self.records) is None
+		finally:
+			parsegen.depend.VERSION = version
+		
+		# Changing an input or the output means generating it again
+		self._write("expr.grammar", GRAMMAR + "\n")
+		assert check(self.output, cmd, self.records) is None
+		record(self.output, cmd, [self.grammar], 1, self.records)
+		assert check(self.output, cmd, self.records) == 1
+		self._write("expr.c", "edited")
+		assert check(self.output, cmd, self.records) is None
+		
+		# As does removing the depfile
+		depfile = self._write("expr.d", "")
+		cmd = command(self.grammar, "c", depfile=depfile)
+		record(self.output, cmd, [self.grammar], 0, self.records)
+		assert check(self.output, cmd, self.records) == 0
+		os.remove(depfile)
+		assert check(self.output, cmd, self.records) is None
+	
+	def test_check_grammar(self):
+		
+		# Generating another grammar into the same output is never up to date
+		other = self._write("other.grammar", GRAMMAR)
+		cmd = command(self.grammar, "c")
+		record(self.output, cmd, [self.grammar], 0, self.records)
+		assert check(self.output, cmd, self.records) == 0
+		assert check(self.output, command(other, "c"), self.records) is None
+	
+	def test_switch_grammar(self):
+		import contextlib, io
+		
+		cache = os.environ.get("PARSEGEN_CACHE_DIR")
+		os.environ["PARSEGEN_CACHE_DIR"] = self.records
+		other = self._write("other.grammar", "%prefix = zz_\n" + GRAMMAR)
+		try:
+			for grammar in [self.grammar, other]:
+				args = ["--check", "-l", "c", "-o", self.output, grammar]
+				with contextlib.redirect_stdout(io.StringIO()):
+					assert parsegen.cli.main(args) == 0
+			with open(self.output) as f:
+				assert "zz_node_t" in f.read()
+			
+			job = parsegen.batch.job(self.grammar, self.output, "c",
+									 cache=False, check=True)
+			assert parsegen.batch.run_job(job) is None
+			with open(self.output) as f:
+				assert "zz_node_t" not in f.read()
+		finally:
+			if cache is None:
+				del os.environ["PARSEGEN_CACHE_DIR"]
+			else:
+				os.environ["PARSEGEN_CACHE_DIR"] = cache
+	
+	def test_batch(self):
+		
+		cache = os.environ.get("PARSEGEN_CACHE_DIR")
+		os.environ["PARSEGEN_CACHE_DIR"] = self.records
+		read_file = parsegen.parse.read_file
+		try:
+			depfile = os.path.join(self.directory, "expr.d")
+			job = parsegen.batch.job(self.grammar, self.output, "c",
+									 cache=False, depfile=depfile, check=True)
+			assert parsegen.batch.run_job(job) is None
+			with open(depfile) as f:
+				assert f.read().startswith(self.output + ":")
+			
+			# An up to date job doesn't read the grammar
+			def fail(*args):
+				raise AssertionError("grammar read")
+			parsegen.parse.read_file = fail
+			assert parsegen.batch.run_job(job) is None
+			job.check = False
+			assert "grammar read" in parsegen.batch.run_job(job)
+		finally:
+			parsegen.parse.read_file = read_file
+			if cache is None:
+				del os.environ["PARSEGEN_CACHE_DIR"]
+			else:
+				os.environ["PARSEGEN_CACHE_DIR"] = cache
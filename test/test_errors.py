@@ -43,4 +43,10 @@ class TestErrors(object):
 		e = GrammarError(e_str)
 		assert str(e).startswith('parsegen:')
 		assert 'grammar error' in str(e)
-		assert e_str in str(e)
\ No newline at end of file
+		assert e_str in str(e)
+		
+		e = InputError(e_str, 12)
+		assert str(e).startswith('parsegen:')
+		assert 'input error' in str(e)
+		assert e_str in str(e)
+		assert e.position == 12
\ No newline at end of file
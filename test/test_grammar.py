@@ -25,6 +25,7 @@ from nose.tools import *
 
 # Module to test
 from parsegen.data import *
+from parsegen.errors import GrammarError
 from parsegen.grammar import Grammar
 
 class TestGrammar(object):
@@ -48,4 +49,254 @@ class TestGrammar(object):
 		assert g.user_code == ""
 		assert g.header == h
 	
+	def test_nullable_chain(self):
+		
+		h = Header({"TOKEN": "Tok_TOKEN"}, {})
+		e = {}
+		for i in range(2000):
+			s = Symbol("sym%d" % i)
+			s.add_expansion(["sym%d" % (i + 1)])
+			s.add_expansion(["TOKEN"])
+			e[s.name] = s
+		s = Symbol("sym2000")
+		s.add_expansion([])
+		e[s.name] = s
+		g = Grammar(h, e, "")
+		
+		for s in e.values():
+			assert s.is_nullable()
+		assert e["sym0"].first == {"TOKEN"}
+		
+		# One evaluation per symbol for each of the first and follow sets,
+		# no repeated passes over the grammar
+		assert g.iterations == 2 * len(e)
+	
+	def test_cyclic_first(self):
+		
+		h = Header({"A": "A", "B": "B", "C": "C"}, {})
+		a, b, c = Symbol("a"), Symbol("b"), Symbol("c")
+		a.add_expansion(["b", "A"])
+		b.add_expansion(["c"])
+		b.add_expansion(["B"])
+		c.add_expansion(["a"])
+		c.add_expansion(["C"])
+		g = Grammar(h, {"a": a, "b": b, "c": c}, "")
+		
+		for s in (a, b, c):
+			assert s.first == {"B", "C"}
+			assert not s.is_nullable()
+		assert g.iterations >= 3
+	
+	def test_first_after_nullable_prefix(self):
+		
+		h = Header({"A": "A", "B": "B"}, {})
+		a, b = Symbol("a"), Symbol("b")
+		a.add_expansion(["b", "A"])
+		b.add_expansion(["B"])
+		b.add_expansion([])
+		Grammar(h, {"a": a, "b": b}, "")
+		
+		assert a.first == {"A", "B"}
+		assert b.follow == {"A"}
+	
+	def test_follow_and_predict(self):
+		
+		h = Header({"X": "Tok_X", "Y": "Tok_Y", "Z": "Tok_Z"}, {})
+		main, opt, tail = Symbol("main"), Symbol("opt"), Symbol("tail")
+		main.add_expansion(["opt", "tail", "Z"])
+		opt.add_expansion(["X"])
+		opt.add_expansion([])
+		tail.add_expansion(["Y", "tail"])
+		tail.add_expansion([])
+		g = Grammar(h, {"main": main, "opt": opt, "tail": tail}, "")
+		
+		assert g.start is main
+		assert main.follow == {END_OF_INPUT}
+		assert opt.follow == {"Y", "Z"}
+		assert tail.follow == {"Z"}
+		
+		assert g.predict(main.expansions[0]) == {"X", "Y", "Z"}
+		assert g.predict(opt.expansions[0]) == {"X"}
+		assert g.predict(opt.expansions[1]) == {"Y", "Z"}
+		assert g.predict(tail.expansions[1]) == {"Z"}
+		assert opt.expansions[1].predict == {"Y", "Z"}
+		assert opt.expansions[1].predictions == ["Tok_Y", "Tok_Z"]
+	
+	def test_symbol_table(self):
+		from array import array
+		
+		h = Header({"X": "Tok_X", "Y": "Tok_Y"}, {})
+		main, rest = Symbol("main"), Symbol("rest")
+		main.add_expansion(["X", "rest", "Y"])
+		rest.add_expansion(["rest", "X"])
+		rest.add_expansion([])
+		g = Grammar(h, {"main": main, "rest": rest}, "")
+		
+		t = g.symbol_table
+		x, y = t.code("X"), t.code("Y")
+		assert x >= 0 and y >= 0
+		assert 1 << x == h.terminal_table.bits(["X"])
+		assert t.code("main") == ~0
+		assert t.code("rest") == ~1
+		assert t.symbol(~1) is rest
+		assert t.name(~1) == "rest"
+		
+		e = main.expansions[0]
+		assert isinstance(e.codes, array)
+		assert list(e.codes) == [x, ~1, y]
+		assert e.names is None
+		assert e.tokens == ["X", "rest", "Y"]
+		assert rest.expansions[1].tokens == []
+		
+		assert_raises(KeyError, t.code, "missing")
+		assert_raises(KeyError, t.code, END_OF_INPUT)
+		
+		# Building another grammar from the same symbols encodes them again
+		g2 = Grammar(Header({"Y": "Tok_Y", "X": "Tok_X"}, {"start": "main"}),
+					 {"rest": rest, "main": main}, "")
+		assert main.expansions[0].tokens == ["X", "rest", "Y"]
+		assert main.expansions[0].codes[1] == ~0
+		assert main.first == {"X"}
+		assert rest.follow == {"X", "Y"}
+	
+	def test_end_of_input(self):
+		
+		h = Header({"X": "Tok_X"}, {"start": "main", "end_token": "Tok_EOF"})
+		other, main = Symbol("other"), Symbol("main")
+		other.add_expansion(["X"])
+		main.add_expansion(["other", "main"])
+		main.add_expansion([])
+		g = Grammar(h, {"other": other, "main": main}, "")
+		
+		assert g.start is main
+		assert main.expansions[1].predictions == ["Tok_EOF"]
+		assert other.follow == {"X", END_OF_INPUT}
+		
+		h = Header({}, {"start": "missing"})
+		s = Symbol("main")
+		s.add_expansion([])
+		assert_raises(GrammarError, lambda: Grammar(h, {"main": s}, ""))
+	
+	def test_conflicts(self):
+		
+		h = Header({"A": "A", "B": "B"}, {})
+		main, item = Symbol("main"), Symbol("item")
+		main.add_expansion(["A", "B"])
+		main.add_expansion(["B"])
+		main.add_expansion(["item"])
+		item.add_expansion(["A"])
+		item.add_expansion([])
+		g = Grammar(h, {"main": main, "item": item}, "")
+		
+		conflicts = g.conflicts()
+		assert len(conflicts) == 1
+		assert conflicts[0].symbol == "main"
+		assert conflicts[0].expansions == (0, 2)
+		assert conflicts[0].terminals == ["A"]
+		
+		h = Header({"A": "A", "B": "B"}, {})
+		main = Symbol("main")
+		main.add_expansion(["A"])
+		main.add_expansion(["B"])
+		assert Grammar(h, {"main": main}, "").conflicts() == []
+	
+	def test_add_expansion(self):
+		
+		h = Header({"X": "Tok_X", "Y": "Tok_Y"}, {})
+		main = Symbol("main")
+		main.add_expansion(["X"])
+		g = Grammar(h, {"main": main}, "")
+		
+		e = g.add_expansion("opt", [])
+		assert g.expansions["opt"].expansions == [e]
+		assert g.symbol_table.code("opt") == ~1
+		g.add_expansion("main", ["opt", "Y"])
+		g.add_expansion("opt", ["X", "opt"])
+		
+		assert main.first == {"X", "Y"}
+		assert g.expansions["opt"].follow == {"Y"}
+		assert e.predict == {"Y"}
+		assert [c.expansions for c in g.conflicts()] == [(0, 1)]
+		
+		assert_raises(GrammarError, g.add_expansion, "main", ["missing"])
+		assert_raises(GrammarError, g.add_expansion, "X", ["Y"])
+		assert len(main.expansions) == 2
+	
+	def test_remove_expansion(self):
+		
+		h = Header({"X": "Tok_X", "Y": "Tok_Y"}, {})
+		main, opt = Symbol("main"), Symbol("opt")
+		main.add_expansion(["opt", "Y"])
+		opt.add_expansion(["X"])
+		opt.add_expansion([])
+		g = Grammar(h, {"main": main, "opt": opt}, "")
+		
+		removed = g.remove_expansion("opt", 1)
+		assert removed.tokens == []
+		assert not opt.is_nullable()
+		assert main.first == {"X"}
+		
+		# A symbol without expansions is nullable
+		g.remove_expansion("opt", 0)
+		assert opt.is_nullable()
+		assert main.first == {"Y"}
+		assert main.expansions[0].predict == {"Y"}
+		
+		assert_raises(GrammarError, g.remove_expansion, "missing", 0)
+	
+	def test_add_terminal(self):
+		
+		h = Header({"X": "Tok_X"}, {})
+		main = Symbol("main")
+		main.add_expansion(["X"])
+		g = Grammar(h, {"main": main}, "")
+		
+		code = g.add_terminal("Y", "Tok_Y")
+		assert g.symbol_table.code("Y") == code
+		assert h.terminal_table.names[code] == "Y"
+		g.add_expansion("main", ["Y"])
+		assert main.first == {"X", "Y"}
+		assert main.expansions[1].predictions == ["Tok_Y"]
+		
+		g.add_terminal("Y", "Tok_Other")
+		assert main.expansions[1].predictions == ["Tok_Other"]
+		assert_raises(GrammarError, g.add_terminal, "main")
+	
+	def test_incremental_matches_full(self):
+		import random
+		
+		def sets(g):
+			return dict((name, (s.is_nullable(), set(s.first), set(s.follow),
+								[set(e.predict) for e in s.expansions]))
+						for name, s in g.expansions.items())
+		
+		def rebuilt(g):
+			e = {}
+			for name, s in g.expansions.items():
+				e[name] = Symbol(name)
+				for expansion in s.expansions:
+					e[name].add_expansion(expansion.tokens)
+			h = Header(dict(g.header.terminals), dict(g.header.options))
+			return Grammar(h, e, "")
+		
+		r = random.Random(0)
+		for trial in range(100):
+			h = Header({"A": "A", "B": "B"}, {})
+			g = Grammar(h, {}, "")
+			for step in range(40):
+				names = list(g.header.terminals) + list(g.expansions)
+				nonterminals = [s for s in g.expansions.values() if s.expansions]
+				choice = r.random()
+				if choice < 0.05:
+					g.add_terminal("T%d" % step)
+				elif choice < 0.65 or not nonterminals:
+					name = "n%d" % r.randrange(len(g.expansions) + 1)
+					tokens = [r.choice(names + [name])
+							  for _ in range(r.randint(0, 3))]
+					g.add_expansion(name, tokens)
+				else:
+					s = r.choice(nonterminals)
+					g.remove_expansion(s.name, r.randrange(len(s.expansions)))
+				assert sets(g) == sets(rebuilt(g)), (trial, step)
+	
 	# The parsing and stuff is tested in the test_parse suite
@@ -0,0 +1,158 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+from io import StringIO
+
+# Module to test
+from parsegen.optimise import *
+from parsegen.output import write_grammar
+from parsegen.parse import parse_buffer
+from parsegen.runtime import Parser
+
+GRAMMAR = """
+A
+B
+C
+%%
+main := item main
+main :=
+item := wrapped
+wrapped := A B C
+wrapped := A B
+wrapped := A C
+single := other
+other := B
+unused := single
+%%
+"""
+
+class TestOptimise(object):
+	"""Test Optimise
+	
+	Tests the `optimise` submodule, which makes grammars smaller without
+	changing the semantic actions their parsers call.
+	"""
+	
+	def setup(self):
+		self.original = parse_buffer(GRAMMAR)
+		self.grammar = optimise(self.original)
+	
+	def _symbol(self, name):
+		symbol = self.grammar.expansions[name]
+		return [(e.tokens, e.action, e.wrappers) for e in symbol.expansions]
+	
+	def test_prune(self):
+		
+		names = list(self.grammar.expansions)
+		assert names == ['main', 'item', 'item_tail', 'item_tail_tail']
+		assert self.grammar.start.name == 'main'
+		assert self.grammar.optimisation.unreachable == 4
+	
+	def test_collapse(self):
+		
+		assert self._symbol('main') == [
+			(['item', 'main'], None, ()),
+			([], None, ())
+		]
+		assert self.grammar.optimisation.collapsed == 1
+		
+		# Chains of unit rules pass the value through each of them, and
+		# cycles are left alone
+		g = optimise(parse_buffer("A\n%%\na := b\nb := c\nc := A\n%%\n"))
+		symbol = g.expansions['a']
+		assert list(g.expansions) == ['a']
+		assert symbol.expansions[0].action == 'c'
+		assert symbol.expansions[0].wrappers == ('b', 'a')
+		
+		g = optimise(parse_buffer("A\n%%\na := b\nb := a\nb := A\n%%\n"))
+		assert [(e.tokens, e.action) for e in g.expansions['a'].expansions] \
+			== [(['a'], 'b'), (['A'], 'b')]
+	
+	def test_left_factor(self):
+		
+		item_tail = self.grammar.expansions['item_tail']
+		assert self._symbol('item') == [(['A', 'item_tail'], None, ())]
+		assert self.grammar.expansions['item'].expansions[0].continues
+		assert item_tail.prefix == ('A',)
+		assert self._symbol('item_tail') == [
+			(['B', 'item_tail_tail'], None, ()),
+			(['C'], 'wrapped', ('item',))
+		]
+		assert self.grammar.expansions['item_tail_tail'].prefix == ('A', 'B')
+		assert item_tail.expansions[1].arguments == ['A', 'C']
+		assert self.grammar.optimisation.factored == 2
+		
+		assert self.original.conflicts()
+		assert not self.grammar.conflicts()
+	
+	def test_factor_unit(self):
+		
+		# The unit rule shares its prefix with the other expansion, so is
+		# factored rather than collapsed
+		original = parse_buffer(
+			"NUM\nPLUS\n%%\ne := t PLUS e\ne := t\nt := NUM\n%%\n")
+		g = optimise(original)
+		assert original.conflicts()
+		assert not g.conflicts()
+		assert [e.tokens for e in g.expansions['e'].expansions] == \
+			[['t', 'e_tail']]
+		assert Parser(g).parse(['NUM', 'PLUS', 'NUM']) == ('e', [
+			('t', ['NUM']), 'PLUS', ('e', [('t', ['NUM'])])])
+	
+	def test_trees(self):
+		
+		tokens = ['A', 'B', 'C', 'A', 'B', 'A', 'C']
+		tree = Parser(self.grammar).parse(tokens)
+		item = lambda *values: ('item', [('wrapped', list(values))])
+		assert tree == ('main', [item('A', 'B', 'C'), ('main', [
+			item('A', 'B'), ('main', [item('A', 'C'), ('main', [])])])])
+	
+	def test_actions(self):
+		
+		out = StringIO()
+		write_grammar(self.grammar, out, language="c-table")
+		text = out.getvalue()
+		assert "return item_sem_n(wrapped_sem_ttt(" in text
+		assert "yy_args_len" in text
+		assert "item_tail_sem" not in text
+		
+		out = StringIO()
+		write_grammar(self.grammar, out, language="c")
+		text = out.getvalue()
+		assert "item_tail(yy_token_t *tokens, yy_node_t* *nodes);" in text
+		assert "return item_tail(tokens, nodes);" in text
+	
+	def test_option(self):
+		
+		assert parse_buffer(GRAMMAR).optimisation is None
+		g = parse_buffer("%optimize\n" + GRAMMAR)
+		assert g.optimisation.after.symbols == 4
+		g = parse_buffer("%optimize = no\n" + GRAMMAR)
+		assert g.optimisation is None
+		g = parse_buffer("%optimize\n" + GRAMMAR, optimize=False)
+		assert g.optimisation is None
+		
+		report = summary(self.grammar.optimisation)
+		assert "symbols 6 -> 4" in report
+		assert "2 prefixes factored" in report
@@ -68,3 +68,76 @@ class TestOptions(object):
             assert opts.output_file == sys.stdout
             assert opts.input_file.name == f.name
             opts.input_file.close()
+
+        # The output file isn't opened, so it isn't truncated either
+        with NamedTemporaryFile() as f:
+            f.write(b"old")
+            f.flush()
+            opts = parse(['-o', f.name, f.name])
+            assert opts.output_file is None
+            assert opts.output == f.name
+            assert open(f.name).read() == "old"
+            opts.input_file.close()
+
+        with NamedTemporaryFile() as f:
+            opts = parse(['--conflicts', 'json', f.name])
+            assert opts.conflicts == 'json'
+            opts.input_file.close()
+
+        with NamedTemporaryFile() as f:
+            assert_raises(SystemExit,
+                          wrapped(lambda : parse(['--conflicts=xml', f.name])))
+
+    def test_batch(self):
+
+        opts = parse(['--batch', '-j', '2', 'a.grammar', 'b.grammar',
+                      'prefix=p_', '-o', 'out'])
+        assert opts.batch
+        assert opts.jobs == 2
+        assert opts.grammars == ['a.grammar', 'b.grammar']
+        assert opts.options == {'prefix': 'p_'}
+        assert opts.output == 'out'
+        assert opts.input_file is None
+
+        opts = parse(['--manifest', 'jobs.txt'])
+        assert opts.batch
+        assert opts.manifests == ['jobs.txt']
+        assert opts.grammars == []
+
+    def test_depfile(self):
+
+        with NamedTemporaryFile() as f:
+            opts = parse(['-M', 'out.d', '--check', '-o', 'out.c', f.name])
+            assert opts.depfile == 'out.d'
+            assert opts.check
+            opts.input_file.close()
+
+            opts = parse(['--depfile=out.d', f.name])
+            assert opts.depfile == 'out.d'
+            assert not opts.check
+            opts.input_file.close()
+
+    def test_optimize(self):
+
+        with NamedTemporaryFile() as f:
+            opts = parse(['-O', f.name])
+            assert opts.optimize
+            opts.input_file.close()
+
+            # Leaves it to the grammar unless given
+            opts = parse([f.name])
+            assert opts.optimize is None
+            opts.input_file.close()
+
+    def test_stats(self):
+
+        with NamedTemporaryFile() as f:
+            opts = parse(['--stats', '--profile', 'out.prof', f.name])
+            assert opts.stats
+            assert opts.profile == 'out.prof'
+            opts.input_file.close()
+
+            opts = parse([f.name])
+            assert not opts.stats
+            assert opts.profile is None
+            opts.input_file.close()
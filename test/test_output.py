@@ -22,9 +22,14 @@
 
 # Test helpers
 from nose.tools import *
+from io import StringIO
+import contextlib
+import json
+import pystache
 import sys
 
 # Module to test
+from parsegen.errors import ParsegenError
 from parsegen.utils import Struct
 from parsegen.parse import parse_buffer
 from parsegen.output import *
@@ -60,6 +65,521 @@ class TestOutput(object):
 		write_grammar(g, sys.stdout, language="pretty_print")
 		write_grammar(g, sys.stdout, language="c")
 		
+	def test_end_token(self):
+		
+		# Every backend sees the end token given on the command line
+		g = parse_buffer("A\n%end_token = Tok_END\n%%\nmain := A main\n"
+						 "main :=\n%%\n")
+		for language, text in (("pretty_print", "{EOF}"), ("c", "case EOF:"),
+							   ("c-table", "case EOF:")):
+			out = StringIO()
+			write_grammar(g, out, {"end_token": "EOF"}, language)
+			assert text in out.getvalue(), language
+			assert "Tok_END" not in out.getvalue(), language
+		
+		out = StringIO()
+		write_grammar(g, out, language="pretty_print")
+		assert "{Tok_END}" in out.getvalue()
+		
+	def test_conflicts(self):
+		g = parse_buffer("""
+		A
+		B
+		%%
+		main := A B
+		main := item
+		item := A
+		item := B
+		%%
+		""")
+		
+		f = StringIO()
+		write_grammar(g, f, language="conflicts")
+		assert "CONFLICT IN SYMBOL main" in f.getvalue()
+		assert f.getvalue().endswith("1 conflicts\n")
+		
+		f = StringIO()
+		write_grammar(g, f, language="conflicts-json")
+		report = json.loads(f.getvalue())
+		assert report['count'] == 1
+		conflict = report['conflicts'][0]
+		assert conflict['symbol'] == 'main'
+		assert [e['index'] for e in conflict['expansions']] == [0, 1]
+		assert conflict['expansions'][1]['tokens'] == ['item']
+		assert conflict['terminals'] == ['A']
+		
+	def test_c_table(self):
+		from parsegen.output.c_table import CTableOutputFormatter
+		
+		g = parse_buffer("""
+		WORLD
+		%%
+		main := hello main
+		main := 
+		hello := WORLD
+		%%
+		""")
+		
+		fmt = CTableOutputFormatter(g, {"prefix": "pg_"})
+		fmt.stats_file = StringIO()
+		f = StringIO()
+		fmt.write(f)
+		
+		assert "pg_parse_symbol(int symbol)" in f.getvalue()
+		assert "hello_sem_t(\n\t\t\targs[0].token\n" in f.getvalue()
+		assert fmt.stats_file.getvalue().startswith("parsegen: c-table: 2 rows")
+		
+	def test_loops(self):
+		
+		g = parse_buffer("""
+		A
+		B
+		%%
+		list := A item list
+		list :=
+		item := B
+		%%
+		""")
+		
+		out = StringIO()
+		write_grammar(g, out, language="c")
+		c = out.getvalue()
+		assert c.count("for (;;)") == 1
+		assert "nodes[1] = result;\n\t\t\tresult = list_sem_tnn(" in c
+		assert "nodes[1] = list();" not in c
+		
+		out = StringIO()
+		write_grammar(g, out, language="ruby")
+		ruby = out.getvalue()
+		assert ruby.count("while true") == 1
+		assert "expansion << list\n" not in ruby
+	
+	def test_loops_ruby(self):
+		import shutil, subprocess, tempfile
+		from unittest import SkipTest
+		
+		ruby = shutil.which("ruby")
+		if not ruby:
+			raise SkipTest("no ruby")
+		
+		# Runs with the default prefix, and with a list too long to parse
+		# with a call for every element
+		g = parse_buffer("""
+		A = 1
+		B = 2
+		%lexer_include = "set"
+		%lexer_function = ($toks.shift || 0)
+		%%
+		list := A item list
+		list :=
+		item := B
+		%%
+		$toks = [1, 2] * 100000
+		node = list
+		count = 0
+		until node.empty?
+		  raise "bad item" unless node[1] == [2]
+		  count += 1
+		  node = node[2]
+		end
+		puts count
+		""")
+		
+		with tempfile.NamedTemporaryFile("w", suffix=".rb") as f:
+			write_grammar(g, f, language="ruby")
+			f.flush()
+			out = subprocess.check_output([ruby, f.name],
+										  universal_newlines=True)
+		assert out == "100000\n"
+	
+	def _run_c(self, g, header, *flags, language="c"):
+		"""Compiles the C parser for a grammar, with `header` as its lexer
+		include, and returns the exit status of running it."""
+		import os, shutil, subprocess, tempfile
+		from unittest import SkipTest
+		
+		cc = shutil.which("cc") or shutil.which("gcc")
+		if not cc:
+			raise SkipTest("no C compiler")
+		
+		directory = tempfile.mkdtemp()
+		try:
+			with open(os.path.join(directory, "lexer.h"), "w") as f:
+				f.write(header)
+			source = os.path.join(directory, "parser.c")
+			with open(source, "w") as f:
+				write_grammar(g, f, language=language)
+			binary = os.path.join(directory, "parser")
+			subprocess.check_call(
+				[cc, "-w", "-o", binary, source] + list(flags))
+			run = subprocess.run([binary], stdout=subprocess.PIPE,
+								 universal_newlines=True)
+			sys.stdout.write(run.stdout)
+			return run.returncode
+		finally:
+			shutil.rmtree(directory)
+	
+	def test_loops_compile(self):
+		
+		# A list a million elements long would overflow the stack if every
+		# element took a call of its own
+		g = parse_buffer("""
+		A = 1
+		B = 2
+		%node_type = long
+		%token_type = int
+		%lexer_include = "lexer.h"
+		%lexer_function = next()
+		%%
+		list := A item list
+		list :=
+		item := B
+		%%
+		static long count = 2000000;
+		int next(void) { return count-- > 0 ? 2 - count % 2 : 0; }
+		long list_sem_tnn(int a, long item, long rest) { return rest + item; }
+		long list_sem_(void) { return 1; }
+		long item_sem_t(int b) { return 2; }
+		int main(void) { return list() == 2000001 ? 0 : 1; }
+		""")
+		
+		assert self._run_c(g, "int next(void);\n") == 0
+	
+	def test_reentrant(self):
+		
+		source = """
+		A
+		%%
+		list := A list
+		list :=
+		%%
+		"""
+		
+		out = StringIO()
+		write_grammar(parse_buffer(source), out, language="c")
+		assert "static yy_token_t next_token;" in out.getvalue()
+		assert "yy_parser_t" not in out.getvalue()
+		
+		out = StringIO()
+		write_grammar(parse_buffer(source), out, language="c",
+					  options={"reentrant": ""})
+		c = out.getvalue()
+		assert "static yy_token_t next_token;" not in c
+		assert "yy_node_t* yy_parse_list(yy_parser_t *parser)\n{" in c
+		assert "list_sem_tn\n\t(yy_token_t,yy_node_t*,yy_parser_t *);" in c
+		assert "list_sem_\n\t(yy_parser_t *);" in c
+		assert "\treturn yy_parse_list(&yy__default_parser);" in c
+		
+		out = StringIO()
+		write_grammar(parse_buffer(source), out, language="c",
+					  options={"reentrant": "no"})
+		assert "yy_parser_t" not in out.getvalue()
+	
+	def test_reentrant_threads(self):
+		
+		# Every thread parses lists of its own, counting the actions called
+		# in its parser's context. Parses per second are printed for each
+		# number of threads.
+		g = parse_buffer("""
+		A = 1
+		B = 2
+		%reentrant
+		%node_type = long
+		%token_type = int
+		%lexer_include = "lexer.h"
+		%lexer_function = next(parser->lexer)
+		%%
+		list := A item list
+		list :=
+		item := B
+		%%
+		#include <pthread.h>
+		#include <time.h>
+		
+		struct lexer { long count; };
+		
+		int next(void *lexer)
+		{
+			struct lexer *l = lexer;
+			return l->count-- > 0 ? 2 - l->count % 2 : 0;
+		}
+		
+		long list_sem_tnn(int a, long item, long rest, yy_parser_t *parser)
+		{
+			++*(long *)parser->context;
+			return rest + item;
+		}
+		long list_sem_(yy_parser_t *parser) { return 1; }
+		long item_sem_t(int b, yy_parser_t *parser) { return 2; }
+		
+		static void *work(void *arg)
+		{
+			long *failures = arg;
+			for (long i = 0; i < 200; i++) {
+				long calls = 0, count = 2 * (1000 + i);
+				struct lexer lexer = { count };
+				yy_parser_t parser;
+				yy_parser_init(&parser, &lexer, &calls);
+				if (yy_parse_list(&parser) != count + 1 || calls != count / 2)
+					++*failures;
+			}
+			return NULL;
+		}
+		
+		int main(void)
+		{
+			long failures[8] = { 0 }, total = 0;
+			pthread_t threads[8];
+			struct timespec start, end;
+			
+			for (int n = 1; n <= 8; n *= 2) {
+				clock_gettime(CLOCK_MONOTONIC, &start);
+				for (int i = 0; i < n; i++)
+					pthread_create(&threads[i], NULL, work, &failures[i]);
+				for (int i = 0; i < n; i++)
+					pthread_join(threads[i], NULL);
+				clock_gettime(CLOCK_MONOTONIC, &end);
+				
+				double seconds = end.tv_sec - start.tv_sec +
+					(end.tv_nsec - start.tv_nsec) / 1e9;
+				printf("%d threads: %.0f parses/s\\n", n, n * 200 / seconds);
+			}
+			
+			for (int i = 0; i < 8; i++)
+				total += failures[i];
+			return total != 0;
+		}
+		""")
+		
+		assert self._run_c(g, "int next(void *lexer);\n", "-pthread") == 0
+	
+	def test_arena(self):
+		
+		# The nodes of a list are built in an arena. Parsing again after a
+		# reset reuses its chunks rather than taking more from malloc.
+		g = parse_buffer("""
+		A = 1
+		B = 2
+		%arena
+		%arena_chunk_size = 4096
+		%reentrant
+		%node_type = struct node *
+		%token_type = int
+		%lexer_include = "lexer.h"
+		%lexer_function = next(parser->lexer)
+		%%
+		list := A item list
+		list :=
+		item := B
+		%%
+		struct node { long value; struct node *next; };
+		
+		int next(void *lexer)
+		{
+			long *count = lexer;
+			return (*count)-- > 0 ? 2 - *count % 2 : 0;
+		}
+		
+		struct node *list_sem_tnn(int a, struct node *item, struct node *rest,
+								  yy_arena_t *arena, yy_parser_t *parser)
+		{
+			item->next = rest;
+			return item;
+		}
+		struct node *list_sem_(yy_arena_t *arena, yy_parser_t *parser)
+		{
+			return NULL;
+		}
+		struct node *item_sem_t(int b, yy_arena_t *arena, yy_parser_t *parser)
+		{
+			struct node *node = yy_arena_alloc(arena, sizeof(*node));
+			node->value = *(long *)parser->lexer;
+			return node;
+		}
+		
+		static long chunks(yy_arena_t *arena)
+		{
+			long n = 0;
+			for (yy_arena_chunk_t *c = arena->first; c; c = c->next)
+				n++;
+			return n;
+		}
+		
+		static int check(yy_arena_t *arena)
+		{
+			long count = 200000, expected = count;
+			yy_parser_t parser;
+			
+			yy_parser_init(&parser, &count, NULL, arena);
+			for (struct node *n = yy_parse_list(&parser); n; n = n->next) {
+				expected -= 2;
+				if (n->value != expected)
+					return 0;
+			}
+			return expected == 0;
+		}
+		
+		int main(void)
+		{
+			yy_arena_t arena = { NULL, NULL, 0 };
+			long used;
+			
+			if (!check(&arena))
+				return 1;
+			used = chunks(&arena);
+			yy_arena_reset(&arena);
+			if (!check(&arena) || chunks(&arena) != used)
+				return 2;
+			yy_arena_free(&arena);
+			return chunks(&arena) != 0;
+		}
+		""")
+		
+		assert self._run_c(g, "int next(void *lexer);\n") == 0
+	
+	def test_push(self):
+		
+		# A thousand parses are started at once, and each token is pushed
+		# into one of them in turn, as an event loop would as input arrives
+		g = parse_buffer("""
+		A = 1
+		B = 2
+		%push
+		%node_type = long
+		%token_type = int
+		%lexer_include = "lexer.h"
+		%%
+		list := A item list
+		list :=
+		item := B
+		%%
+		long list_sem_tnn(int a, long item, long rest) { return rest + item; }
+		long list_sem_(void) { return 1; }
+		long item_sem_t(int b) { return 2; }
+		
+		#define PARSES 1000
+		
+		int main(void)
+		{
+			static yy_push_parser_t states[PARSES];
+			long i, pushed[PARSES] = { 0 };
+			int status, done = 0;
+			
+			for (i = 0; i < PARSES; i++)
+				if (list_push_start(&states[i]) != yy_NEED_MORE)
+					return 1;
+			
+			/* Parse i is a list of i elements */
+			while (done < PARSES) {
+				for (i = 0; i < PARSES; i++) {
+					if (states[i].status != yy_NEED_MORE)
+						continue;
+					status = yy_push_token(&states[i],
+						pushed[i] == 2 * i ? 0 : 1 + pushed[i] % 2);
+					pushed[i]++;
+					if (status == yy_ERROR)
+						return 2;
+					if (status == yy_ACCEPT) {
+						if (states[i].result != 1 + 2 * i || states[i].consumed)
+							return 3;
+						yy_push_free(&states[i]);
+						done++;
+					}
+				}
+			}
+			
+			/* Nothing more is parsed once a parse is over */
+			return yy_push_token(&states[0], 1) != yy_ACCEPT;
+		}
+		""")
+		
+		assert self._run_c(g, "", language="c-table") == 0
+		
+		out = StringIO()
+		with contextlib.redirect_stderr(StringIO()):
+			write_grammar(g, out, language="c-table")
+		assert "peek_next_token" not in out.getvalue()
+		assert "yy_parse_symbol" not in out.getvalue()
+	
+	def test_template_cache(self):
+		from parsegen.output import mustache
+		import os
+		import tempfile
+		
+		with tempfile.NamedTemporaryFile("w", suffix=".mustache") as f:
+			f.write("hello {{name}}")
+			f.flush()
+			
+			first = mustache._load_template(f.name)
+			assert mustache._load_template(f.name) is first
+			
+			f.seek(0)
+			f.write("bye {{name}}!")
+			f.truncate()
+			f.flush()
+			stat = os.stat(f.name)
+			os.utime(f.name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+			
+			second = mustache._load_template(f.name)
+			assert second is not first
+			
+			out = StringIO()
+			template = mustache._StreamingTemplate(second, out)
+			pystache.Renderer().render(template, {'name': 'world'})
+			assert out.getvalue() == "bye world!"
+	
+	def test_streaming(self):
+		from parsegen.output import mustache
+		
+		source = """
+		A = Tok_A
+		B = Tok_B
+		%%
+		main := A main
+		main := B
+		%%
+		a & b
+		"""
+		
+		for language in ["c", "ruby"]:
+			g = parse_buffer(source)
+			fmt = find_formatter(g, language)(g, None)
+			fmt._update_state()
+			with open(fmt._template_path()) as f:
+				expected = pystache.render(f.read(), fmt)
+			
+			out = StringIO()
+			write_grammar(parse_buffer(source), out, language=language)
+			assert out.getvalue() == expected
+		
+		# Without the pystache internals it needs the output is rendered in
+		# one piece, and is the same
+		section = mustache._SectionNode
+		try:
+			mustache._SectionNode = None
+			for language in ["c", "ruby"]:
+				streamed, whole = StringIO(), StringIO()
+				write_grammar(parse_buffer(source.encode("utf-8")), whole,
+							  language=language)
+				mustache._SectionNode = section
+				write_grammar(parse_buffer(source.encode("utf-8")), streamed,
+							  language=language)
+				mustache._SectionNode = None
+				assert whole.getvalue() == streamed.getvalue()
+				assert "a & b" in whole.getvalue()
+		finally:
+			mustache._SectionNode = section
+		
+	def test_user_code(self):
+		
+		source = b"A = Tok_A\n%%\nmain := A\n%%\nif (a < b && c) { }\n"
+		
+		for language in ["c", "c-table", "ruby"]:
+			out = StringIO()
+			with contextlib.redirect_stderr(StringIO()):
+				write_grammar(parse_buffer(source), out, language=language)
+			assert "\nif (a < b && c) { }\n" in out.getvalue()
+		
 	def test_options(self):
 
 		g = parse_buffer("""
@@ -91,7 +611,168 @@ class TestOutput(object):
 			"token_type": "Lex_Token",
 			"node_type": "bar_node_t*",
 			"token_type_access": '',
-			"lexer_include": "lexer.h"
+			"lexer_include": "lexer.h",
+			"end_token": "0"
 		}
 		
 		assert ctx.options == Struct(opts)
+
+	def test_write_grammar_file(self):
+		import os, shutil, stat, tempfile
+		
+		def g():
+			return parse_buffer("A = Tok_A\n%%\nmain := A main\nmain :=\n%%\n")
+		
+		directory = tempfile.mkdtemp()
+		try:
+			path = os.path.join(directory, "out.c")
+			assert write_grammar_file(g(), path, language="c")
+			with open(path) as f:
+				text = f.read()
+			out = StringIO()
+			write_grammar(g(), out, language="c")
+			assert text == out.getvalue()
+			
+			# An unchanged file is left alone
+			os.chmod(path, 0o640)
+			os.utime(path, (1, 1))
+			assert not write_grammar_file(g(), path, language="c")
+			assert os.stat(path).st_mtime == 1
+			
+			# A changed one is replaced, keeping its permissions
+			assert write_grammar_file(g(), path, {"prefix": "p_"}, "c")
+			assert os.stat(path).st_mtime != 1
+			assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+			assert os.listdir(directory) == ["out.c"]
+			
+			# A symlink is written through rather than replaced
+			link = os.path.join(directory, "link.c")
+			os.symlink("out.c", link)
+			assert write_grammar_file(g(), link, language="c")
+			assert os.path.islink(link)
+			with open(path) as f:
+				assert f.read() == text
+			assert sorted(os.listdir(directory)) == ["link.c", "out.c"]
+		finally:
+			shutil.rmtree(directory)
+	
+	def test_write_grammar_files(self):
+		import os, shutil, tempfile
+		from parsegen.output.c import COutputFormatter
+		from parsegen.output.ruby import RubyFormatter
+		
+		source = "A = Tok_A\n%%\nmain := A main\nmain :=\n%%\n"
+		g = parse_buffer(source)
+		
+		# The grammar isn't changed by writing it, so it can be written again
+		first, second = StringIO(), StringIO()
+		write_grammar(g, first, language="c")
+		write_grammar(g, second, language="c")
+		assert first.getvalue() == second.getvalue()
+		
+		# Formatters that build the same views of the symbols share them
+		c, ruby = COutputFormatter(g), RubyFormatter(g)
+		c._update_state()
+		ruby._update_state()
+		assert c.symbols is ruby.symbols
+		g.add_expansion("main", [])
+		ruby._update_state()
+		assert c.symbols is not ruby.symbols
+		g.remove_expansion("main", 2)
+		
+		directory = tempfile.mkdtemp()
+		try:
+			languages = ["c", "c-table", "ruby", "pretty_print"]
+			targets = [(l, os.path.join(directory, l)) for l in languages]
+			assert write_grammar_files(g, targets) == [True] * 4
+			assert write_grammar_files(g, targets, workers=2) == [False] * 4
+			
+			for language, path in targets:
+				out = StringIO()
+				write_grammar(parse_buffer(source), out, language=language)
+				with open(path) as f:
+					assert f.read() == out.getvalue(), language
+		finally:
+			shutil.rmtree(directory)
+	
+	def test_deterministic(self):
+		import os, subprocess
+		
+		root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+		code = """
+import sys
+from parsegen.parse import parse_file
+from parsegen.output import write_grammar
+for language in ("c", "c-table", "ruby", "conflicts-json"):
+	write_grammar(parse_file(open({0!r})), sys.stdout, language=language)
+""".format(os.path.join(root, "grammars", "lisp-like.grammar"))
+		
+		outputs = set()
+		for seed in ("1", "2", "3"):
+			env = dict(os.environ, PYTHONPATH=root, PYTHONHASHSEED=seed)
+			outputs.add(subprocess.check_output(
+				[sys.executable, "-c", code], env=env,
+				stderr=subprocess.DEVNULL))
+		assert len(outputs) == 1
+
+class TestRegistry(object):
+	"""Test Registry
+	
+	Tests looking up formatters by language name.
+	"""
+	
+	def setup(self):
+		import parsegen.output
+		self.saved = dict(language_hash)
+		self.loaded = parsegen.output._entry_points_loaded
+		self.grammar = parse_buffer("A = a\n%%\nmain := A\n%%\n")
+	
+	def teardown(self):
+		import parsegen.output
+		language_hash.clear()
+		language_hash.update(self.saved)
+		parsegen.output._entry_points_loaded = self.loaded
+	
+	def test_lazy(self):
+		
+		register_formatter("Lazy Print",
+						   "parsegen.output.pretty_print:PrettyPrintFormatter")
+		assert isinstance(language_hash["LAZY-PRINT"], str)
+		
+		from parsegen.output.pretty_print import PrettyPrintFormatter
+		assert find_formatter(self.grammar, "lazy_print") is \
+			PrettyPrintFormatter
+		assert language_hash["LAZY-PRINT"] is PrettyPrintFormatter
+	
+	def test_errors(self):
+		
+		register_formatter("missing", "parsegen.output.missing:Formatter")
+		register_formatter("no-class", "parsegen.output.c:Missing")
+		
+		for language in ["missing", "no-class", "cobol"]:
+			assert_raises(ParsegenError, find_formatter, self.grammar,
+						  language)
+	
+	def test_entry_points(self):
+		import importlib.metadata
+		import parsegen.output
+		
+		entry = importlib.metadata.EntryPoint(
+			name="plugin", group=ENTRY_POINT_GROUP,
+			value="parsegen.output.pretty_print:PrettyPrintFormatter")
+		shadow = importlib.metadata.EntryPoint(
+			name="c", group=ENTRY_POINT_GROUP,
+			value="parsegen.output.ruby:RubyFormatter")
+		
+		original = importlib.metadata.entry_points
+		importlib.metadata.entry_points = lambda **kw: [entry, shadow]
+		parsegen.output._entry_points_loaded = False
+		try:
+			fmt = find_formatter(self.grammar, "plugin")
+		finally:
+			importlib.metadata.entry_points = original
+		
+		from parsegen.output.pretty_print import PrettyPrintFormatter
+		from parsegen.output.c import COutputFormatter
+		assert fmt is PrettyPrintFormatter
+		assert find_formatter(self.grammar, "c") is COutputFormatter
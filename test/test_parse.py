@@ -74,8 +74,50 @@ class TestParse(object):
 
 	def test_parse_buffer_errors(self):
 		
-		assert_raises(ParseError, lambda: parse_buffer(" %% %% %% "))
 		assert_raises(ParseError, lambda: parse_buffer(" %% "))
+		assert_raises(ParseError, lambda: parse_buffer(""))
+		
+		assert_raises(ParseError, parse_buffer, "A\n  %%\n  B C\n%%")
+		try:
+			parse_buffer("A\n%%\nmain := A\n\n  main A # no :=\n%%\n")
+		except ParseError as e:
+			assert e.line == 5
+			assert e.column == 3
+			assert "line 5, column 3" in str(e)
+		else:
+			assert False, "expected a ParseError"
+		
+		try:
+			parse_buffer("A\n%%\nmain := A\n")
+		except ParseError as e:
+			assert "expected 3 sections but found 2" in str(e)
+			assert e.line == 4
+		else:
+			assert False, "expected a ParseError"
+		
+		try:
+			parse_buffer("A\n%%\n  bad name := A\n%%\n")
+		except ParseError as e:
+			assert "invalid symbol name 'bad name'" in str(e)
+			assert (e.line, e.column) == (3, 3)
+		else:
+			assert False, "expected a ParseError"
+	
+	def test_user_code_separators(self):
+		
+		g = parse_buffer(" %% %% %% ")
+		assert g.user_code == " %% "
+		
+		g = parse_buffer("""A = Tok_A # %% in a comment
+%%
+main := A # so is this %%
+%%
+printf("%%d", 100 %% 7);
+%%
+""")
+		assert g.header.terminals == {'A': 'Tok_A'}
+		assert len(g.expansions['main'].expansions) == 1
+		assert g.user_code == '\nprintf("%%d", 100 %% 7);\n%%\n'
 	
 	def test_token_extraction(self):
 		h = parse_buffer("""
@@ -135,7 +177,10 @@ class TestParse(object):
 		
 		# Check the follow sets
 		print(main.follow, bar.follow, bar_prime.follow, baz.follow)
-		assert main.follow == set()
+		assert main.follow == {'$'}
+		assert bar.follow == {'FOO', 'BAZ'}
+		assert bar_prime.follow == {'FOO', 'BAZ'}
+		assert baz.follow == {'FOO', 'BAZ'}
 	
 	def test_invalid_expansions(self):
 		
@@ -146,3 +191,58 @@ class TestParse(object):
 		assert_raises(
 			GrammarError, lambda: parse_buffer(
 				"TOKEN %% TOKEN := invalid \n invalid := %% "))
+	
+	def test_parse_file(self):
+		import mmap
+		import os
+		import tempfile
+		
+		source = "A = Tok_A\n%%\nmain := A main\nmain :=\n%%\ncode %% \u00e9\n"
+		data = source.encode("utf-8")
+		
+		fd, path = tempfile.mkstemp()
+		try:
+			with os.fdopen(fd, "wb") as f:
+				f.write(data)
+			
+			with open(path) as f:
+				text_file = parse_file(f)
+			with open(path, "rb") as f:
+				mapped = parse_file(mmap.mmap(f.fileno(), 0,
+											  access=mmap.ACCESS_READ))
+			
+			grammars = [
+				parse_file(path), parse_file(data), parse_file(bytearray(data)),
+				parse_file(memoryview(data)), mapped, text_file
+			]
+		finally:
+			os.remove(path)
+		
+		for g in grammars:
+			assert g.header.terminals == {'A': 'Tok_A'}
+			assert len(g.expansions['main'].expansions) == 2
+			assert g.expansions['main'].first == {'A'}
+			assert g.user_code == "\ncode %% \u00e9\n"
+		
+		# Only buffers of bytes keep the user code as a range
+		assert isinstance(grammars[0].user_code, UserCode)
+		assert isinstance(grammars[1].user_code, UserCode)
+		assert grammars[1].user_code.start == data.index(b"\ncode")
+		assert isinstance(parse_buffer(source).user_code, str)
+	
+	def test_bytes_errors(self):
+		
+		try:
+			parse_buffer(b"A\n%%\n  main := \xff\n%%\n")
+		except ParseError as e:
+			assert "invalid UTF-8" in str(e)
+			assert (e.line, e.column) == (3, 11)
+		else:
+			assert False, "expected a ParseError"
+		
+		try:
+			parse_buffer(b"A\n%%\n  main A\n%%\n")
+		except ParseError as e:
+			assert (e.line, e.column) == (3, 3)
+		else:
+			assert False, "expected a ParseError"
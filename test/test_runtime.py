@@ -0,0 +1,132 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+import gc
+
+# Module to test
+from parsegen.errors import *
+from parsegen.parse import parse_buffer
+from parsegen.runtime import *
+
+class TestParser(object):
+	"""Test Parser
+	
+	Tests the `runtime` submodule. This parses token streams in-process
+	directly from a grammar.
+	"""
+	
+	def setup(self):
+		self.grammar = parse_buffer("""
+		NEWLINE
+		PLUS
+		NUMBER
+		%%
+		lines := line NEWLINE lines
+		lines :=
+		line := NUMBER line_prime
+		line_prime := PLUS NUMBER line_prime
+		line_prime :=
+		%%
+		""")
+	
+	def test_tree(self):
+		
+		p = Parser(self.grammar)
+		
+		assert p.parse([]) == ('lines', [])
+		assert p.parse(['NUMBER', 'NEWLINE']) == ('lines', [
+			('line', ['NUMBER', ('line_prime', [])]),
+			'NEWLINE',
+			('lines', [])
+		])
+		assert p.parse(['NUMBER', 'PLUS', 'NUMBER', 'NEWLINE']) == ('lines', [
+			('line', ['NUMBER', ('line_prime', [
+				'PLUS', 'NUMBER', ('line_prime', [])
+			])]),
+			'NEWLINE',
+			('lines', [])
+		])
+	
+	def test_reduce(self):
+		
+		def add(expansion, values):
+			if expansion.symbol.name == 'line':
+				return values[0][1] + values[1]
+			elif expansion.symbol.name == 'line_prime':
+				return values[1][1] + values[2] if values else 0
+			elif values:
+				return [values[0]] + values[2]
+			return []
+		
+		tokens = [('NUMBER', 1), ('PLUS', 0), ('NUMBER', 2), ('NEWLINE', 0),
+				  ('NUMBER', 3), ('NEWLINE', 0)]
+		p = Parser(self.grammar, kind=lambda token: token[0])
+		assert p.parse(tokens, reduce=add) == [3, 3]
+	
+	def test_long_input(self):
+		
+		p = Parser(self.grammar)
+		tokens = ['NUMBER'] + ['PLUS', 'NUMBER'] * 100000 + ['NEWLINE']
+		count = [0]
+		def reduce(expansion, values):
+			count[0] += 1
+		p.parse(iter(tokens), reduce=reduce)
+		assert count[0] == 100004
+	
+	def test_gc(self):
+		
+		p = Parser(self.grammar)
+		states = []
+		def reduce(expansion, values):
+			states.append(gc.isenabled())
+		
+		p.parse(['NUMBER', 'NEWLINE'], reduce=reduce)
+		assert all(states)
+		
+		del states[:]
+		p.parse(['NUMBER', 'NEWLINE'], reduce=reduce, disable_gc=True)
+		assert not any(states)
+		assert gc.isenabled()
+	
+	def test_errors(self):
+		
+		p = Parser(self.grammar)
+		
+		assert_raises(InputError, lambda: p.parse(['PLUS']))
+		assert_raises(InputError, lambda: p.parse(['NUMBER']))
+		assert_raises(InputError, lambda: p.parse(['NUMBER', 'UNKNOWN']))
+		
+		# A token named like the end of the input doesn't end it
+		assert_raises(InputError, lambda: p.parse(['$']))
+		assert_raises(InputError, lambda: p.parse(['NUMBER', 'NEWLINE', '$']))
+		
+		try:
+			p.parse(['NUMBER', 'NEWLINE', 'NUMBER', 'PLUS', 'PLUS'])
+		except InputError as e:
+			assert e.position == 4
+			assert 'expected one of NUMBER' in str(e)
+		else:
+			assert False
+		
+		assert_raises(GrammarError, lambda: Parser(parse_buffer("%% %%")))
@@ -0,0 +1,175 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+import contextlib
+import io
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+# Module to test
+from parsegen.server import *
+from parsegen.cache import MemoryCache
+from parsegen.errors import ParsegenError
+import parsegen.cli
+import parsegen.client
+
+GRAMMAR = """
+NUMBER = Tok_NUMBER
+%prefix = yy_
+%%
+main := NUMBER main
+main :=
+%%
+"""
+
+def _run(main, args, *rest):
+	out, err = io.StringIO(), io.StringIO()
+	with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+		status = main(args, *rest)
+	return status, out.getvalue(), err.getvalue()
+
+class TestServer(object):
+	"""Test Server
+	
+	Tests the `server` and `client` submodules, which keep parsegen running
+	between builds.
+	"""
+	
+	def setup(self):
+		self.directory = tempfile.mkdtemp()
+		self.cwd = os.getcwd()
+		os.chdir(self.directory)
+		with open("expr.grammar", "w") as f:
+			f.write(GRAMMAR)
+		
+		self.path = os.path.join(self.directory, "parsegen.sock")
+		self.server = Server(self.path,
+							 MemoryCache(os.path.join(self.directory, "cache")))
+		self.server.bind()
+		self.thread = threading.Thread(target=self.server.serve_forever)
+		self.thread.start()
+	
+	def teardown(self):
+		if self.thread.is_alive():
+			parsegen.client.request({"stop": True}, self.path)
+		self.thread.join()
+		self.server.close()
+		os.chdir(self.cwd)
+		shutil.rmtree(self.directory)
+	
+	def test_generate(self):
+		
+		args = ["-l", "c", "expr.grammar"]
+		status, out, err = _run(parsegen.client.main, args, self.path)
+		assert status == 0
+		assert "yy_node_t" in out
+		assert err == ""
+		assert _run(parsegen.cli.main, args + ["--no-cache"])[1] == out
+		
+		# The analysis is reused while the grammar is unchanged
+		assert len(self.server.grammar_cache.entries) == 1
+		assert _run(parsegen.client.main, args, self.path)[1] == out
+		assert len(self.server.grammar_cache.entries) == 1
+		
+		with open("expr.grammar", "a") as f:
+			f.write("\n")
+		_run(parsegen.client.main, args, self.path)
+		assert len(self.server.grammar_cache.entries) == 2
+	
+	def test_working_directory(self):
+		
+		os.mkdir("sub")
+		os.chdir("sub")
+		status, out, err = _run(parsegen.client.main,
+								["-o", "expr.rb", "-l", "ruby",
+								 "../expr.grammar"], self.path)
+		assert status == 0
+		assert out == ""
+		assert os.path.exists("expr.rb")
+		assert os.getcwd() == os.path.join(self.directory, "sub")
+	
+	def test_errors(self):
+		
+		status, out, err = _run(parsegen.client.main, ["missing.grammar"],
+								self.path)
+		assert status == 2
+		assert "can't open 'missing.grammar'" in err
+		
+		status, out, err = _run(parsegen.client.main, ["serve"], self.path)
+		assert status == 1
+		assert "already serving" in err
+		
+		response = parsegen.client.request({"args": ["--version"]}, self.path)
+		assert response["status"] == 0
+		assert "Parsegen version" in response["stdout"]
+		
+		assert_raises(ParsegenError, Server(self.path).bind)
+	
+	def test_timeout(self):
+		
+		self.server.timeout = 0.2
+		idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		idle.connect(self.path)
+		try:
+			# The quiet client is dropped and the next one is answered
+			response = parsegen.client.request({"ping": True}, self.path)
+			assert response["status"] == 0
+			assert idle.recv(1) == b""
+		finally:
+			idle.close()
+	
+	def test_owner(self):
+		
+		getuid = parsegen.client.os.getuid
+		try:
+			parsegen.client.os.getuid = lambda: getuid() + 1
+			assert_raises(OSError, parsegen.client.request, {"ping": True},
+						  self.path)
+		finally:
+			parsegen.client.os.getuid = getuid
+		response = parsegen.client.request({"ping": True}, self.path)
+		assert response["status"] == 0
+	
+	def test_stop(self):
+		
+		assert main(["--stop", "--socket", self.path]) == 0
+		self.thread.join()
+		self.server.close()
+		assert not os.path.exists(self.path)
+		
+		# Without a server the client runs parsegen itself
+		status, out, err = _run(parsegen.client.main, ["expr.grammar"],
+								self.path)
+		assert not status
+		assert "main" in out
+		
+		# A socket left behind by a server that has gone is replaced
+		open(self.path, "w").close()
+		server = Server(self.path)
+		server.bind()
+		server.close()
+		assert not os.path.exists(self.path)
@@ -0,0 +1,107 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARSEGEN = os.path.join(ROOT, "bin", "parsegen")
+
+# Modules that only the backends need
+BACKEND_MODULES = [
+	"pystache",
+	"concurrent.futures",
+	"concurrent.futures.process",
+	"multiprocessing",
+	"tracemalloc",
+	"parsegen.output.c",
+	"parsegen.output.c_table",
+	"parsegen.output.mustache",
+	"parsegen.output.ruby"
+]
+
+# Startup may take at most this much longer than starting Python itself. The
+# imports that `--version` needs take around 40ms.
+MAX_STARTUP_OVERHEAD = 0.1
+
+def _python(code):
+	env = dict(os.environ, PYTHONPATH=ROOT)
+	return subprocess.check_output([sys.executable, "-c", code], env=env,
+								   universal_newlines=True)
+
+def _version_run():
+	return """
+import sys
+sys.argv = [{0!r}, "--version"]
+try:
+	exec(compile(open({0!r}).read(), {0!r}, "exec"), {{"__name__": "__main__"}})
+except SystemExit:
+	pass
+""".format(PARSEGEN)
+
+class TestStartup(object):
+	"""Test Startup
+	
+	Checks that starting parsegen doesn't load the backends or the template
+	engine before they are needed.
+	"""
+	
+	def test_lazy_modules(self):
+		
+		code = _version_run() + """
+print("\\n".join(sorted(sys.modules)))
+"""
+		loaded = _python(code).split("\n")
+		assert "Parsegen version" in loaded[0]
+		for module in BACKEND_MODULES:
+			assert module not in loaded, module
+	
+	def test_modules_loaded_on_use(self):
+		
+		code = """
+import io, sys
+from parsegen.parse import parse_buffer
+from parsegen.output import write_grammar
+g = parse_buffer("A = a\\n%%\\nmain := A\\n%%\\n")
+write_grammar(g, io.StringIO(), language="pretty-print")
+print("pystache" in sys.modules)
+write_grammar(g, io.StringIO(), language="c")
+print("pystache" in sys.modules, "parsegen.output.ruby" in sys.modules)
+"""
+		assert _python(code).split() == ["False", "True", "False"]
+	
+	def test_startup_time(self):
+		
+		# Runs are interleaved so that both see the same load on the machine
+		times = {_version_run(): [], "pass": []}
+		for _ in range(7):
+			for code, runs in times.items():
+				start = time.perf_counter()
+				_python(code)
+				runs.append(time.perf_counter() - start)
+		
+		overhead = min(times[_version_run()]) - min(times["pass"])
+		assert overhead < MAX_STARTUP_OVERHEAD, overhead
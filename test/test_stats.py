@@ -0,0 +1,125 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+# Module to test
+from parsegen.stats import *
+from parsegen.parse import parse_buffer
+from parsegen.output import write_grammar, write_grammar_files
+import parsegen.stats
+
+GRAMMAR = """
+NUMBER = Tok_NUMBER
+PLUS = Tok_PLUS
+%%
+main := NUMBER main_prime
+main_prime := PLUS NUMBER main_prime
+main_prime :=
+%%
+"""
+
+class TestStats(object):
+	"""Test Stats
+	
+	Tests the `stats` submodule which times each phase of generating a
+	parser.
+	"""
+	
+	def test_collect(self):
+		
+		with collect() as stats:
+			g = parse_buffer(GRAMMAR)
+			write_grammar(g, file=io.StringIO(), language="c")
+		
+		for name in ["parse.scan", "analysis", "analysis.nullable",
+					 "analysis.first", "analysis.follow", "analysis.predict",
+					 "output", "output.state", "output.render"]:
+			assert name in stats.phases
+			assert stats.phases[name] >= 0
+		assert stats.total >= stats.phases["analysis"]
+		assert stats.counters["iterations"] == g.iterations
+		assert stats.counters["unions"] > 0
+		assert stats.peak_memory > 0
+		
+		d = stats.as_dict()
+		assert d["phases"] == stats.phases
+		assert d["counters"] == stats.counters
+		assert d["peak_memory"] == stats.peak_memory
+		
+		summary = stats.summary()
+		assert "analysis.follow" in summary
+		assert "peak memory" in summary
+	
+	def test_inactive(self):
+		
+		assert parsegen.stats._local.current is None
+		parse_buffer(GRAMMAR)
+		count("iterations")
+		
+		with collect(memory=False) as outer:
+			with collect(memory=False) as inner:
+				count("things", 2)
+			count("things")
+		
+		assert inner.counters == {"things": 2}
+		assert outer.counters == {"things": 1}
+		assert outer.peak_memory is None
+		assert parsegen.stats._local.current is None
+	
+	def test_threads(self):
+		
+		directory = tempfile.mkdtemp()
+		try:
+			g = parse_buffer(GRAMMAR)
+			targets = [(language, os.path.join(directory, name))
+					   for language, name in (("c", "g.c"), ("ruby", "g.rb"))]
+			with collect(memory=False) as stats:
+				thread = threading.Thread(target=count, args=("things",))
+				thread.start()
+				thread.join()
+				write_grammar_files(g, targets)
+		finally:
+			shutil.rmtree(directory)
+		
+		# Only the calling thread reports, timing the pool as one phase
+		assert "things" not in stats.counters
+		assert "output" in stats.phases
+		assert "output.render" not in stats.phases
+		assert stats.phases["output"] <= stats.total
+	
+	def test_repeated_phase(self):
+		
+		stats = Stats()
+		with stats.phase("a"):
+			pass
+		first = stats.phases["a"]
+		with stats.phase("a"):
+			sum(range(1000))
+		assert stats.phases["a"] > first
+		assert list(stats.phases) == ["a"]
@@ -0,0 +1,125 @@
+# This file is part of Parsegen and is licensed as follows:
+#
+# Copyright (c) 2012 Will Speak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Test helpers
+from nose.tools import *
+
+# Module to test
+from parsegen.parse import parse_buffer
+from parsegen.table import *
+
+class TestParseTable(object):
+	"""Test Parse Table
+	
+	Tests the `table` submodule. This builds the LL(1) parse table for a
+	grammar and compresses it.
+	"""
+	
+	def setup(self):
+		self.grammar = parse_buffer("""
+		NUMBER
+		PLUS
+		MINUS
+		%%
+		expression := literal expression_prime
+		expression_prime := PLUS literal expression_prime
+		expression_prime := MINUS literal expression_prime
+		expression_prime :=
+		literal := PLUS literal
+		literal := MINUS literal
+		literal := NUMBER
+		other := PLUS literal
+		other := MINUS literal
+		other := NUMBER
+		%%
+		""")
+	
+	def test_rows(self):
+		
+		t = ParseTable(self.grammar)
+		assert len(t.nonterminals) == 4
+		assert len(t.productions) == 10
+		assert t.terminals == ['NUMBER', 'PLUS', 'MINUS', '$']
+		
+		dense = t.dense()
+		assert dense[0] == [0, 0, 0, -1]
+		assert dense[1] == [-1, 1, 2, 3]
+		assert dense[2] == [6, 4, 5, -1]
+	
+	def test_compressed(self):
+		
+		t = ParseTable(self.grammar)
+		c = t.compressed
+		
+		# literal and other have identical rows
+		assert len(c.base) == 3
+		assert c.row_map == [0, 1, 2, 2]
+		assert t.production_base == [0, 1, 4, 7]
+		assert len(c.entry) == len(c.check)
+		assert len(c.entry) < t.stats.dense_entries
+		
+		dense = t.dense()
+		for nonterm, row in enumerate(dense):
+			for column, production in enumerate(row):
+				assert t.lookup(nonterm, column) == production
+	
+	def test_merge_rows(self):
+		
+		g = parse_buffer("""
+		A
+		B
+		%%
+		main := first second
+		first := A
+		first := B
+		second := A
+		second := B
+		%%
+		""")
+		t = ParseTable(g)
+		c = t.compressed
+		
+		# first and second choose their expansions on the same terminals
+		assert len(c.base) == 2
+		assert t.stats.unique_rows == 2
+		assert t.lookup(1, 1) == 2
+		assert t.lookup(2, 0) == 3
+		
+		g = parse_buffer("""
+		A
+		%%
+		main := first second
+		first :=
+		second :=
+		%%
+		""")
+		t = ParseTable(g)
+		assert t.rows[1] == t.rows[2] == ((1, 0),)
+		assert t.compressed.row_map[1] == t.compressed.row_map[2]
+	
+	def test_int_type(self):
+		
+		assert int_type([]) == "int8_t"
+		assert int_type([-1, 127]) == "int8_t"
+		assert int_type([-1, 128]) == "int16_t"
+		assert int_type([70000]) == "int32_t"
+		assert int_size([-1, 128]) == 2
@@ -81,3 +81,28 @@ class TestStruct(object):
 		assert "foo" in n
 		assert "bar" in n
 		assert not "baz" in n
+
+class TestLazyprop(object):
+	"""Test Lazyprop
+	
+	Tests the lazy property decorator.
+	"""
+	
+	def test_cached(self):
+		
+		class Counter(object):
+			calls = 0
+			
+			@lazyprop
+			def value(self):
+				"""The value"""
+				Counter.calls += 1
+				return [Counter.calls]
+		
+		c = Counter()
+		assert c.value == [1]
+		assert c.value is c.value
+		assert Counter.calls == 1
+		assert c.__dict__ == {'value': [1]}
+		assert Counter().value == [2]
+		assert Counter.value.__doc__ == "The value"